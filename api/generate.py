@@ -2,145 +2,98 @@ from http.server import BaseHTTPRequestHandler
 import json
 import os
 import tempfile
-import csv
 from datetime import datetime
-from collections import defaultdict
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import parse_qs
 import cgi
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 import re
+import sys
 import requests
+import numpy as np
 
-def normalize_url(url: str) -> str:
-    """Normalize URL for deduplication."""
-    try:
-        parsed = urlparse(url)
-        clean = parsed._replace(query='', fragment='').geturl()
-        if clean.endswith('/') and clean != parsed.scheme + '://' + parsed.netloc + '/':
-            clean = clean[:-1]
-        return clean.lower()
-    except Exception:
-        return url.lower().rstrip('/')
+# Shared pipeline modules live next to the CLI in test/pyscripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test', 'pyscripts'))
+
+from sitemap_ingest import (DEFAULT_CHUNK_SIZE, empty_table, format_diagnostics, load_csv_table, new_diagnostics,
+                            table_len, table_to_records)
+from sitemap_join import format_join_stats, joined_records, merge_tables
+from sitemap_rules import compile_rules
+from sitemap_score import breakdown_range, calculate_priority_batch, compile_model, load_model, with_rule
+from sitemap_select import bucket_order, group_bounds, quantize
+from sitemap_urls import UrlDictionary, UrlText
+
+# The shared scoring model (test/pyscripts/scoring_model.json), except that
+# the API gives no homepage boost to /index.php
+SCORING_MODEL = compile_model(with_rule(load_model(), 'homepage', suffixes=['/', '/index.html']))
+
+# The CLI's cluster rules (test/pyscripts/cluster_rules.json): a URL goes to the
+# first cluster whose rules match its path, else to misc
+CLUSTER_RULES = compile_rules()
+CLUSTER_NAMES = CLUSTER_RULES.names
+
+# Competitor sitemap URLs go to the first category whose rules match their path, else to other
+URL_CATEGORY_RULES = compile_rules({
+    'rules': [
+        {'name': 'homepage', 'paths': ['/index.html', '/index.php'], 'regex': ['^/?$']},
+        {'name': 'product_pages', 'paths': ['/product/', '/item/', '/buy/', '/purchase/']},
+        {'name': 'category_pages', 'paths': ['/category/', '/catalog/', '/collection/']},
+        {'name': 'blog_content', 'paths': ['/blog/', '/news/', '/article/', '/post/']},
+        {'name': 'support_help', 'paths': ['/support/', '/help/', '/faq/', '/guide/']},
+        {'name': 'landing_pages', 'paths': ['/landing/', '/campaign/', '/promo/']},
+        {'name': 'tools_utilities', 'paths': ['/tool/', '/calculator/', '/checker/', '/generator/']},
+    ],
+    'default': 'other',
+})
+URL_CATEGORIES = URL_CATEGORY_RULES.names
 
-def load_csv_data(file_path: str, expected_columns: list) -> list:
-    """Load data from CSV file."""
-    data = []
+def read_csv_table(file_path: str, expected_columns: list, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   workers: int = 1, diagnostics: dict = None) -> dict:
+    """Load a CSV file as a table. Skipped and unparseable rows are counted in diagnostics, not printed."""
+    table = empty_table(expected_columns)
+    if diagnostics is None:
+        diagnostics = {}
+    diagnostics.update(new_diagnostics())
     try:
         print(f"Loading CSV from: {file_path}")
-        with open(file_path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            print(f"CSV headers: {reader.fieldnames}")
-            
-            for row_num, row in enumerate(reader):
-                # Try different possible URL column names
-                url = row.get('url') or row.get('URL') or row.get('page') or row.get('Page') or row.get('link') or row.get('Link')
-                if not url:
-                    print(f"Row {row_num + 1}: No URL found in columns {list(row.keys())}")
-                    continue
-                
-                entry = {'url': url.strip()}
-                for col in expected_columns:
-                    if col in row:
-                        try:
-                            entry[col] = float(row[col])
-                        except (ValueError, TypeError):
-                            entry[col] = 0.0
-                    else:
-                        entry[col] = 0.0
-                data.append(entry)
-                
-                if row_num < 5:  # Print first 5 rows for debugging
-                    print(f"Row {row_num + 1}: {entry}")
-                    
+        # url/page/link headers in any case are resolved once per file (sitemap_ingest.COLUMN_ALIASES)
+        table = load_csv_table(file_path, expected_columns, chunk_size, workers=workers, diagnostics=diagnostics)
+        print(f"Loaded {table_len(table)} rows: {format_diagnostics(diagnostics)}")
+
     except Exception as e:
         print(f"Error loading CSV data: {e}")
         import traceback
         traceback.print_exc()
-    return data
+    return table
+
+def load_csv_data(file_path: str, expected_columns: list, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  workers: int = 1, diagnostics: dict = None) -> list:
+    """Load data from CSV file as a list of dicts (see read_csv_table)."""
+    return table_to_records(read_csv_table(file_path, expected_columns, chunk_size, workers, diagnostics))
+
+def upload_suffix(field) -> str:
+    """File extension to store an upload under; defaults to .csv."""
+    suffix = os.path.splitext(getattr(field, 'filename', None) or '')[1].lower()
+    return suffix if suffix in ('.csv', '.tsv', '.xlsx', '.xlsm', '.xls') else '.csv'
 
 def calculate_priority(url_entry: dict) -> float:
-    """Calculate priority score for a URL."""
-    priority = 0.0
-    
-    # GSC Performance Score (40% weight)
-    gsc_score = 0.0
-    clicks = url_entry.get('clicks', 0)
-    impressions = url_entry.get('impressions', 0)
-    ctr = url_entry.get('ctr', 0)
-    position = url_entry.get('position', 0)
-    
-    if impressions > 0:
-        click_rate = clicks / impressions
-        gsc_score += click_rate * 0.3
-    
-    gsc_score += min(ctr, 1.0) * 0.3
-    
-    if position > 0:
-        position_score = max(0, 1 - (position / 100))
-        gsc_score += position_score * 0.4
-    
-    # Page Explorer Score (40% weight)
-    pe_score = 0.0
-    importance = url_entry.get('importance', 0)
-    depth = url_entry.get('depth', 0)
-    internal_links = url_entry.get('internal_links', 0)
-    health = url_entry.get('health', 0)
-    
-    pe_score += min(importance / 100, 1.0) * 0.4
-    
-    if depth > 0:
-        depth_score = max(0, 1 - (depth / 10))
-        pe_score += depth_score * 0.2
-    
-    if internal_links > 0:
-        links_score = min(internal_links / 100, 1.0)
-        pe_score += links_score * 0.2
-    
-    pe_score += min(health / 100, 1.0) * 0.2
-    
-    # Business Logic Score (20% weight)
-    business_score = 0.0
-    url = url_entry.get('url', '').lower()
-    
-    if url.endswith('/') or url.endswith('/index.html'):
-        business_score += 0.5
-    
-    if '/tld/' in url or '/domains/' in url:
-        business_score += 0.3
-    
-    if '/blog/' in url:
-        business_score += 0.2
-    
-    if '/support/' in url:
-        business_score += 0.1
-    
-    if any(tool in url for tool in ['/whois', '/ssl-check', '/dns-check']):
-        business_score += 0.2
-    
-    business_score = min(business_score, 1.0)
-    
-    # Calculate final weighted priority
-    priority = (gsc_score * 0.4) + (pe_score * 0.4) + (business_score * 0.2)
-    
-    return max(0.1, min(1.0, priority))
+    """Calculate priority score for a URL (see SCORING_MODEL)."""
+    return SCORING_MODEL.score(url_entry)
 
 def assign_cluster(url: str) -> str:
-    """Assign a URL to a cluster."""
-    url_lower = url.lower()
-    
-    if '/blog/' in url_lower:
-        return 'blog'
-    elif '/support/' in url_lower or '/help/' in url_lower:
-        return 'support'
-    elif '/tld/' in url_lower or '/domains/' in url_lower:
-        return 'tlds'
-    elif any(tool in url_lower for tool in ['/whois', '/ssl-check', '/dns-check']):
-        return 'tools'
-    elif any(pattern in url_lower for pattern in ['/domain-', '/broker', '/marketplace']):
-        return 'seo'
-    else:
-        return 'misc'
+    """Assign a URL to a cluster (see CLUSTER_RULES)."""
+    return CLUSTER_RULES.assign(url)
+
+def cluster_codes(text: UrlText) -> np.ndarray:
+    """assign_cluster for a column of URLs, as int8 indexes into CLUSTER_NAMES."""
+    return CLUSTER_RULES.codes(text)
+
+def assign_clusters(text: UrlText) -> list:
+    """assign_cluster for a column of URLs."""
+    return [CLUSTER_NAMES[code] for code in cluster_codes(text).tolist()]
+
+# Priorities are written with this many decimals, and URLs ordered by the written value
+PRIORITY_DECIMALS = 4
 
 def create_sitemap_xml(urls: list, sitemap_name: str) -> str:
     """Create XML sitemap from URL list."""
@@ -171,7 +124,7 @@ def create_sitemap_xml(urls: list, sitemap_name: str) -> str:
         
         # Priority
         priority_elem = ET.SubElement(url_elem, 'priority')
-        priority_elem.text = f"{url_data['priority']:.4f}"
+        priority_elem.text = f"{url_data['priority']:.{PRIORITY_DECIMALS}f}"
     
     # Pretty print XML
     rough_string = ET.tostring(root, 'unicode')
@@ -276,25 +229,9 @@ def analyze_url_categories(urls: list) -> dict:
         'other': []
     }
     
-    for url_data in urls:
-        url = url_data['url'].lower()
-        
-        if url.endswith('/') or url.endswith('/index.html') or url.endswith('/index.php'):
-            categories['homepage'].append(url_data)
-        elif any(pattern in url for pattern in ['/product/', '/item/', '/buy/', '/purchase/']):
-            categories['product_pages'].append(url_data)
-        elif any(pattern in url for pattern in ['/category/', '/catalog/', '/collection/']):
-            categories['category_pages'].append(url_data)
-        elif any(pattern in url for pattern in ['/blog/', '/news/', '/article/', '/post/']):
-            categories['blog_content'].append(url_data)
-        elif any(pattern in url for pattern in ['/support/', '/help/', '/faq/', '/guide/']):
-            categories['support_help'].append(url_data)
-        elif any(pattern in url for pattern in ['/landing/', '/campaign/', '/promo/']):
-            categories['landing_pages'].append(url_data)
-        elif any(pattern in url for pattern in ['/tool/', '/calculator/', '/checker/', '/generator/']):
-            categories['tools_utilities'].append(url_data)
-        else:
-            categories['other'].append(url_data)
+    codes = URL_CATEGORY_RULES.codes(UrlText([url_data['url'] for url_data in urls]))
+    for url_data, code in zip(urls, codes.tolist()):
+        categories[URL_CATEGORIES[code]].append(url_data)
     
     # Remove empty categories
     return {k: v for k, v in categories.items() if v}
@@ -415,13 +352,16 @@ class handler(BaseHTTPRequestHandler):
             gsc_file = form['gsc_data']
             pe_file = form['pe_data']
             competitor_url = form.get('competitor_url') if 'competitor_url' in form else None
+            # Optional URL range [breakdown_start, breakdown_stop) to explain with component scores
+            breakdown_start = form.getfirst('breakdown_start')
+            breakdown_stop = form.getfirst('breakdown_stop')
             
-            # Save uploaded files temporarily
-            with tempfile.NamedTemporaryFile(mode='w+b', suffix='.csv', delete=False) as gsc_temp:
+            # Save uploaded files temporarily, keeping the extension so .xlsx/.xls uploads are read as workbooks
+            with tempfile.NamedTemporaryFile(mode='w+b', suffix=upload_suffix(gsc_file), delete=False) as gsc_temp:
                 gsc_temp.write(gsc_file.file.read())
                 gsc_path = gsc_temp.name
             
-            with tempfile.NamedTemporaryFile(mode='w+b', suffix='.csv', delete=False) as pe_temp:
+            with tempfile.NamedTemporaryFile(mode='w+b', suffix=upload_suffix(pe_file), delete=False) as pe_temp:
                 pe_temp.write(pe_file.file.read())
                 pe_path = pe_temp.name
             
@@ -438,39 +378,48 @@ class handler(BaseHTTPRequestHandler):
             
             try:
                 # Load data
-                gsc_data = load_csv_data(gsc_path, ['clicks', 'impressions', 'ctr', 'position'])
-                pe_data = load_csv_data(pe_path, ['importance', 'depth', 'internal_links', 'health'])
+                diagnostics = {'gsc': {}, 'pe': {}}
+                gsc_table = read_csv_table(gsc_path, ['clicks', 'impressions', 'ctr', 'position'],
+                                           diagnostics=diagnostics['gsc'])
+                pe_table = read_csv_table(pe_path, ['importance', 'depth', 'internal_links', 'health'],
+                                          diagnostics=diagnostics['pe'])
                 
-                print(f"Loaded GSC data: {len(gsc_data)} URLs")
-                print(f"Loaded Page Explorer data: {len(pe_data)} URLs")
+                print(f"Loaded GSC data: {table_len(gsc_table)} URLs")
+                print(f"Loaded Page Explorer data: {table_len(pe_table)} URLs")
                 
-                # Merge and deduplicate
-                merged = defaultdict(dict)
-                for entry in gsc_data:
-                    norm = normalize_url(entry['url'])
-                    merged[norm].update(entry)
-                for entry in pe_data:
-                    norm = normalize_url(entry['url'])
-                    merged[norm].update(entry)
+                # Merge and deduplicate: outer join on the normalized URL, last row winning per side
+                urls = UrlDictionary()
+                overlap = {}
+                merged = merge_tables(gsc_table, pe_table, urls, aggregate_gsc=False, stats=overlap)
                 
-                print(f"Merged data: {len(merged)} unique URLs")
+                print(f"Merged data: {table_len(merged)} unique URLs ({format_join_stats(overlap)})")
                 
-                result = []
-                for norm_url, data in merged.items():
-                    data['url'] = norm_url
-                    data['priority'] = calculate_priority(data)
-                    data['cluster'] = assign_cluster(norm_url)
-                    result.append(data)
+                result = joined_records(merged, urls, list(gsc_table), list(pe_table))
+                # Scored and clustered as columns over one lowercased copy of the URLs;
+                # same values as calculate_priority and assign_cluster on each record
+                text = UrlText([data['url'] for data in result])
+                components = {}
+                priority = calculate_priority_batch(merged, text, SCORING_MODEL, components)
+                score_breakdown = None
+                if breakdown_start is not None or breakdown_stop is not None:
+                    score_breakdown = breakdown_range(text.urls, priority, components, breakdown_start, breakdown_stop)
+                codes = cluster_codes(text)
+                for data, value, code in zip(result, priority.tolist(), codes.tolist()):
+                    data['priority'] = value
+                    data['cluster'] = CLUSTER_NAMES[code]
                 
                 print(f"Processed result: {len(result)} URLs")
                 
-                # Sort by priority (highest first)
-                result.sort(key=lambda x: x['priority'], reverse=True)
-                
-                # Group by cluster
-                clusters = defaultdict(list)
-                for item in result:
-                    clusters[item['cluster']].append(item)
+                # Bucket sorts of the written priority (highest first, ties in upload order)
+                # order the result and every cluster; clusters in order of their top URL
+                order = bucket_order(priority, PRIORITY_DECIMALS)
+                rows = bucket_order(priority, PRIORITY_DECIMALS, codes)
+                bounds = group_bounds(codes[rows])
+                tops = rows[bounds[:-1][np.diff(bounds) > 0]]
+                clusters = {}
+                for code in codes[tops[np.lexsort((tops, -quantize(priority[tops], PRIORITY_DECIMALS)))]].tolist():
+                    clusters[CLUSTER_NAMES[code]] = [result[i] for i in rows[bounds[code]:bounds[code + 1]].tolist()]
+                result = [result[i] for i in order.tolist()]
                 
                 print(f"Clusters created: {list(clusters.keys())}")
                 
@@ -512,16 +461,19 @@ class handler(BaseHTTPRequestHandler):
                 
                 response_data = {
                     "message": "Sitemaps generated successfully",
-                    "gsc_urls": len(gsc_data),
-                    "pe_urls": len(pe_data),
+                    "gsc_urls": table_len(gsc_table),
+                    "pe_urls": table_len(pe_table),
                     "merged_urls": len(result),
+                    "url_overlap": overlap,  # URLs in both inputs, GSC only and Page Explorer only
                     "timestamp": datetime.now().isoformat(),
                     "cluster_stats": cluster_stats,
                     "sitemaps_created": list(sitemaps.keys()),
                     "sample_data": result[:10] if result else [],  # Keep sample for UI display
                     "full_data": result,  # Include full data
                     "sitemap_content": sitemaps,  # Include XML content
-                    "competitor_analysis": competitor_analysis  # Include competitor analysis
+                    "competitor_analysis": competitor_analysis,  # Include competitor analysis
+                    "score_breakdown": score_breakdown,  # Component scores of the requested URL range
+                    "ingestion_diagnostics": diagnostics  # Skipped/unparseable row counts and samples
                 }
                 
                 print(f"Response data prepared: {len(response_data.get('full_data', []))} URLs")
@@ -7,7 +7,32 @@ Generates an AI-optimized sitemap from urllist.txt with proper priorities and ch
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 from datetime import datetime
+import os
 import re
+import sys
+
+# The shared URL pattern matcher lives in test/pyscripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test', 'pyscripts'))
+
+from sitemap_urls import PatternMatcher
+
+# Substrings tested by determine_priority_and_frequency, all found in one scan of the URL
+URL_RULES = {
+    'ai': ['/ai'],
+    'blog': ['/blog/'],
+    'support_article': ['/support/v2/articles/'],
+    'key_support_article': ['/domain-manager/', '/email/'],
+    'tools': ['/whois', '/free-logo-maker', '/domain_tools.php', '/api-reference'],
+    'account': ['/sign-up', '/login', '/loyalty-program'],
+    'payment': ['/payment-options/'],
+    'custom_domain': ['/CustomDomain/'],
+    'reseller': ['/reseller/'],
+    'rss': ['auction_rss.php'],
+    'legal': ['/terms.php', '/Support/Privacy-Policy', '/terms-and-conditions'],
+    'about': ['/about-us', '/about/about-namesilo'],
+}
+URL_MATCHER = PatternMatcher([p for patterns in URL_RULES.values() for p in patterns])
+URL_MASKS = URL_MATCHER.masks(URL_RULES)
 
 def determine_priority_and_frequency(url):
     """Determine priority and change frequency based on URL patterns."""
@@ -27,51 +52,53 @@ def determine_priority_and_frequency(url):
     ]:
         return 0.9, 'daily'
     
+    found = URL_MATCHER.match(url)
+    
     # AI-specific pages
-    if '/ai' in url:
+    if found & URL_MASKS['ai']:
         return 0.9, 'weekly'
     
     # Blog content - high priority for semantic search
-    if '/blog/' in url:
+    if found & URL_MASKS['blog']:
         return 0.8, 'monthly'
     
     # Support articles
-    if '/support/v2/articles/' in url:
-        if '/domain-manager/' in url or '/email/' in url:
+    if found & URL_MASKS['support_article']:
+        if found & URL_MASKS['key_support_article']:
             return 0.7, 'monthly'
         else:
             return 0.6, 'monthly'
     
     # Tools and services
-    if any(x in url for x in ['/whois', '/free-logo-maker', '/domain_tools.php', '/api-reference']):
+    if found & URL_MASKS['tools']:
         return 0.7, 'weekly'
     
     # Account and user pages
-    if any(x in url for x in ['/sign-up', '/login', '/loyalty-program']):
+    if found & URL_MASKS['account']:
         return 0.7, 'monthly'
     
     # Payment options
-    if '/payment-options/' in url:
+    if found & URL_MASKS['payment']:
         return 0.6, 'monthly'
     
     # Custom domain integrations
-    if '/CustomDomain/' in url:
+    if found & URL_MASKS['custom_domain']:
         return 0.6, 'monthly'
     
     # Reseller pages
-    if '/reseller/' in url:
+    if found & URL_MASKS['reseller']:
         return 0.8, 'weekly'
     
     # RSS and dynamic content
-    if 'auction_rss.php' in url:
+    if found & URL_MASKS['rss']:
         return 0.8, 'hourly'
     
     # Legal and policy pages
-    if any(x in url for x in ['/terms.php', '/Support/Privacy-Policy', '/terms-and-conditions']):
+    if found & URL_MASKS['legal']:
         return 0.5, 'yearly'
     
     # About and company information
-    if any(x in url for x in ['/about-us', '/about/about-namesilo']):
+    if found & URL_MASKS['about']:
         return 0.6, 'monthly'
     
     # Default for other pages
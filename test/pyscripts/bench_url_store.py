@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark memory and lookup latency of the URL stores in sitemap_urls.
+
+Compares a list of Python str objects, UrlDictionary and FrontCodedUrls over
+a synthetic namesilo.com URL set:
+
+    python bench_url_store.py --urls 10000000
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from sitemap_urls import FRONT_CODING_BLOCK, UrlDictionary
+
+SECTIONS = ['support/v2/articles', 'blog/en', 'blog/es', 'tld', 'domain-search', 'marketplace/listing', 'whois']
+WORDS = ['domain', 'transfer', 'dns', 'ssl', 'privacy', 'renewal', 'email', 'hosting', 'registrar', 'setup']
+
+def synthetic_urls(n: int, seed: int = 1):
+    """n distinct URLs shaped like the site's: shared host, few sections, slug paths."""
+    rng = random.Random(seed)
+    for i in range(n):
+        slug = '-'.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5)))
+        yield f"https://www.namesilo.com/{rng.choice(SECTIONS)}/{slug}-{i}"
+
+def traced(build, *args):
+    """Result of build(*args) and the bytes it left allocated (tracing slows the build)."""
+    tracemalloc.start()
+    result = build(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def timed(build, *args):
+    start = time.perf_counter()
+    result = build(*args)
+    return result, time.perf_counter() - start
+
+def per_call(fn, args):
+    start = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+def main(n: int, queries: int, block_size: int):
+    print(f"{n} URLs, {queries} queries, block size {block_size}")
+    strings, list_bytes = traced(lambda: list(synthetic_urls(n)))
+    print(f"  list of str:     {list_bytes / n:7.1f} B/URL")
+    raw_bytes = sum(len(url) for url in strings)
+    print(f"  raw UTF-8:       {raw_bytes / n:7.1f} B/URL")
+
+    column = np.array(strings, dtype=object)
+    _, dict_bytes = traced(UrlDictionary, column)
+    urls, seconds = timed(UrlDictionary, column)
+    del column
+    print(f"  UrlDictionary:   {dict_bytes / n:7.1f} B/URL ({urls.nbytes / n:.1f} arena), built in {seconds:.2f}s")
+
+    (store, rank), seconds = timed(urls.front_coded, block_size)
+    print(f"  FrontCodedUrls:  {store.nbytes / n:7.1f} B/URL (+{rank.nbytes / n:.0f} for the id remap), "
+          f"built in {seconds:.2f}s")
+
+    rng = random.Random(2)
+    probe = [strings[rng.randrange(n)] for _ in range(queries)]
+    positions = [rng.randrange(n) for _ in range(queries)]
+    ids = [rng.randrange(n) for _ in range(queries)]
+    print("  lookup latency (us/call)")
+    print(f"    UrlDictionary.get:      {per_call(urls.get, probe):6.2f}")
+    print(f"    UrlDictionary[id]:      {per_call(urls.__getitem__, ids):6.2f}")
+    print(f"    FrontCodedUrls.get:     {per_call(store.get, probe):6.2f}")
+    print(f"    FrontCodedUrls[pos]:    {per_call(store.__getitem__, positions):6.2f}")
+    start = time.perf_counter()
+    store.lookup(np.array(positions))
+    print(f"    FrontCodedUrls.lookup:  {(time.perf_counter() - start) / queries * 1e6:6.2f} (batch)")
+    start = time.perf_counter()
+    for _ in store:
+        pass
+    print(f"    FrontCodedUrls scan:    {(time.perf_counter() - start) / n * 1e6:6.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--urls', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=100_000)
+    parser.add_argument('--block-size', type=int, default=FRONT_CODING_BLOCK)
+    args = parser.parse_args()
+    if args.urls < 1 or args.queries < 1:
+        sys.exit("--urls and --queries must be positive")
+    main(args.urls, args.queries, args.block_size)
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 import xml.etree.ElementTree as ET
-import re
 import csv
 from collections import defaultdict
 
+from sitemap_rules import compile_rules
+
 def extract_urls_from_sitemap(source_file):
     urls = []
     
@@ -34,21 +35,13 @@ def extract_urls_from_sitemap(source_file):
     
     return urls
 
+# Clusters as in the CLI (cluster_rules.json), each sitemap with a fixed priority
+CLUSTER_RULES = compile_rules()
+CLUSTER_PRIORITIES = {'blog': 0.8, 'support': 0.6, 'tlds': 0.9, 'tools': 0.7, 'seo': 1.0, 'misc': 0.5}
+
 def categorize_url(url):
-    path = url.replace('https://www.namesilo.com', '')
-    
-    if '/blog/' in path:
-        return 'blog-sitemap.xml', 0.8
-    elif '/support/' in path:
-        return 'support-sitemap.xml', 0.6
-    elif '/domain-' in path or '/broker' in path or '/marketplace' in path:
-        return 'seo-sitemap.xml', 1.0
-    elif re.match(r'^/domains/[^/]+$', path):
-        return 'tlds-sitemap.xml', 0.9
-    elif '/whois' in path or '/ssl-check' in path or '/dns-check' in path:
-        return 'tools-sitemap.xml', 0.7
-    else:
-        return 'misc-sitemap.xml', 0.5
+    cluster = CLUSTER_RULES.assign(url)
+    return f'{cluster}-sitemap.xml', CLUSTER_PRIORITIES[cluster]
 
 def create_sitemap_xml(cluster_name, urls):
     urlset = ET.Element('urlset')
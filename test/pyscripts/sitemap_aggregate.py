@@ -0,0 +1,191 @@
+"""
+Sitemap Aggregation
+-------------------
+Streaming group-by over GSC rows, for exports that list the same page once
+per day.
+
+Per page, over the selected date window:
+- clicks and impressions are summed
+- ctr is recomputed as clicks / impressions (0.0 without impressions)
+- position is the impression-weighted mean, or the plain mean of the daily
+  positions for pages that never had an impression
+- any other metric column keeps its last value
+
+Rows arrive in chunks. URLs are mapped to dense ids with one dict lookup
+each, and every metric is accumulated with np.bincount, so memory is bounded
+by the number of distinct pages rather than the number of rows. Tables whose
+URLs are already interned (see sitemap_urls.UrlDictionary) are grouped by
+id with aggregate_gsc_groups, without touching the strings.
+"""
+
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+
+SUMMED_COLUMNS = ('clicks', 'impressions')
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    """Return array with room for at least size entries (doubling)."""
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array), 1024), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def date_mask(dates: np.ndarray, start_date: str = None, end_date: str = None) -> np.ndarray:
+    """Rows whose ISO date (YYYY-MM-DD) falls inside [start_date, end_date]."""
+    mask = np.ones(len(dates), dtype=bool)
+    if start_date is None and end_date is None:
+        return mask
+    days = dates.astype('U10')
+    if start_date is not None:
+        mask &= days >= start_date
+    if end_date is not None:
+        mask &= days <= end_date
+    return mask
+
+def aggregate_gsc_chunks(chunks: Iterable[Dict[str, np.ndarray]], columns: Sequence[str],
+                         start_date: str = None, end_date: str = None) -> Dict[str, np.ndarray]:
+    """
+    Aggregate a stream of GSC tables to one row per URL.
+
+    Chunks must carry a 'date' column when a date window is given. Output rows
+    are in order of each URL's first appearance.
+    """
+    index = {}
+    urls = []
+    acc = {col: np.zeros(0) for col in columns}
+    weighted_pos = np.zeros(0)
+    pos_rows = np.zeros(0)
+
+    def lookup(url):
+        i = index.get(url)
+        if i is None:
+            i = index[url] = len(urls)
+            urls.append(url)
+        return i
+
+    for chunk in chunks:
+        if start_date is not None or end_date is not None:
+            if 'date' not in chunk:
+                raise ValueError("A date window needs a 'date' column in the GSC input")
+            mask = date_mask(chunk['date'], start_date, end_date)
+            chunk = {name: values[mask] for name, values in chunk.items()}
+        n = len(chunk['url'])
+        if not n:
+            continue
+        ids = np.fromiter((lookup(url) for url in chunk['url'].tolist()), dtype=np.intp, count=n)
+        size = len(urls)
+        for col in columns:
+            acc[col] = _grow(acc[col], size)
+        weighted_pos = _grow(weighted_pos, size)
+        pos_rows = _grow(pos_rows, size)
+
+        impressions = chunk.get('impressions')
+        for col in columns:
+            values = chunk[col]
+            if col in SUMMED_COLUMNS or col == 'position':
+                acc[col][:size] += np.bincount(ids, weights=values, minlength=size)
+            elif col != 'ctr':
+                last_ids, last_rows = np.unique(ids[::-1], return_index=True)
+                acc[col][last_ids] = values[::-1][last_rows]
+        if 'position' in columns:
+            if impressions is not None:
+                weighted_pos[:size] += np.bincount(ids, weights=chunk['position'] * impressions, minlength=size)
+            pos_rows[:size] += np.bincount(ids, minlength=size)
+
+    size = len(urls)
+    return _finish({'url': np.array(urls, dtype=object)}, acc, weighted_pos[:size], pos_rows[:size], columns)
+
+def _finish(table: Dict[str, np.ndarray], acc: Dict[str, np.ndarray], weighted_pos: np.ndarray,
+            pos_rows: np.ndarray, columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Turn per-group accumulators into the aggregated metric columns."""
+    size = len(table['url'])
+    for col in columns:
+        table[col] = acc[col][:size].copy()
+    impressions = table['impressions'] if 'impressions' in table else np.zeros(size)
+    has_impr = impressions > 0
+    if 'ctr' in columns:
+        clicks = table['clicks'] if 'clicks' in table else np.zeros(size)
+        table['ctr'] = np.divide(clicks, impressions, out=np.zeros(size), where=has_impr)
+    if 'position' in columns:
+        mean_pos = table['position'] / np.maximum(pos_rows, 1.0)
+        weighted = np.divide(weighted_pos, impressions, out=np.zeros(size), where=has_impr)
+        table['position'] = np.where(has_impr, weighted, mean_pos)
+    return table
+
+def aggregate_gsc_groups(groups: np.ndarray, size: int, table: Dict[str, np.ndarray],
+                         columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    Aggregate table rows by group number (0 <= groups < size); output row i is
+    group i, and its 'url' column holds i. Metrics without a summing rule
+    keep the value of the group's last row.
+    """
+    acc = {}
+    last = None
+    for col in columns:
+        values = table[col]
+        if col in SUMMED_COLUMNS or col == 'position':
+            acc[col] = np.bincount(groups, weights=values, minlength=size)
+        elif col != 'ctr':
+            if last is None:
+                last = np.zeros(size, dtype=np.int64)
+                np.maximum.at(last, groups, np.arange(len(groups)))
+            acc[col] = values[last].astype(np.float64)
+        else:
+            acc[col] = np.zeros(size)
+    weighted_pos = np.zeros(size)
+    pos_rows = np.zeros(size)
+    if 'position' in columns:
+        if 'impressions' in table:
+            weighted_pos = np.bincount(groups, weights=table['position'] * table['impressions'], minlength=size)
+        pos_rows = np.bincount(groups, minlength=size).astype(np.float64)
+    return _finish({'url': np.arange(size)}, acc, weighted_pos, pos_rows, columns)
+
+def aggregate_gsc_table(table: Dict[str, np.ndarray], columns: Sequence[str],
+                        start_date: str = None, end_date: str = None) -> Dict[str, np.ndarray]:
+    """Aggregate a single GSC table to one row per URL."""
+    return aggregate_gsc_chunks([table], columns, start_date, end_date)
+
+def combine_gsc_values(rows: Sequence[Sequence[float]], columns: Sequence[str]) -> List[float]:
+    """
+    Aggregate the metric values of several rows for one page (each row lists
+    the columns in order), with the same rules and float results as
+    aggregate_gsc_groups, without NumPy.
+    """
+    combined = list(rows[-1])
+    sums = {col: 0.0 for col in columns}
+    weighted = 0.0
+    has_impressions = 'impressions' in columns
+    for row in rows:
+        values = dict(zip(columns, row))
+        for col in SUMMED_COLUMNS + ('position',):
+            if col in values:
+                sums[col] += values[col]
+        if has_impressions and 'position' in values:
+            weighted += values['position'] * values['impressions']
+    impressions = sums['impressions'] if has_impressions else 0.0
+    for i, col in enumerate(columns):
+        if col in SUMMED_COLUMNS:
+            combined[i] = sums[col]
+        elif col == 'ctr':
+            combined[i] = sums.get('clicks', 0.0) / impressions if impressions > 0 else 0.0
+        elif col == 'position':
+            combined[i] = weighted / impressions if impressions > 0 else sums['position'] / len(rows)
+    return combined
+
+def combine_gsc_records(entries: List[Dict[str, Any]], columns: Sequence[str]) -> Dict[str, Any]:
+    """
+    Combine several GSC records for one page into one, with the same rules as
+    the table aggregator. Keys other than the metrics come from the last record.
+    """
+    combined = {}
+    for entry in entries:
+        combined.update(entry)
+    table = {'url': np.array([''] * len(entries), dtype=object)}
+    for col in columns:
+        table[col] = np.array([float(entry.get(col, 0.0)) for entry in entries])
+    aggregated = aggregate_gsc_table(table, columns)
+    for col in columns:
+        combined[col] = float(aggregated[col][0])
+    return combined
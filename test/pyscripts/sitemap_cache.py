@@ -0,0 +1,371 @@
+"""
+Sitemap Table Cache
+-------------------
+On-disk cache of parsed input tables, so repeated runs over the same GSC and
+Page Explorer exports skip CSV parsing entirely.
+
+Entries are keyed by a content hash of every input file plus the loader
+version and the requested columns. Each entry is a directory holding:
+- one .npy file per numeric column, loaded back with mmap_mode='r'
+- url.bin and url.offsets.npy: the URLs as one UTF-8 blob and the int64
+  offset of each (sitemap_urls.UrlColumn), both mapped back, so a warm run
+  reads no per-URL objects
+- the same pair of files per other text column (e.g. date)
+- meta.json: row count, columns and source paths
+
+The cache is capped by total size; the least recently used entries are
+evicted first. Only entries named by cache_key count towards the cap or are
+ever evicted, so other state kept under the cache directory (the
+incremental tables below) is left alone. Columns mapped from the cache are
+read-only.
+
+Growing exports that are only ever appended to can instead be loaded
+incrementally: the parsed table is persisted together with the byte offset
+it covers and a checksum of every byte before that offset, and later runs
+parse only the new tail and append it to the stored columns in place. If
+the prefix no longer matches, the file is reloaded in full.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import mmap
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from sitemap_ingest import (
+    DEFAULT_CHUNK_SIZE,
+    LOADER_VERSION,
+    URL_COLUMNS,
+    _header_index,
+    _parse_byte_range,
+    _read_header,
+    concat_tables,
+    empty_table,
+)
+from sitemap_urls import UrlColumn, url_column
+
+DEFAULT_CACHE_BYTES = 2 << 30
+# Bump when the entry layout changes; part of every cache and incremental key
+TABLE_FORMAT = 2
+HASH_BLOCK_BYTES = 1 << 20
+KEY_DIGEST_SIZE = 20
+
+def default_cache_dir() -> str:
+    """Cache location: $SITEMAP_CACHE_DIR or ~/.cache/ns-sitemap."""
+    return os.environ.get('SITEMAP_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'ns-sitemap')
+
+def file_digest(path: str, length: int = None, start: int = 0) -> str:
+    """Content hash of a file, or of `length` bytes from `start`."""
+    h = hashlib.blake2b(digest_size=20)
+    remaining = os.path.getsize(path) - start if length is None else length
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK_BYTES, remaining))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+    return h.hexdigest()
+
+def cache_key(paths: List[str], columns: Sequence[str], *parts) -> str:
+    """Key for a table built from paths; extra parts cover loader options."""
+    h = hashlib.blake2b(digest_size=KEY_DIGEST_SIZE)
+    h.update(json.dumps([TABLE_FORMAT, list(columns), [str(p) for p in parts]]).encode('utf-8'))
+    for path in paths:
+        h.update(file_digest(path).encode('ascii'))
+    return h.hexdigest()
+
+# Entry I/O
+
+def _entry_size(entry_dir: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(entry_dir) for name in names)
+
+def _write_text(entry_dir: str, name: str, column: UrlColumn):
+    with open(os.path.join(entry_dir, f"{name}.bin"), 'wb') as f:
+        np.asarray(column.data[column.offsets[0]:column.offsets[-1]]).tofile(f)
+    np.save(os.path.join(entry_dir, f"{name}.offsets.npy"), np.asarray(column.offsets) - column.offsets[0])
+
+def _read_text(entry_dir: str, name: str) -> UrlColumn:
+    path = os.path.join(entry_dir, f"{name}.bin")
+    # np.memmap cannot map an empty file
+    data = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+    return UrlColumn(data, np.load(os.path.join(entry_dir, f"{name}.offsets.npy"), mmap_mode='r'))
+
+def _write_meta(entry_dir: str, meta: Dict[str, Any]):
+    tmp_path = os.path.join(entry_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(entry_dir, 'meta.json'))
+
+def _read_meta(entry_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(entry_dir, 'meta.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+def write_table(entry_dir: str, table: Dict[str, np.ndarray], sources: Sequence[str] = (), state: Dict = None):
+    """
+    Write a table to entry_dir atomically. state, if given, is kept in
+    meta.json (see load_csv_incremental).
+    """
+    text = {name: url_column(values) for name, values in table.items() if values.dtype == object}
+    parent = os.path.dirname(entry_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        for name, column in text.items():
+            _write_text(tmp_dir, name, column)
+        columns = [name for name in table if name not in text]
+        for name in columns:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(table[name]))
+        meta = {'format': TABLE_FORMAT, 'rows': len(table['url']), 'columns': columns,
+                'text_columns': [name for name in text if name != 'url'], 'order': list(table),
+                'sources': list(sources), 'state': state}
+        _write_meta(tmp_dir, meta)
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(entry_dir):
+            raise
+
+def read_table(entry_dir: str) -> Dict[str, np.ndarray]:
+    """
+    Map a cached table back in: numeric columns are read-only memmaps, the
+    URL column a UrlColumn over mapped bytes and offsets. Other text columns
+    (e.g. date) are decoded.
+
+    Only the rows meta.json counts are read, so bytes left past them by an
+    interrupted append_table are ignored.
+    """
+    meta = _read_meta(entry_dir)
+    rows = meta['rows']
+    columns = {'url': _read_text(entry_dir, 'url')[:rows]}
+    for name in meta['text_columns']:
+        columns[name] = np.array(_read_text(entry_dir, name)[:rows].tolist(), dtype=object)
+    for name in meta['columns']:
+        columns[name] = np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r')[:rows]
+    return {name: columns[name] for name in meta['order']}
+
+def _append_npy(path: str, rows: int, values: np.ndarray) -> bool:
+    """
+    Append values to the first `rows` elements of a 1-D .npy file in place.
+
+    np.save leaves room in the header for the length to grow, so only the
+    shape is rewritten. Returns False, leaving the rows untouched, if the
+    header cannot be rewritten in place or the dtype differs.
+    """
+    values = np.ascontiguousarray(values)
+    with open(path, 'r+b') as f:
+        if np.lib.format.read_magic(f) != (1, 0):
+            return False
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        data_start = f.tell()
+        if dtype != values.dtype or fortran_order or len(shape) != 1 or shape[0] < rows:
+            return False
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                      'fortran_order': False, 'shape': (rows + len(values),)})
+        if len(header.getvalue()) != data_start:
+            return False
+        f.truncate(data_start + rows * dtype.itemsize)
+        f.seek(0, os.SEEK_END)
+        f.write(values.tobytes())
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+def _append_text(entry_dir: str, name: str, rows: int, column: UrlColumn) -> bool:
+    offsets_path = os.path.join(entry_dir, f"{name}.offsets.npy")
+    end = int(np.load(offsets_path, mmap_mode='r')[rows])
+    start = int(column.offsets[0])
+    if not _append_npy(offsets_path, rows + 1, np.asarray(column.offsets[1:]) - start + end):
+        return False
+    with open(os.path.join(entry_dir, f"{name}.bin"), 'r+b') as f:
+        f.truncate(end)
+        f.seek(end)
+        np.asarray(column.data[start:column.offsets[-1]]).tofile(f)
+    return True
+
+def append_table(entry_dir: str, table: Dict[str, np.ndarray], state: Dict = None) -> bool:
+    """
+    Append table's rows to the entry at entry_dir in place; only the new rows
+    are written. meta.json (row count and state) is replaced last, so an
+    interrupted append leaves the entry as it was. Returns False, with the
+    entry unchanged, if the columns do not line up with the stored ones.
+    """
+    meta = _read_meta(entry_dir)
+    rows = meta['rows']
+    text = {name: url_column(values) for name, values in table.items() if values.dtype == object}
+    if list(table) != meta['order'] or [name for name in text if name != 'url'] != meta['text_columns']:
+        return False
+    for name, column in text.items():
+        if not _append_text(entry_dir, name, rows, column):
+            return False
+    for name in meta['columns']:
+        if not _append_npy(os.path.join(entry_dir, f"{name}.npy"), rows, table[name]):
+            return False
+    meta['rows'] = rows + len(table['url'])
+    meta['state'] = state
+    _write_meta(entry_dir, meta)
+    return True
+
+# LRU management
+
+def _is_entry_name(name: str) -> bool:
+    """True for directory names produced by cache_key."""
+    return len(name) == 2 * KEY_DIGEST_SIZE and all(c in '0123456789abcdef' for c in name)
+
+def evict(cache_dir: str, max_bytes: int, keep: str = None):
+    """
+    Delete least recently used entries until the cache fits in max_bytes.
+
+    Only cache_key entries are considered; anything else under cache_dir is
+    neither counted nor deleted.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not _is_entry_name(name) or not os.path.isdir(path):
+            continue
+        entries.append((os.path.getmtime(path), path, _entry_size(path)))
+    total = sum(size for _, _, size in entries)
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def load_cached(paths: List[str], columns: Sequence[str], loader: Callable[[], Dict[str, np.ndarray]],
+                cache_dir: str = None, max_bytes: int = DEFAULT_CACHE_BYTES, key_parts: Sequence = ()) -> Dict[str, np.ndarray]:
+    """
+    Return the cached table for paths, or build it with loader() and cache it.
+
+    A hit refreshes the entry's LRU timestamp; a miss stores the new entry and
+    evicts old ones past max_bytes.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    entry_dir = os.path.join(cache_dir, cache_key(paths, columns, *key_parts))
+    if os.path.isfile(os.path.join(entry_dir, 'meta.json')):
+        os.utime(entry_dir)
+        return read_table(entry_dir)
+    table = loader()
+    write_table(entry_dir, table, paths)
+    evict(cache_dir, max_bytes, keep=entry_dir)
+    return table
+
+# Incremental ingestion
+
+def _read_state(state_path: str):
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _prefix_digests(path: str, offset: int, end: int) -> Tuple[str, str]:
+    """Digests of bytes [0, offset) and [0, end), offset <= end, from one streaming read."""
+    h = hashlib.blake2b(digest_size=20)
+    digests = []
+    with open(path, 'rb') as f:
+        for stop in (offset, end):
+            remaining = stop - f.tell()
+            while remaining > 0:
+                block = f.read(min(HASH_BLOCK_BYTES, remaining))
+                if not block:
+                    break
+                h.update(block)
+                remaining -= len(block)
+            digests.append(h.hexdigest())
+    return digests[0], digests[1]
+
+def _complete_lines_end(path: str, data_start: int) -> int:
+    """Offset just past the last newline, i.e. the end of the last complete row."""
+    size = os.path.getsize(path)
+    if size <= data_start:
+        return data_start
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return max(mm.rfind(b'\n') + 1, data_start)
+
+def _replace_entry(entry_dir: str, table: Dict[str, np.ndarray], sources: Sequence[str], state: Dict):
+    """Write table to entry_dir, replacing any entry already there."""
+    old_dir = None
+    if os.path.isdir(entry_dir):
+        old_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix='.old-')
+        os.replace(entry_dir, os.path.join(old_dir, 'entry'))
+    write_table(entry_dir, table, sources, state)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+def load_csv_incremental(path: str, columns: Sequence[str], state_dir: str = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         url_columns: Sequence[str] = URL_COLUMNS, stats: Dict = None,
+                         diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """
+    Load an append-only CSV, parsing only bytes added since the last run.
+
+    The table covering every complete row is persisted as one entry under
+    state_dir; its meta.json records the byte offset the table reaches and
+    a digest of every byte before it. A run whose file still has that prefix
+    parses [offset, end) and appends the new rows to the stored columns in
+    place, so the parsing and the writes are proportional to the tail; only
+    the prefix is read again, to hash it, which is far cheaper than parsing
+    it. Otherwise (e.g. GSC revised an earlier day) the file is parsed from
+    the start and the entry rewritten. A trailing row without a newline is
+    parsed every run but never persisted. The returned columns are mapped
+    from the entry.
+
+    If stats is given, it receives mode ('incremental' or 'full'),
+    parsed_bytes and rows. Diagnostics cover the bytes parsed in this run.
+    """
+    state_dir = state_dir or os.path.join(default_cache_dir(), 'incremental')
+    os.makedirs(state_dir, exist_ok=True)
+    key = hashlib.blake2b(json.dumps([os.path.abspath(path), list(columns), list(url_columns),
+                                      LOADER_VERSION, TABLE_FORMAT]).encode('utf-8'), digest_size=20).hexdigest()
+    entry_dir = os.path.join(state_dir, key)
+
+    header, data_start = _read_header(path)
+    if not header:
+        return empty_table(columns)
+    url_idx, col_idx = _header_index(header, columns, url_columns)
+    if url_idx is None:
+        return empty_table(columns)
+    size = os.path.getsize(path)
+    end = _complete_lines_end(path, data_start)
+
+    state = (_read_state(os.path.join(entry_dir, 'meta.json')) or {}).get('state')
+    usable = bool(state and state.get('header') == header and state['offset'] <= end)
+    offset = state['offset'] if usable else end
+    # The digest of the whole stored prefix, continued to end for the next run's state
+    prefix_digest, end_digest = _prefix_digests(path, offset, end)
+    incremental = usable and prefix_digest == state.get('prefix_digest')
+    start = offset if incremental else data_start
+
+    task = (path, start, end, url_idx, col_idx, tuple(columns), chunk_size)
+    tail = _parse_byte_range(task, diagnostics) if end > start else empty_table(columns)
+    new_state = {'offset': end, 'prefix_digest': end_digest, 'header': header}
+    if not incremental:
+        _replace_entry(entry_dir, tail, [path], new_state)
+    elif end > start and not append_table(entry_dir, tail, new_state):
+        _replace_entry(entry_dir, concat_tables([read_table(entry_dir), tail], columns), [path], new_state)
+    complete = read_table(entry_dir)
+
+    if stats is not None:
+        stats['mode'] = 'incremental' if incremental else 'full'
+        stats['parsed_bytes'] = size - start
+        stats['rows'] = len(complete['url'])
+
+    if size > end:
+        partial = _parse_byte_range((path, end, size, url_idx, col_idx, tuple(columns), chunk_size), diagnostics)
+        complete = concat_tables([complete, partial], columns)
+        if stats is not None:
+            stats['rows'] = len(complete['url'])
+    return complete
@@ -0,0 +1,239 @@
+"""
+Sitemap External Merge
+----------------------
+Memory-budgeted merge for inputs whose merged URL set does not fit in RAM
+(e.g. the Vercel function or small worker VMs).
+
+SpillSorter buffers rows (tuples) until their estimated size reaches its
+memory budget, then sorts the buffer and writes it to a temporary file as
+a sorted run. Iterating the sorter k-way merges the runs with heapq.merge,
+reading each run one block at a time. When there are more runs than
+MAX_FAN_IN, groups of runs are first merged into longer runs, so memory
+stays within the budget however many runs there are.
+
+external_merge feeds GSC and Page Explorer chunks through a sorter keyed on
+(normalized URL, side, row number) and yields merged tables of at most
+chunk_size rows, in URL order. Each URL gets the same values as
+sitemap_join.merge_tables gives it; its first_seq column is the URL's
+first row number over GSC then Page Explorer, so sorting by first_seq
+restores merge_tables' row order.
+"""
+
+import heapq
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from itertools import groupby
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence
+
+import numpy as np
+
+from sitemap_aggregate import combine_gsc_values
+from sitemap_ingest import DEFAULT_CHUNK_SIZE
+from sitemap_urls import normalize_urls
+
+DEFAULT_MEMORY_BUDGET = 256 << 20
+MAX_FAN_IN = 64
+# Row sizes are measured on every SIZE_SAMPLE-th row
+SIZE_SAMPLE = 64
+MIN_BLOCK_ROWS = 64
+
+def _row_size(row: tuple) -> int:
+    """Approximate bytes held by a buffered row tuple (one level of nesting)."""
+    size = sys.getsizeof(row) + 8
+    for value in row:
+        size += sys.getsizeof(value)
+        if type(value) is tuple:
+            size += sum(map(sys.getsizeof, value))
+    return size
+
+def _write_run(path: str, rows: Iterable[tuple], block_rows: int) -> int:
+    """Write rows to path as pickled blocks; returns the number of bytes written."""
+    with open(path, 'wb') as f:
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) >= block_rows:
+                pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+                block = []
+        if block:
+            pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+        return f.tell()
+
+def _read_run(path: str) -> Iterator[tuple]:
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+class SpillSorter:
+    """
+    Sort an arbitrarily long stream of rows within a memory budget.
+
+    Add rows with add/extend, then iterate once for the rows in sorted order
+    (by key, or by the rows themselves). Use as a context manager, or call
+    close(), to remove the spill files. stats holds rows, runs, merge_passes
+    and spilled_bytes.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET, key: Callable = None,
+                 spill_dir: str = None, fan_in: int = MAX_FAN_IN):
+        self.memory_budget = memory_budget
+        self.key = key
+        self.fan_in = max(2, fan_in)
+        self._spill_dir = spill_dir
+        self._tmp_dir = None
+        self._buffer = []
+        self._runs = []
+        self._row_bytes = 0
+        self._sampled = 0
+        self._sampled_bytes = 0
+        self.stats = {'rows': 0, 'runs': 0, 'merge_passes': 0, 'spilled_bytes': 0}
+
+    def __enter__(self) -> 'SpillSorter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Drop buffered rows and delete the spill files."""
+        self._buffer = []
+        self._runs = []
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def add(self, row: tuple):
+        buffer = self._buffer
+        if len(buffer) % SIZE_SAMPLE == 0:
+            self._sampled += 1
+            self._sampled_bytes += _row_size(row)
+            self._row_bytes = self._sampled_bytes // self._sampled
+        buffer.append(row)
+        if len(buffer) * self._row_bytes >= self.memory_budget:
+            self._spill()
+
+    def extend(self, rows: Iterable[tuple]):
+        for row in rows:
+            self.add(row)
+
+    def _new_run_path(self) -> str:
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix='sitemap-spill-', dir=self._spill_dir)
+        return os.path.join(self._tmp_dir, f"run-{self.stats['runs']}.pkl")
+
+    def _block_rows(self) -> int:
+        """Rows per block so that fan_in blocks being merged fit in the budget."""
+        return max(MIN_BLOCK_ROWS, self.memory_budget // (self.fan_in * max(self._row_bytes, 1)))
+
+    def _spill(self):
+        self._buffer.sort(key=self.key)
+        self._store_run(self._buffer)
+        self.stats['rows'] += len(self._buffer)
+        self._buffer = []
+
+    def _store_run(self, rows: Iterable[tuple]):
+        path = self._new_run_path()
+        self.stats['runs'] += 1
+        self.stats['spilled_bytes'] += _write_run(path, rows, self._block_rows())
+        self._runs.append(path)
+
+    def __iter__(self) -> Iterator[tuple]:
+        if not self._runs:
+            # Everything fit in memory
+            self._buffer.sort(key=self.key)
+            self.stats['rows'] += len(self._buffer)
+            rows, self._buffer = self._buffer, []
+            return iter(rows)
+        if self._buffer:
+            self._spill()
+        while len(self._runs) > self.fan_in:
+            self.stats['merge_passes'] += 1
+            group, self._runs = self._runs[:self.fan_in], self._runs[self.fan_in:]
+            self._store_run(heapq.merge(*map(_read_run, group), key=self.key))
+            for path in group:
+                os.remove(path)
+        self.stats['merge_passes'] += 1
+        return heapq.merge(*map(_read_run, self._runs), key=self.key)
+
+# Merge
+
+GSC_SIDE = 0
+PE_SIDE = 1
+
+def _side_rows(chunks: Iterable[Dict[str, np.ndarray]], side: int, columns: Sequence[str],
+               seq: List[int]) -> Iterator[tuple]:
+    """(normalized url, side, row number, values) for every row of a chunk stream."""
+    for chunk in chunks:
+        n = len(chunk['url'])
+        if not n:
+            continue
+        values = zip(*(chunk[col].tolist() if col in chunk else [0.0] * n for col in columns))
+        yield from zip(normalize_urls(chunk['url']).tolist(), [side] * n, range(seq[0], seq[0] + n), values)
+        seq[0] += n
+
+def _merged_chunk(rows: List[tuple], gsc_columns: Sequence[str], pe_columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    urls, first_seq, has_gsc, has_pe, gsc_values, pe_values = zip(*rows)
+    table = {'url': np.array(urls, dtype=object), 'first_seq': np.array(first_seq, dtype=np.int64),
+             'has_gsc': np.array(has_gsc, dtype=bool), 'has_pe': np.array(has_pe, dtype=bool)}
+    for columns, values in ((gsc_columns, gsc_values), (pe_columns, pe_values)):
+        for col, column in zip(columns, zip(*values)):
+            table[col] = np.array(column, dtype=np.float64)
+    return table
+
+def external_merge(gsc_chunks: Iterable[Dict[str, np.ndarray]], pe_chunks: Iterable[Dict[str, np.ndarray]],
+                   gsc_columns: Sequence[str], pe_columns: Sequence[str],
+                   memory_budget: int = DEFAULT_MEMORY_BUDGET, aggregate_gsc: bool = True,
+                   aggregate_single: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE, spill_dir: str = None,
+                   stats: Dict[str, Any] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Join streams of GSC and Page Explorer tables on the normalized URL within
+    memory_budget bytes of buffered rows.
+
+    Yields tables in URL order with url, first_seq, has_gsc, has_pe and the
+    given columns (missing values are 0.0). GSC rows for one URL are combined
+    as in merge_tables (aggregated, or the last row when aggregate_gsc is
+    False; with aggregate_single, a URL's only row is aggregated too, as for
+    exports aggregated while loading); the last Page Explorer row wins. stats receives the overlap
+    counts (gsc_only, pe_only, both) and the sorter's spill statistics.
+    """
+    gsc_columns, pe_columns = list(gsc_columns), list(pe_columns)
+    counts = {'gsc_only': 0, 'pe_only': 0, 'both': 0}
+    seq = [0]
+    gsc_missing = tuple(0.0 for _ in gsc_columns)
+    pe_missing = tuple(0.0 for _ in pe_columns)
+    with SpillSorter(memory_budget, spill_dir=spill_dir) as sorter:
+        sorter.extend(_side_rows(gsc_chunks, GSC_SIDE, gsc_columns, seq))
+        sorter.extend(_side_rows(pe_chunks, PE_SIDE, pe_columns, seq))
+        out = []
+        for url, group in groupby(sorter, key=lambda row: row[0]):
+            group = list(group)
+            gsc = [row[3] for row in group if row[1] == GSC_SIDE]
+            pe = [row[3] for row in group if row[1] == PE_SIDE]
+            if gsc and pe:
+                counts['both'] += 1
+            elif gsc:
+                counts['gsc_only'] += 1
+            else:
+                counts['pe_only'] += 1
+            if not gsc:
+                gsc_values = gsc_missing
+            elif not aggregate_gsc or (len(gsc) == 1 and not aggregate_single):
+                gsc_values = gsc[-1]
+            else:
+                gsc_values = combine_gsc_values(gsc, gsc_columns)
+            out.append((url, group[0][2], bool(gsc), bool(pe), gsc_values, pe[-1] if pe else pe_missing))
+            if len(out) >= chunk_size:
+                yield _merged_chunk(out, gsc_columns, pe_columns)
+                out = []
+        if out:
+            yield _merged_chunk(out, gsc_columns, pe_columns)
+        if stats is not None:
+            stats.update(counts)
+            stats.update(sorter.stats)
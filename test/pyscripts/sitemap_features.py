@@ -0,0 +1,179 @@
+"""
+Sitemap Feature Store
+---------------------
+Persisted per-URL inputs and outputs of the last run, so a daily run only
+re-scores the URLs whose metrics changed.
+
+The store keeps one table per store directory (written with
+sitemap_cache.write_table): the URL, every numeric feature column of the
+merged table (has_gsc, has_pe and the GSC and Page Explorer metrics) and
+the outputs computed for the URL (priority, component scores and cluster
+code). A run looks its URLs up in the stored table, compares the feature
+columns bit for bit and hands only the new and changed rows to the
+compute callback; every other row reuses its stored outputs. The store is
+then replaced by the current table.
+
+The stored outputs are only valid for the code and model that produced
+them, so the store is tagged with a key (e.g. the scoring model digest and
+the cluster rules). A different key, or a change in the feature columns,
+recomputes every row.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Callable, Dict, Sequence, Union
+
+import numpy as np
+
+from sitemap_cache import _read_state, default_cache_dir, read_table, write_table
+from sitemap_urls import UrlColumn, url_column
+
+FEATURE_STORE_VERSION = 3
+
+def feature_key(*parts) -> str:
+    """Key for stored outputs computed from JSON-serializable parts (model digest, rules, ...)."""
+    return hashlib.blake2b(json.dumps([FEATURE_STORE_VERSION, list(parts)], sort_keys=True).encode('utf-8'),
+                           digest_size=20).hexdigest()
+
+def feature_columns(table: Dict[str, np.ndarray]) -> Dict[str, str]:
+    """Numeric input columns of a merged table (url_id excluded) and their dtypes."""
+    return {name: values.dtype.str for name, values in table.items()
+            if name != 'url_id' and values.dtype != object}
+
+def _same_values(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Element-wise bit equality, so NaN equals NaN."""
+    if a.dtype.kind == 'f':
+        view = np.dtype(f'i{a.dtype.itemsize}')
+        return np.ascontiguousarray(a).view(view) == np.ascontiguousarray(b).view(view)
+    return a == b
+
+def match_urls(stored: UrlColumn, urls: UrlColumn) -> np.ndarray:
+    """
+    Row of each of urls in stored (distinct URLs), or -1.
+
+    URLs in the same rows as last time are the common case and are checked
+    first, by comparing the columns' bytes. Otherwise it is a hash join: both
+    sides' string hashes are sorted and stored's are binary-searched for
+    urls', then every hit is checked against the string, so a hash collision
+    only ever costs a recomputed row.
+    """
+    stored, urls = url_column(stored), url_column(urls)
+    if stored.equals(urls):
+        return np.arange(len(urls), dtype=np.int64)
+    source = np.full(len(urls), -1, dtype=np.int64)
+    if not len(stored) or not len(urls):
+        return source
+    stored = np.array(stored.tolist(), dtype=object)
+    urls = np.array(urls.tolist(), dtype=object)
+    stored_keys = np.fromiter(map(hash, stored.tolist()), dtype=np.int64, count=len(stored))
+    keys = np.fromiter(map(hash, urls.tolist()), dtype=np.int64, count=len(urls))
+    order = np.argsort(stored_keys)
+    # Sorted queries keep the binary searches cache-friendly
+    queries = np.argsort(keys)
+    pos = np.minimum(np.searchsorted(stored_keys[order], keys[queries]), len(stored) - 1)
+    candidates = np.empty(len(urls), dtype=np.int64)
+    candidates[queries] = order[pos]
+    hit = (stored_keys[candidates] == keys) & (stored[candidates] == urls)
+    source[hit] = candidates[hit]
+    return source
+
+def changed_rows(stored: Dict[str, np.ndarray], table: Dict[str, np.ndarray], urls: UrlColumn,
+                 columns: Sequence[str]):
+    """
+    Match the rows of table (whose URLs are urls) to the stored table.
+
+    Returns (source, changed): the stored row of each row (-1 for new URLs)
+    and whether the row has to be recomputed.
+    """
+    source = match_urls(stored['url'], urls)
+    changed = source < 0
+    matched = np.flatnonzero(~changed)
+    for name in columns:
+        changed[matched] |= ~_same_values(np.asarray(table[name])[matched], stored[name][source[matched]])
+    return source, changed
+
+def _save(store_dir: str, state_path: str, state: Dict[str, Any], key: str, columns: Dict[str, str],
+          table: Dict[str, np.ndarray]):
+    generation = (state or {}).get('generation', 0) + 1
+    entry_dir = os.path.join(store_dir, f"features-{generation}")
+    if os.path.isdir(entry_dir):
+        shutil.rmtree(entry_dir)
+    write_table(entry_dir, table)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'columns': columns, 'entry': entry_dir, 'generation': generation}, f)
+    os.replace(tmp_path, state_path)
+    if state and state.get('entry') != entry_dir:
+        shutil.rmtree(state['entry'], ignore_errors=True)
+
+def rescore_changed(table: Dict[str, np.ndarray], urls: Union[UrlColumn, Sequence[str]],
+                    compute: Callable[[np.ndarray], Dict[str, np.ndarray]], key: str,
+                    store_dir: str = None, stats: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """
+    Outputs for every row of table, computing only rows that are new or changed.
+
+    urls holds the URL of each row (distinct). compute(rows) gets the row
+    indices to compute and returns a dict of output columns for them; its
+    keys must be the same on every run. The outputs of all rows are
+    returned in row order and persisted in store_dir (default
+    <cache dir>/features) for the next run.
+
+    If stats is given, it receives mode ('incremental' or 'full'), rows,
+    rescored, new, changed and removed (stored URLs absent from table).
+    """
+    store_dir = store_dir or os.path.join(default_cache_dir(), 'features')
+    os.makedirs(store_dir, exist_ok=True)
+    state_path = os.path.join(store_dir, 'state.json')
+    urls = url_column(urls)
+    columns = feature_columns(table)
+    n = len(urls)
+
+    state = _read_state(state_path)
+    stored = None
+    if state and state.get('key') == key and state.get('columns') == columns and os.path.isdir(state['entry']):
+        stored = read_table(state['entry'])
+    if stored is not None:
+        source, changed = changed_rows(stored, table, urls, list(columns))
+    else:
+        source, changed = np.full(n, -1, dtype=np.int64), np.ones(n, dtype=bool)
+
+    rows = np.flatnonzero(changed)
+    computed = compute(rows)
+    outputs = {}
+    for name, values in computed.items():
+        if stored is not None and name in stored:
+            column = np.empty(n, dtype=values.dtype)
+            reused = np.flatnonzero(~changed)
+            column[reused] = stored[name][source[reused]]
+        elif len(rows) == n:
+            column = np.empty(n, dtype=values.dtype)
+        else:
+            raise ValueError(f"Output column '{name}' is not in the feature store")
+        column[rows] = values
+        outputs[name] = column
+
+    new = int(np.count_nonzero(source < 0))
+    removed = len(stored['url']) - (n - new) if stored is not None else 0
+    if stored is None or len(rows) or removed or not np.array_equal(source, np.arange(n)):
+        current = {'url': urls}
+        current.update((name, np.asarray(table[name])) for name in columns)
+        current.update(outputs)
+        _save(store_dir, state_path, state, key, columns, current)
+
+    if stats is not None:
+        stats['mode'] = 'incremental' if stored is not None else 'full'
+        stats['rows'] = n
+        stats['rescored'] = len(rows)
+        stats['new'] = new if stored is not None else n
+        stats['changed'] = len(rows) - new if stored is not None else 0
+        stats['removed'] = removed
+    return outputs
+
+def format_rescore_stats(stats: Dict[str, Any]) -> str:
+    """One-line summary of rescore_changed stats."""
+    if stats['mode'] == 'full':
+        return f"re-scored all {stats['rows']} URLs (no usable feature store)"
+    return (f"re-scored {stats['rescored']} of {stats['rows']} URLs ({stats['new']} new, "
+            f"{stats['changed']} changed, {stats['removed']} removed)")
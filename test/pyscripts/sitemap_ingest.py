@@ -0,0 +1,893 @@
+"""
+Sitemap Ingestion
+-----------------
+Columnar loaders for Google Search Console and Page Explorer exports.
+
+Rows are parsed in fixed-size chunks straight into typed NumPy columns, so the
+parser never holds more than one chunk of per-row Python objects at a time.
+
+Page Explorer's wide tab-separated export (id, url, depth, health, indexable,
+status, incoming_internal_links and a dozen text columns) is detected from its
+header and read with a projecting parser that never splits out the columns the
+pipeline does not use.
+
+Excel workbooks (.xlsx via openpyxl in read-only mode, .xls via xlrd) are
+streamed row by row into the same chunked tables.
+
+Search Console JSON Lines dumps (one row per page and date, either flat
+{"page": ..., "date": ...} objects or API rows with "keys": [page, date]) are
+read line by line and aggregated per page while reading.
+
+Inputs may be plain or compressed (.gz, .bz2, .zst) CSV files, glob
+patterns, or directories of daily shards. Shards are decompressed and parsed
+in parallel workers and streamed into the merge in shard order.
+
+A table is a plain dict mapping column name to a NumPy array:
+- url: object array of stripped URL strings, or a sitemap_urls.UrlColumn
+  (tables read back from sitemap_cache)
+- one float64 array per metric column (missing or unparseable values are 0.0)
+- status (int32) and indexable (bool), when the export provides them
+- text columns such as date, as object arrays of strings
+
+Headers are resolved once per file. Column names are matched exactly, then
+case-insensitively, against the column itself and its aliases in
+COLUMN_ALIASES (extend it with register_alias). The encoding (UTF-8 with or
+without BOM, UTF-16) and the delimiter (comma, tab, semicolon or pipe) are
+sniffed from the first bytes. Each row then goes through a single compiled
+itemgetter that pulls out exactly the mapped fields, with no per-row probing.
+
+Loaders never print per row. Pass a diagnostics dict (see new_diagnostics)
+to collect counts of rows without a URL, unparseable metric values per
+column, undecodable bytes and malformed JSON lines, plus a capped sample of
+the offending rows. Invalid UTF-8 is replaced with U+FFFD and counted rather
+than aborting the load.
+"""
+
+import bz2
+import codecs
+import csv
+import glob
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from operator import itemgetter
+from typing import Dict, Iterator, List, Sequence, Tuple, Any
+
+import numpy as np
+
+from sitemap_aggregate import aggregate_gsc_chunks
+from sitemap_urls import UrlColumn, url_column
+
+GSC_COLUMNS = ('clicks', 'impressions', 'ctr', 'position')
+PE_COLUMNS = ('importance', 'depth', 'internal_links', 'health')
+URL_COLUMNS = ('url', 'URL')
+# Alternative header names per column, tried after the column's own name.
+# 'url' extends whatever url_columns a loader is given.
+COLUMN_ALIASES = {
+    'url': ('page', 'link', 'top pages'),
+    'internal_links': ('incoming_internal_links',),
+}
+DELIMITERS = (',', '\t', ';', '|')
+FLAG_COLUMNS = ('status', 'indexable')
+# Columns kept as strings rather than parsed as floats
+TEXT_COLUMNS = ('date',)
+DEFAULT_CHUNK_SIZE = 65536
+# Bump whenever parsing semantics change, to invalidate cached tables
+LOADER_VERSION = 3
+MIN_RANGE_BYTES = 1 << 20
+CSV_SUFFIXES = ('.csv', '.csv.gz', '.csv.bz2', '.csv.zst', '.tsv', '.tsv.gz', '.tsv.bz2', '.tsv.zst')
+EXCEL_SUFFIXES = ('.xlsx', '.xlsm', '.xls')
+JSONL_SUFFIXES = ('.jsonl', '.ndjson')
+JSONL_URL_KEYS = ('page', 'url', 'URL')
+DIAGNOSTIC_SAMPLE_LIMIT = 20
+# Codec error handler that replaces undecodable bytes and counts them
+DECODE_ERRORS = 'sitemap-count'
+
+# Tables
+
+def empty_table(columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Create a table with no rows."""
+    table = {'url': np.empty(0, dtype=object)}
+    for col in columns:
+        table[col] = np.empty(0, dtype=object if col in TEXT_COLUMNS else np.float64)
+    return table
+
+def table_len(table: Dict[str, np.ndarray]) -> int:
+    """Number of rows in a table."""
+    return len(next(iter(table.values())))
+
+def concat_tables(tables: List[Dict[str, np.ndarray]], columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Concatenate tables with the same columns, preserving row order."""
+    if not tables:
+        return empty_table(columns)
+    if len(tables) == 1:
+        return tables[0]
+    return {name: _concat_column([t[name] for t in tables]) for name in tables[0]}
+
+def _concat_column(columns: List[np.ndarray]) -> np.ndarray:
+    if any(isinstance(column, UrlColumn) for column in columns):
+        return UrlColumn.concat([url_column(column) for column in columns])
+    return np.concatenate(columns)
+
+def filter_table(table: Dict[str, np.ndarray], mask: np.ndarray) -> Dict[str, np.ndarray]:
+    """Keep the rows where mask is True."""
+    return {name: values[mask] for name, values in table.items()}
+
+def indexable_mask(table: Dict[str, np.ndarray], statuses: Sequence[int] = (200,)) -> np.ndarray:
+    """
+    Rows that are indexable and returned one of the given HTTP statuses.
+    Tables without status/indexable flags keep every row.
+    """
+    mask = np.ones(table_len(table), dtype=bool)
+    if 'indexable' in table:
+        mask &= table['indexable']
+    if 'status' in table:
+        mask &= np.isin(table['status'], statuses)
+    return mask
+
+def table_to_records(table: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Convert a table to the list-of-dicts shape used by the record pipeline."""
+    names = list(table)
+    columns = [table[name].tolist() for name in names]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+def records_to_table(records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Inverse of table_to_records. Columns are the keys in order of first
+    appearance; a record lacking a key reads as 0.0. Numeric and boolean
+    columns get a NumPy dtype, anything else is kept as objects.
+    """
+    names = {'url': None}
+    for record in records:
+        names.update(dict.fromkeys(record))
+    table = {}
+    for name in names:
+        values = np.array([record.get(name, 0.0) for record in records])
+        if values.dtype.kind not in 'biuf':
+            values = np.array([record.get(name, 0.0) for record in records], dtype=object)
+        table[name] = values
+    if not records:
+        table['url'] = np.empty(0, dtype=object)
+    return table
+
+# Diagnostics
+
+_decode_error_count = [0]
+
+def _count_decode_error(error: UnicodeDecodeError):
+    _decode_error_count[0] += 1
+    return '\ufffd', error.end
+
+codecs.register_error(DECODE_ERRORS, _count_decode_error)
+
+def new_diagnostics(sample_limit: int = DIAGNOSTIC_SAMPLE_LIMIT) -> Dict[str, Any]:
+    """Empty ingestion diagnostics: problem counters plus a capped sample of bad rows."""
+    return {'rows': 0, 'missing_url': 0, 'bad_values': {}, 'encoding_errors': 0,
+            'malformed_lines': 0, 'samples': [], 'sample_limit': sample_limit}
+
+def _add_sample(diagnostics: Dict[str, Any], sample: Dict[str, Any]):
+    if len(diagnostics['samples']) < diagnostics['sample_limit']:
+        diagnostics['samples'].append(sample)
+
+def merge_diagnostics(into: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the counts and samples of other into into (e.g. from a worker)."""
+    for name in ('rows', 'missing_url', 'encoding_errors', 'malformed_lines'):
+        into[name] += other[name]
+    for col, count in other['bad_values'].items():
+        into['bad_values'][col] = into['bad_values'].get(col, 0) + count
+    for sample in other['samples']:
+        _add_sample(into, sample)
+    return into
+
+def format_diagnostics(diagnostics: Dict[str, Any]) -> str:
+    """One-line summary of the problems found, or 'no problems'."""
+    parts = []
+    if diagnostics['missing_url']:
+        parts.append(f"{diagnostics['missing_url']} rows without a URL")
+    for col, count in sorted(diagnostics['bad_values'].items()):
+        parts.append(f"{count} unparseable {col} values")
+    if diagnostics['encoding_errors']:
+        parts.append(f"{diagnostics['encoding_errors']} encoding errors")
+    if diagnostics['malformed_lines']:
+        parts.append(f"{diagnostics['malformed_lines']} malformed lines")
+    return f"{diagnostics['rows']} rows read, " + (', '.join(parts) if parts else 'no problems')
+
+@contextmanager
+def _decode_error_scope(diagnostics: Dict[str, Any] = None):
+    """Add the decode errors counted while the scope is open to diagnostics."""
+    start = _decode_error_count[0]
+    try:
+        yield
+    finally:
+        if diagnostics is not None:
+            diagnostics['encoding_errors'] += _decode_error_count[0] - start
+
+# Inputs
+
+def is_compressed(path: str) -> bool:
+    """True if path is read through a decompressor."""
+    return path.endswith(('.gz', '.bz2', '.zst'))
+
+def is_excel(path: str) -> bool:
+    """True if path is an Excel workbook."""
+    return path.lower().endswith(EXCEL_SUFFIXES)
+
+def is_jsonl(path: str) -> bool:
+    """True if path is a (possibly compressed) JSON Lines file."""
+    base = path[:path.rfind('.')] if is_compressed(path) else path
+    return base.lower().endswith(JSONL_SUFFIXES)
+
+def open_binary(path: str):
+    """Open a plain or compressed file as a binary stream of its decompressed bytes."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst inputs requires the zstandard package")
+        raw = open(path, 'rb')
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return open(path, 'rb')
+
+def detect_encoding(head: bytes) -> str:
+    """Encoding of a text file from its first bytes: BOMs, then BOM-less UTF-16, else UTF-8."""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if len(head) >= 2 and head[0] and not head[1]:
+        return 'utf-16-le'
+    if len(head) >= 2 and not head[0] and head[1]:
+        return 'utf-16-be'
+    return 'utf-8'
+
+def sniff_encoding(path: str) -> str:
+    """Encoding of a plain or compressed text file (see detect_encoding)."""
+    with open_binary(path) as f:
+        return detect_encoding(f.read(4))
+
+def open_text(path: str, encoding: str = None):
+    """
+    Open a plain or compressed text file for csv reading. The encoding is
+    sniffed unless given; undecodable bytes are replaced and counted.
+    """
+    encoding = encoding or sniff_encoding(path)
+    return io.TextIOWrapper(open_binary(path), encoding=encoding, newline='', errors=DECODE_ERRORS)
+
+def expand_inputs(source) -> List[str]:
+    """
+    Resolve an input spec to an ordered list of files.
+
+    Accepts a single path, a glob pattern, a directory (all CSV/TSV/Excel/
+    JSON Lines shards inside it, sorted by name), or a list of any of these.
+    """
+    if isinstance(source, (list, tuple)):
+        paths = []
+        for item in source:
+            paths.extend(expand_inputs(item))
+        return paths
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source)
+                       if name.endswith(CSV_SUFFIXES) or name.lower().endswith(EXCEL_SUFFIXES)
+                       or is_jsonl(name))
+        return [os.path.join(source, name) for name in names]
+    if glob.has_magic(source):
+        return sorted(glob.glob(source))
+    return [source]
+
+# Parsing
+
+def _to_float_column(values: List[str], diagnostics: Dict[str, Any] = None, column: str = None,
+                     urls: List[str] = None) -> np.ndarray:
+    """
+    Parse a list of strings into float64, using 0.0 for blanks and junk.
+    Non-blank values that do not parse are counted under column in diagnostics.
+    """
+    try:
+        return np.array(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        pass
+    out = np.zeros(len(values), dtype=np.float64)
+    bad = 0
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (ValueError, TypeError):
+            if diagnostics is None or value is None or not str(value).strip():
+                continue
+            bad += 1
+            _add_sample(diagnostics, {'reason': 'bad_value', 'column': column,
+                                      'url': urls[i] if urls else None, 'value': str(value)[:200]})
+    if bad:
+        diagnostics['bad_values'][column] = diagnostics['bad_values'].get(column, 0) + bad
+    return out
+
+def _text_value(value) -> str:
+    """String form of a text cell; dates become ISO YYYY-MM-DD."""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).strip()
+
+def _build_chunk(rows: List[List[str]], url_idx: int, col_idx: Dict[str, int],
+                 columns: Sequence[str], diagnostics: Dict[str, Any] = None,
+                 extractor=None) -> Dict[str, np.ndarray]:
+    """Turn a chunk of raw CSV rows into a table."""
+    extractor = extractor or _compile_extractor(url_idx, col_idx)
+    fields = _extract_fields(rows, extractor)
+    values = dict(zip(col_idx, fields[1:]))
+    urls = [url.strip() for url in fields[0]]
+    if diagnostics is not None:
+        diagnostics['rows'] += len(rows)
+    if not all(urls):
+        keep = [i for i, url in enumerate(urls) if url]
+        if diagnostics is not None:
+            missing = [row for url, row in zip(urls, rows) if not url]
+            diagnostics['missing_url'] += len(missing)
+            for row in missing[:diagnostics['sample_limit']]:
+                _add_sample(diagnostics, {'reason': 'missing_url', 'row': [str(v)[:200] for v in row[:20]]})
+        urls = [urls[i] for i in keep]
+        values = {col: [field[i] for i in keep] for col, field in values.items()}
+    chunk = {'url': np.array(urls, dtype=object)}
+    for col in columns:
+        if col not in values:
+            chunk[col] = (np.full(len(urls), '', dtype=object) if col in TEXT_COLUMNS
+                          else np.zeros(len(urls), dtype=np.float64))
+        elif col in TEXT_COLUMNS:
+            chunk[col] = np.array([_text_value(value) for value in values[col]], dtype=object)
+        else:
+            chunk[col] = _to_float_column(values[col], diagnostics, col, urls)
+    return chunk
+
+def register_alias(column: str, *names: str):
+    """Accept further header names for column (matched case-insensitively)."""
+    known = COLUMN_ALIASES.get(column, ())
+    COLUMN_ALIASES[column] = known + tuple(name for name in names if name not in known)
+
+def _header_key(name: str) -> str:
+    return ' '.join(str(name).replace('\ufeff', '').split()).lower()
+
+def _header_index(header: List[str], columns: Sequence[str],
+                  url_columns: Sequence[str]):
+    """
+    Resolve the URL column and metric columns to header positions: exact
+    names first, then case- and whitespace-insensitive matches, in alias order.
+    """
+    exact = {}
+    loose = {}
+    for i, name in enumerate(header):
+        exact.setdefault(name, i)
+        loose.setdefault(_header_key(name), i)
+
+    def find(names):
+        idx = next((exact[name] for name in names if name in exact), None)
+        if idx is None:
+            idx = next((loose[key] for key in map(_header_key, names) if key in loose), None)
+        return idx
+
+    url_idx = find(tuple(url_columns) + COLUMN_ALIASES.get('url', ()))
+    col_idx = {}
+    for col in columns:
+        idx = find((col,) + COLUMN_ALIASES.get(col, ()))
+        if idx is not None:
+            col_idx[col] = idx
+    return url_idx, col_idx
+
+def _compile_extractor(url_idx: int, col_idx: Dict[str, int]):
+    """
+    Compile the field extractor for one file's header: one itemgetter for the
+    URL and for each mapped column, in col_idx order. Returns (getters, width),
+    width being the shortest row every getter can index.
+    """
+    indices = [url_idx, *col_idx.values()]
+    return [itemgetter(idx) for idx in indices], max(indices) + 1
+
+def _extract_fields(rows: List[Sequence], extractor) -> List[List]:
+    """One list of values per extracted field; rows too short for the header are padded with ''."""
+    getters, width = extractor
+    try:
+        return [list(map(get, rows)) for get in getters]
+    except IndexError:
+        pad = [''] * width
+        rows = [row if len(row) >= width else list(row) + pad for row in rows]
+        return [list(map(get, rows)) for get in getters]
+
+def _iter_row_chunks(reader, url_idx: int, col_idx: Dict[str, int], columns: Sequence[str],
+                     chunk_size: int, diagnostics: Dict[str, Any] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """Group rows from a csv.reader into tables of at most chunk_size rows."""
+    extractor = _compile_extractor(url_idx, col_idx)
+    rows = []
+    for row in reader:
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield _build_chunk(rows, url_idx, col_idx, columns, diagnostics, extractor)
+            rows = []
+    if rows:
+        yield _build_chunk(rows, url_idx, col_idx, columns, diagnostics, extractor)
+
+def iter_csv_chunks(path: str, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    url_columns: Sequence[str] = URL_COLUMNS,
+                    diagnostics: Dict[str, Any] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Stream a CSV file as tables of at most chunk_size rows.
+
+    Rows without a URL are skipped. Metric columns missing from the header
+    are filled with 0.0. Encoding and delimiter are sniffed.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    delimiter = sniff_delimiter(path)
+    with open_text(path) as csvfile, _decode_error_scope(diagnostics):
+        reader = csv.reader(csvfile, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            return
+        url_idx, col_idx = _header_index(header, columns, url_columns)
+        if url_idx is None:
+            return
+        yield from _iter_row_chunks(reader, url_idx, col_idx, columns, chunk_size, diagnostics)
+
+# Wide tab-separated exports
+
+def sniff_delimiter(path: str) -> str:
+    """The most frequent of comma, tab, semicolon and pipe in the header line (comma on ties)."""
+    with open_text(path) as f:
+        first = f.readline()
+    return max(DELIMITERS, key=first.count)
+
+def _compile_projection(indices: Sequence[int]):
+    """
+    Regex that captures the fields at the given (sorted) positions of a
+    tab-separated line and steps over every other field without creating it.
+    """
+    parts = ['^']
+    prev = -1
+    for idx in indices:
+        gap = idx - prev - 1 if prev >= 0 else idx
+        if prev >= 0:
+            parts.append('\t')
+        if gap:
+            parts.append(f'(?:[^\t\n]*\t){{{gap}}}')
+        parts.append('([^\t\r\n]*)')
+        prev = idx
+    return re.compile(''.join(parts))
+
+def _parse_flag_columns(rows: List[Tuple[str, ...]], flag_pos: Dict[str, int],
+                        diagnostics: Dict[str, Any] = None, urls: List[str] = None) -> Dict[str, np.ndarray]:
+    flags = {}
+    if 'status' in flag_pos:
+        pos = flag_pos['status']
+        flags['status'] = _to_float_column([row[pos] for row in rows], diagnostics, 'status', urls).astype(np.int32)
+    if 'indexable' in flag_pos:
+        pos = flag_pos['indexable']
+        flags['indexable'] = np.array([row[pos].strip().lower() in ('true', '1', 'yes') for row in rows], dtype=bool)
+    return flags
+
+def iter_tsv_chunks(path: str, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    url_columns: Sequence[str] = URL_COLUMNS,
+                    diagnostics: Dict[str, Any] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Stream a wide tab-separated export as tables, projecting only the URL,
+    the requested metric columns and the status/indexable flags.
+
+    Fields are unquoted, so each line goes through a compiled projection regex.
+    Some exported meta descriptions contain a raw newline; a line with fewer
+    tabs than the header is joined with the following lines until the record
+    is complete.
+    """
+    with open_text(path) as f, _decode_error_scope(diagnostics):
+        lines = iter(f)
+        header_line = next(lines, None)
+        if header_line is None:
+            return
+        header = header_line.rstrip('\r\n').split('\t')
+        ntabs = len(header) - 1
+        url_idx, col_idx = _header_index(header, columns, url_columns)
+        if url_idx is None:
+            return
+        flag_idx = {name: header.index(name) for name in FLAG_COLUMNS if name in header}
+        wanted = sorted({url_idx, *col_idx.values(), *flag_idx.values()})
+        pos = {idx: i for i, idx in enumerate(wanted)}
+        url_pos = pos[url_idx]
+        col_pos = {col: pos[idx] for col, idx in col_idx.items()}
+        flag_pos = {name: pos[idx] for name, idx in flag_idx.items()}
+        projection = _compile_projection(wanted)
+
+        def build(rows):
+            chunk = _build_chunk(rows, url_pos, col_pos, columns, diagnostics)
+            rows = [row for row in rows if row[url_pos].strip()]
+            chunk.update(_parse_flag_columns(rows, flag_pos, diagnostics, chunk['url'].tolist()))
+            return chunk
+
+        rows = []
+        for line in lines:
+            tabs = line.count('\t')
+            if tabs < ntabs:
+                parts = [line.rstrip('\r\n')]
+                for more in lines:
+                    parts.append(more.rstrip('\r\n'))
+                    tabs += more.count('\t')
+                    if tabs >= ntabs:
+                        break
+                line = ' '.join(parts)
+            match = projection.match(line)
+            if match is not None:
+                rows.append(match.groups())
+            else:
+                fields = line.rstrip('\r\n').split('\t')
+                rows.append(tuple(fields[i] if i < len(fields) else '' for i in wanted))
+            if len(rows) >= chunk_size:
+                yield build(rows)
+                rows = []
+        if rows:
+            yield build(rows)
+
+# Excel workbooks
+
+def _iter_xlsx_rows(path: str, sheet: str = None) -> Iterator[tuple]:
+    """Stream cell values from an .xlsx sheet without loading the workbook."""
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        yield from worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def _iter_xls_rows(path: str, sheet: str = None) -> Iterator[tuple]:
+    """Stream cell values from a legacy .xls sheet (xlrd loads one sheet at a time)."""
+    import xlrd
+    workbook = xlrd.open_workbook(path, on_demand=True)
+    try:
+        worksheet = workbook.sheet_by_name(sheet) if sheet else workbook.sheet_by_index(0)
+        for i in range(worksheet.nrows):
+            yield tuple(worksheet.row_values(i))
+    finally:
+        workbook.release_resources()
+
+def iter_excel_chunks(path: str, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      url_columns: Sequence[str] = URL_COLUMNS, sheet: str = None,
+                      diagnostics: Dict[str, Any] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Stream an Excel sheet as tables of at most chunk_size rows.
+
+    The first row is the header. Empty cells become 0.0 like blank CSV fields.
+    """
+    rows_in = _iter_xls_rows(path, sheet) if path.lower().endswith('.xls') else _iter_xlsx_rows(path, sheet)
+    header = next(rows_in, None)
+    if header is None:
+        return
+    header = ['' if name is None else str(name).strip() for name in header]
+    url_idx, col_idx = _header_index(header, columns, url_columns)
+    if url_idx is None:
+        return
+    rows = []
+    for values in rows_in:
+        url = values[url_idx] if len(values) > url_idx else None
+        row = ['' if v is None else v for v in values]
+        if len(row) > url_idx:
+            row[url_idx] = '' if url is None else str(url)
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield _build_chunk(rows, url_idx, col_idx, columns, diagnostics)
+            rows = []
+    if rows:
+        yield _build_chunk(rows, url_idx, col_idx, columns, diagnostics)
+
+# JSON Lines
+
+def _jsonl_row_keys(obj: Dict[str, Any], url_keys: Sequence[str]):
+    """
+    (url, date) of a JSON Lines row: taken from an API row's keys array
+    (whichever key looks like a URL is the page), else from the named fields.
+    """
+    keys = obj.get('keys')
+    if keys:
+        url = next((key for key in keys if isinstance(key, str) and '://' in key), None)
+        day = next((key for key in keys if key is not url), obj.get('date'))
+        return url, day
+    return next((obj[key] for key in url_keys if obj.get(key)), None), obj.get('date')
+
+def iter_jsonl_chunks(path: str, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      url_keys: Sequence[str] = JSONL_URL_KEYS,
+                      diagnostics: Dict[str, Any] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Stream a JSON Lines dump as row-level tables, projecting each row to its
+    URL, date and the requested metrics. Blank and malformed lines are skipped.
+    """
+    rows = []
+
+    def build(rows):
+        urls = [row[0] for row in rows]
+        chunk = {'url': np.array(urls, dtype=object)}
+        for i, col in enumerate(columns, start=1):
+            if col in TEXT_COLUMNS:
+                chunk[col] = np.array([row[i] for row in rows], dtype=object)
+            else:
+                chunk[col] = _to_float_column([row[i] for row in rows], diagnostics, col, urls)
+        return chunk
+
+    with open_text(path) as f, _decode_error_scope(diagnostics):
+        for line in f:
+            if not line.strip():
+                continue
+            if diagnostics is not None:
+                diagnostics['rows'] += 1
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                obj = None
+            if not isinstance(obj, dict):
+                if diagnostics is not None:
+                    diagnostics['malformed_lines'] += 1
+                    _add_sample(diagnostics, {'reason': 'malformed_line', 'line': line.strip()[:200]})
+                continue
+            url, day = _jsonl_row_keys(obj, url_keys)
+            if not url or not isinstance(url, str) or not url.strip():
+                if diagnostics is not None:
+                    diagnostics['missing_url'] += 1
+                    _add_sample(diagnostics, {'reason': 'missing_url', 'line': line.strip()[:200]})
+                continue
+            row = [url.strip()]
+            for col in columns:
+                if col == 'date':
+                    row.append('' if day is None else _text_value(day))
+                else:
+                    value = obj.get(col)
+                    row.append('' if value is None else value)
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield build(rows)
+                rows = []
+    if rows:
+        yield build(rows)
+
+def load_jsonl_table(path: str, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     url_keys: Sequence[str] = JSONL_URL_KEYS,
+                     diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """
+    Stream a JSON Lines dump and aggregate its rows per page as they are read
+    (see sitemap_aggregate: clicks and impressions summed, ctr recomputed,
+    position impression-weighted). Only the per-page aggregates stay in memory.
+    """
+    metrics = [col for col in columns if col not in TEXT_COLUMNS]
+    return aggregate_gsc_chunks(iter_jsonl_chunks(path, metrics, chunk_size, url_keys, diagnostics), metrics)
+
+def _read_header(path: str) -> Tuple[List[str], int]:
+    """Return the parsed header row and the byte offset where data rows start."""
+    with open(path, 'rb') as f:
+        first = f.readline()
+    header = next(csv.reader([first.decode('utf-8-sig', DECODE_ERRORS)]), None)
+    return header, len(first)
+
+def supports_byte_ranges(path: str) -> bool:
+    """True for uncompressed comma-separated UTF-8 files, which can be parsed by byte range."""
+    if is_compressed(path) or is_excel(path) or is_jsonl(path):
+        return False
+    return sniff_encoding(path) in ('utf-8', 'utf-8-sig') and sniff_delimiter(path) == ','
+
+def split_byte_ranges(path: str, parts: int, start: int = 0) -> List[Tuple[int, int]]:
+    """
+    Split path[start:] into at most `parts` byte ranges that each end just
+    after a newline.
+
+    Ranges are cut on raw newlines, which may fall inside a quoted field
+    (e.g. a multi-line meta description); load_csv_table_parallel detects
+    that from the quote counts of the ranges.
+    """
+    size = os.path.getsize(path)
+    if start >= size:
+        return []
+    if parts <= 1:
+        return [(start, size)]
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        step = (size - start) // parts
+        bounds = [start]
+        for k in range(1, parts):
+            pos = mm.find(b'\n', max(start + k * step, bounds[-1]))
+            if pos == -1 or pos + 1 >= size:
+                break
+            if pos + 1 > bounds[-1]:
+                bounds.append(pos + 1)
+        bounds.append(size)
+    return [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+def _parse_byte_range(args, diagnostics: Dict[str, Any] = None, stats: Dict = None) -> Dict[str, np.ndarray]:
+    """
+    Map the file, parse one byte range, and return it as a table. If stats is
+    given, it receives the range's count of quote characters as quotes.
+    """
+    path, lo, hi, url_idx, col_idx, columns, chunk_size = args
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            _decode_error_scope(diagnostics):
+        text = mm[lo:hi].decode('utf-8', DECODE_ERRORS)
+    if stats is not None:
+        stats['quotes'] = text.count('"')
+    reader = csv.reader(io.StringIO(text, newline=''))
+    return concat_tables(list(_iter_row_chunks(reader, url_idx, col_idx, columns, chunk_size, diagnostics)), columns)
+
+def _parse_byte_range_task(args) -> Tuple[Dict[str, np.ndarray], Dict[str, Any], int]:
+    """Worker: parse one byte range, returning the table, its diagnostics and its quote count."""
+    diagnostics, stats = new_diagnostics(), {}
+    table = _parse_byte_range(args, diagnostics, stats)
+    return table, diagnostics, stats['quotes']
+
+def load_csv_table_parallel(path: str, columns: Sequence[str], workers: int = None,
+                            chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            url_columns: Sequence[str] = URL_COLUMNS,
+                            min_range_bytes: int = MIN_RANGE_BYTES,
+                            diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """
+    Load a CSV file by parsing newline-aligned byte ranges in a process pool.
+
+    Each worker memory-maps the file itself and only decodes its own range.
+    Ranges are concatenated in file order, so the result is identical to
+    load_csv_table. A range boundary after an odd number of quote characters
+    lies inside a quoted field; the file is then parsed serially instead.
+    """
+    workers = workers or os.cpu_count() or 1
+    header, data_start = _read_header(path)
+    if header is None:
+        return empty_table(columns)
+    url_idx, col_idx = _header_index(header, columns, url_columns)
+    if url_idx is None:
+        return empty_table(columns)
+    body = os.path.getsize(path) - data_start
+    parts = max(1, min(workers * 2, body // max(min_range_bytes, 1)))
+    ranges = split_byte_ranges(path, parts, data_start)
+    tasks = [(path, lo, hi, url_idx, col_idx, tuple(columns), chunk_size) for lo, hi in ranges]
+    if workers == 1 or len(tasks) <= 1:
+        results = [_parse_byte_range_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(_parse_byte_range_task, tasks))
+    if np.any(np.cumsum([quotes for _, _, quotes in results])[:-1] % 2):
+        return concat_tables(list(iter_csv_chunks(path, columns, chunk_size, url_columns, diagnostics)), columns)
+    if diagnostics is not None:
+        for _, found, _ in results:
+            merge_diagnostics(diagnostics, found)
+    return concat_tables([table for table, _, _ in results], columns)
+
+def load_csv_table(path: str, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   url_columns: Sequence[str] = URL_COLUMNS, workers: int = 1,
+                   diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """
+    Load one CSV, TSV, Excel or JSON Lines file into a single table, in
+    parallel when workers > 1. JSON Lines rows are aggregated per page unless
+    the date column is requested, which keeps them row-level for a date window.
+    """
+    if is_excel(path):
+        return concat_tables(list(iter_excel_chunks(path, columns, chunk_size, url_columns,
+                                                    diagnostics=diagnostics)), columns)
+    if is_jsonl(path) and 'date' in columns:
+        return concat_tables(list(iter_jsonl_chunks(path, columns, chunk_size, diagnostics=diagnostics)), columns)
+    if is_jsonl(path):
+        return load_jsonl_table(path, columns, chunk_size, diagnostics=diagnostics)
+    if sniff_delimiter(path) == '\t':
+        return concat_tables(list(iter_tsv_chunks(path, columns, chunk_size, url_columns, diagnostics)), columns)
+    if workers != 1 and supports_byte_ranges(path):
+        return load_csv_table_parallel(path, columns, workers, chunk_size, url_columns, diagnostics=diagnostics)
+    chunks = list(iter_csv_chunks(path, columns, chunk_size, url_columns, diagnostics))
+    return concat_tables(chunks, columns)
+
+def _load_shard(args) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Worker: decompress and parse one shard, returning the table and its diagnostics."""
+    path, columns, chunk_size, url_columns = args
+    diagnostics = new_diagnostics()
+    return load_csv_table(path, columns, chunk_size, url_columns, diagnostics=diagnostics), diagnostics
+
+def iter_input_tables(source, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      url_columns: Sequence[str] = URL_COLUMNS, workers: int = 1,
+                      diagnostics: Dict[str, Any] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Yield one table per input file, in input order.
+
+    With several shards and workers > 1, shards are decompressed and parsed
+    in a process pool and yielded as soon as the next one in order is ready.
+    A single plain file is split into byte ranges instead.
+    """
+    paths = expand_inputs(source)
+    if len(paths) == 1:
+        yield load_csv_table(paths[0], columns, chunk_size, url_columns, workers, diagnostics)
+        return
+    tasks = [(path, tuple(columns), chunk_size, tuple(url_columns)) for path in paths]
+    if workers == 1 or len(tasks) <= 1:
+        for path in paths:
+            yield load_csv_table(path, columns, chunk_size, url_columns, diagnostics=diagnostics)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(tasks))) as pool:
+        for table, found in pool.map(_load_shard, tasks):
+            if diagnostics is not None:
+                merge_diagnostics(diagnostics, found)
+            yield table
+
+def iter_input_chunks(source, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      url_columns: Sequence[str] = URL_COLUMNS,
+                      diagnostics: Dict[str, Any] = None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Stream every input file as row-level tables of at most chunk_size rows.
+    Unlike load_csv_table, JSON Lines rows are not aggregated here.
+    """
+    for path in expand_inputs(source):
+        if is_excel(path):
+            yield from iter_excel_chunks(path, columns, chunk_size, url_columns, diagnostics=diagnostics)
+        elif is_jsonl(path):
+            yield from iter_jsonl_chunks(path, columns, chunk_size, diagnostics=diagnostics)
+        elif sniff_delimiter(path) == '\t':
+            yield from iter_tsv_chunks(path, columns, chunk_size, url_columns, diagnostics)
+        else:
+            yield from iter_csv_chunks(path, columns, chunk_size, url_columns, diagnostics)
+
+def load_csv_inputs(source, columns: Sequence[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    url_columns: Sequence[str] = URL_COLUMNS, workers: int = 1,
+                    cache_dir: str = None, incremental: bool = False,
+                    diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """
+    Load a file, glob pattern or directory of shards into a single table.
+
+    With cache_dir set, parsed tables are cached there by content hash (see
+    sitemap_cache) and warm runs map the cached columns instead of parsing.
+    With incremental set, plain files are treated as append-only and only
+    their new tail is parsed; state is kept under cache_dir. Diagnostics only
+    cover what was actually parsed in this run.
+    """
+    paths = expand_inputs(source)
+    if incremental:
+        from sitemap_cache import load_csv_incremental
+        state_dir = os.path.join(cache_dir, 'incremental') if cache_dir else None
+        tables = [load_csv_incremental(path, columns, state_dir, chunk_size, url_columns,
+                                       diagnostics=diagnostics)
+                  if supports_byte_ranges(path)
+                  else load_csv_table(path, columns, chunk_size, url_columns, diagnostics=diagnostics)
+                  for path in paths]
+        return concat_tables(tables, columns)
+
+    def parse():
+        return concat_tables(list(iter_input_tables(paths, columns, chunk_size, url_columns, workers,
+                                                    diagnostics)), columns)
+
+    if cache_dir is None:
+        return parse()
+    from sitemap_cache import load_cached
+    return load_cached(paths, columns, parse, cache_dir,
+                       key_parts=(LOADER_VERSION, 'csv', list(url_columns), sorted(COLUMN_ALIASES.items())))
+
+def load_gsc_table(gsc_path, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1,
+                   cache_dir: str = None, incremental: bool = False,
+                   start_date: str = None, end_date: str = None,
+                   diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """
+    Load a Google Search Console export (file, glob or shard directory) as a table.
+
+    With a date window (inclusive ISO dates), the export's date column is read
+    and rows are aggregated to one per URL over that window. Without cache or
+    incremental state this streams chunk by chunk, holding only the per-URL
+    aggregates.
+    """
+    if start_date is None and end_date is None:
+        return load_csv_inputs(gsc_path, GSC_COLUMNS, chunk_size, workers=workers,
+                               cache_dir=cache_dir, incremental=incremental, diagnostics=diagnostics)
+    columns = GSC_COLUMNS + ('date',)
+    if cache_dir is None and not incremental:
+        chunks = iter_input_chunks(gsc_path, columns, chunk_size, diagnostics=diagnostics)
+    else:
+        chunks = [load_csv_inputs(gsc_path, columns, chunk_size, workers=workers,
+                                  cache_dir=cache_dir, incremental=incremental, diagnostics=diagnostics)]
+    return aggregate_gsc_chunks(chunks, GSC_COLUMNS, start_date, end_date)
+
+def load_page_explorer_table(pe_path, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1,
+                             cache_dir: str = None, incremental: bool = False,
+                             diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """Load a Page Explorer export (file, glob or shard directory) as a table."""
+    return load_csv_inputs(pe_path, PE_COLUMNS, chunk_size, workers=workers,
+                           cache_dir=cache_dir, incremental=incremental, diagnostics=diagnostics)
@@ -0,0 +1,177 @@
+"""
+Sitemap Join
+------------
+Full outer join of the GSC and Page Explorer tables on the normalized URL.
+
+Both inputs are columnar tables (see sitemap_ingest). Their URL columns are
+normalized and interned into a shared UrlDictionary, which is the hash table
+of the join: the GSC pass builds it, the Page Explorer pass probes it and
+adds the URLs it misses. Everything after that is array indexing on the
+dense int32 ids, with no per-row Python work. A table can be interned as
+soon as it is loaded (intern_table), so its URL column is not held through
+the join.
+
+Each side is first reduced to one row per URL:
+- GSC: metrics aggregated as in sitemap_aggregate (or the last row wins)
+- Page Explorer: the last row wins
+In the output, rows are in order of first appearance (GSC rows, then Page
+Explorer-only rows), has_gsc/has_pe say which sides matched, columns a side
+lacks are zero-filled, and a column on both sides takes the Page Explorer
+value wherever there is one. This is exactly what updating a dict per URL,
+GSC first, produces; joined_records rebuilds those dicts when needed.
+"""
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from sitemap_aggregate import aggregate_gsc_groups
+from sitemap_ingest import GSC_COLUMNS
+from sitemap_urls import UrlDictionary, UrlStore, normalize_urls
+
+JOIN_FLAGS = ('has_gsc', 'has_pe')
+# Columns naming the URL, which the join replaces with its own url_id
+URL_KEYS = ('url', 'url_id')
+
+def group_rows(ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Group rows by id, numbering groups in order of first appearance.
+
+    Returns (groups, first, last): the group of each row, and the first and
+    last row of each group.
+    """
+    _, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    _, last_reversed = np.unique(ids[::-1], return_index=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.reshape(-1)], first[order], (len(ids) - 1 - last_reversed)[order]
+
+def _fill(n: int, dtype) -> np.ndarray:
+    """Column of n missing values: 0, False, or None for text."""
+    return np.full(n, None, dtype=object) if dtype == object else np.zeros(n, dtype=dtype)
+
+def intern_table(table: Dict[str, np.ndarray], urls: UrlDictionary) -> Dict[str, np.ndarray]:
+    """
+    The table with its url column replaced by url_id, the int32 ids of the
+    normalized URLs in urls. merge_tables takes interned tables as they are.
+    """
+    interned = {'url_id': urls.intern_many(normalize_urls(table['url']))}
+    interned.update((name, values) for name, values in table.items() if name != 'url')
+    return interned
+
+def _url_ids(table: Dict[str, np.ndarray], urls: UrlDictionary) -> np.ndarray:
+    return table['url_id'] if 'url_id' in table else urls.intern_many(normalize_urls(table['url']))
+
+def dedupe_last(table: Dict[str, np.ndarray], ids: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """One row per id, in order of first appearance, with the values of its last row."""
+    if not len(ids):
+        return {name: values for name, values in table.items() if name not in URL_KEYS}, ids
+    _, first, last = group_rows(ids)
+    return {name: values[last] for name, values in table.items() if name not in URL_KEYS}, ids[first]
+
+def dedupe_gsc(table: Dict[str, np.ndarray], ids: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    One row per id, in order of first appearance. Repeated URLs are aggregated
+    like combine_gsc_records (other columns from the last row); a URL seen once
+    keeps its row as is.
+    """
+    if not len(ids):
+        return dedupe_last(table, ids)
+    groups, first, last = group_rows(ids)
+    metrics = [col for col in GSC_COLUMNS if col in table]
+    aggregated = aggregate_gsc_groups(groups, len(first), table, metrics)
+    single = np.bincount(groups) == 1
+    reduced = {}
+    for name, values in table.items():
+        if name in URL_KEYS:
+            continue
+        if name in metrics:
+            column = aggregated[name]
+            column[single] = values[last[single]]
+            reduced[name] = column
+        else:
+            reduced[name] = values[last]
+    return reduced, ids[first]
+
+def outer_join(gsc: Dict[str, np.ndarray], gsc_ids: np.ndarray, pe: Dict[str, np.ndarray], pe_ids: np.ndarray,
+               id_count: int, stats: Dict[str, int] = None) -> Dict[str, np.ndarray]:
+    """
+    Full outer join of two deduplicated tables whose keys are distinct ids in
+    [0, id_count). If stats is given, it receives gsc_only, pe_only and both.
+    """
+    gsc_rows = len(gsc_ids)
+    position = np.full(id_count, -1, dtype=np.int64)
+    position[gsc_ids] = np.arange(gsc_rows)
+    matched = position[pe_ids]
+    pe_only = matched < 0
+    pe_only_count = int(np.count_nonzero(pe_only))
+    matched[pe_only] = gsc_rows + np.arange(pe_only_count)
+    n = gsc_rows + pe_only_count
+
+    merged = {'url_id': np.concatenate([gsc_ids, pe_ids[pe_only]]).astype(np.int32),
+              'has_gsc': np.zeros(n, dtype=bool), 'has_pe': np.zeros(n, dtype=bool)}
+    merged['has_gsc'][:gsc_rows] = True
+    merged['has_pe'][matched] = True
+    for name, values in gsc.items():
+        merged[name] = _fill(n, values.dtype)
+        merged[name][:gsc_rows] = values
+    for name, values in pe.items():
+        if name not in merged:
+            merged[name] = _fill(n, values.dtype)
+        merged[name][matched] = values
+
+    if stats is not None:
+        both = len(pe_ids) - pe_only_count
+        stats.update(gsc_only=gsc_rows - both, pe_only=pe_only_count, both=both)
+    return merged
+
+def merge_tables(gsc_table: Dict[str, np.ndarray], pe_table: Dict[str, np.ndarray], urls: UrlDictionary,
+                 aggregate_gsc: bool = True, stats: Dict[str, int] = None) -> Dict[str, np.ndarray]:
+    """
+    Join GSC and Page Explorer tables on the normalized URL.
+
+    Normalized URLs are interned into urls, unless a table was already
+    interned into it with intern_table. The result has one row per URL
+    with:
+    - url_id: int32 id into urls
+    - has_gsc / has_pe: which inputs contained the URL
+    - the GSC columns, aggregated for repeated URLs (or the last row wins
+      when aggregate_gsc is False)
+    - the Page Explorer columns, last row winning for repeated URLs
+    Values missing from an input are 0 (False for flags). stats receives the
+    overlap counts, as for outer_join.
+    """
+    gsc_ids = _url_ids(gsc_table, urls)
+    pe_ids = _url_ids(pe_table, urls)
+    gsc, gsc_ids = (dedupe_gsc if aggregate_gsc else dedupe_last)(gsc_table, gsc_ids)
+    pe, pe_ids = dedupe_last(pe_table, pe_ids)
+    return outer_join(gsc, gsc_ids, pe, pe_ids, len(urls), stats)
+
+def joined_records(merged: Dict[str, np.ndarray], urls: UrlStore,
+                   gsc_columns: Sequence[str], pe_columns: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    Dict per merged row, as merge by dict update would build it: 'url' (the
+    normalized URL), then the GSC columns if the URL was in GSC, then the Page
+    Explorer columns if it was in Page Explorer.
+    """
+    gsc_columns = [name for name in gsc_columns if name != 'url']
+    pe_columns = [name for name in pe_columns if name != 'url']
+    gsc_values = zip(*(merged[name].tolist() for name in gsc_columns)) if gsc_columns else None
+    pe_values = zip(*(merged[name].tolist() for name in pe_columns)) if pe_columns else None
+    records = []
+    for url, has_gsc, has_pe in zip(urls.lookup(merged['url_id'].tolist()),
+                                    merged['has_gsc'].tolist(), merged['has_pe'].tolist()):
+        record = {'url': url}
+        gsc_row = next(gsc_values) if gsc_values is not None else ()
+        pe_row = next(pe_values) if pe_values is not None else ()
+        if has_gsc:
+            record.update(zip(gsc_columns, gsc_row))
+        if has_pe:
+            record.update(zip(pe_columns, pe_row))
+        records.append(record)
+    return records
+
+def format_join_stats(stats: Dict[str, int]) -> str:
+    """One-line summary of outer_join overlap counts."""
+    return f"{stats['both']} in both, {stats['gsc_only']} GSC only, {stats['pe_only']} Page Explorer only"
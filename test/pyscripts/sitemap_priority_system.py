@@ -9,189 +9,211 @@ Steps:
 3. Calculate composite priority for each URL
 4. Cluster URLs by business logic
 5. Output protocol-compliant XML sitemaps and sitemap index
+
+main() runs the columnar path: URLs are interned once into a UrlDictionary
+(see sitemap_urls) and merge, scoring and clustering work on dense int32 ids
+and NumPy columns. After the merge the dictionary is swapped for a sorted
+FrontCodedUrls store and the ids remapped to positions in it; strings are
+resolved only when scoring, clustering and writing the sitemaps.
+Priorities are computed for the whole table at once by
+calculate_priority_batch (see sitemap_score), which gives exactly the
+values of calculate_priority. The patterns of the scoring model are found
+in one scan of the URL column (see sitemap_urls.PatternMatcher), and
+clusters come from the rule file cluster_rules.json, matched on path
+segments (see sitemap_rules). The record-based functions (merge_and_deduplicate, cluster_urls, ...) remain
+for callers that work with lists of dicts.
+
+With memory_budget set, main() hands over to main_external, which streams
+the inputs and merges and orders the URLs with sorted runs spilled to disk
+(see sitemap_external), producing the same sitemaps in bounded memory.
+
+With feature_store set, main() keeps each URL's inputs, priority and
+cluster between runs and recomputes only the URLs whose inputs changed
+(see sitemap_features).
 """
 
+import io
 import os
-import csv
-import re
+import shutil
 import xml.etree.ElementTree as ET
+from bisect import bisect_left
 from xml.dom import minidom
 from datetime import datetime
-from typing import List, Dict, Any
-from collections import defaultdict
-from urllib.parse import urlparse
+from typing import List, Dict, Any, Iterable, Tuple, Union
+from itertools import chain, groupby
+from operator import itemgetter
+
+import numpy as np
+
+from sitemap_ingest import (
+    DEFAULT_CHUNK_SIZE,
+    GSC_COLUMNS,
+    PE_COLUMNS,
+    empty_table,
+    expand_inputs,
+    filter_table,
+    format_diagnostics,
+    indexable_mask,
+    is_jsonl,
+    iter_input_chunks,
+    load_gsc_table,
+    load_page_explorer_table,
+    new_diagnostics,
+    records_to_table,
+    table_len,
+    table_to_records,
+)
+from sitemap_aggregate import date_mask
+from sitemap_cache import read_table, write_table
+from sitemap_external import DEFAULT_MEMORY_BUDGET, SpillSorter, external_merge
+from sitemap_features import feature_key, format_rescore_stats, rescore_changed
+from sitemap_join import format_join_stats, intern_table, joined_records, merge_tables
+from sitemap_rules import compile_rules
+from sitemap_score import ScoringModelSource, breakdown_records, calculate_priority_batch, compile_model
+from sitemap_select import bucket_order, group_bounds, quantize
+from sitemap_urls import UrlColumn, UrlDictionary, UrlStore, UrlText
 
 # 1. Data Loading
 
-def load_gsc_data(gsc_path: str) -> List[Dict[str, Any]]:
-    """Load Google Search Console data from CSV. Expects columns: url, clicks, impressions, ctr, position."""
-    data = []
+def read_gsc_table(gsc_path, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1,
+                   cache_dir: str = None, incremental: bool = False,
+                   start_date: str = None, end_date: str = None,
+                   diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """Columnar form of load_gsc_data; an empty table if loading fails."""
     try:
-        with open(gsc_path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                url = row.get('url') or row.get('URL')
-                if not url:
-                    continue
-                data.append({
-                    'url': url.strip(),
-                    'clicks': float(row.get('clicks', 0)),
-                    'impressions': float(row.get('impressions', 0)),
-                    'ctr': float(row.get('ctr', 0)),
-                    'position': float(row.get('position', 0)),
-                })
+        return load_gsc_table(gsc_path, chunk_size, workers, cache_dir, incremental, start_date, end_date,
+                              diagnostics)
     except Exception as e:
         print(f"Error loading GSC data: {e}")
-    return data
+        return empty_table(GSC_COLUMNS)
 
-def load_page_explorer_data(pe_path: str) -> List[Dict[str, Any]]:
-    """Load Page Explorer data from CSV. Expects columns: url, importance, depth, internal_links, health."""
-    data = []
+def read_page_explorer_table(pe_path, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1,
+                             cache_dir: str = None, indexable_only: bool = False,
+                             diagnostics: Dict[str, Any] = None) -> Dict[str, np.ndarray]:
+    """Columnar form of load_page_explorer_data; an empty table if loading fails."""
     try:
-        with open(pe_path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                url = row.get('url') or row.get('URL')
-                if not url:
-                    continue
-                data.append({
-                    'url': url.strip(),
-                    'importance': float(row.get('importance', 0)),
-                    'depth': float(row.get('depth', 0)),
-                    'internal_links': float(row.get('internal_links', 0)),
-                    'health': float(row.get('health', 0)),
-                })
+        table = load_page_explorer_table(pe_path, chunk_size, workers, cache_dir, diagnostics=diagnostics)
+        if indexable_only:
+            table = filter_table(table, indexable_mask(table))
+        return table
     except Exception as e:
         print(f"Error loading Page Explorer data: {e}")
-    return data
+        return empty_table(PE_COLUMNS)
+
+def load_gsc_data(gsc_path, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1,
+                  cache_dir: str = None, incremental: bool = False,
+                  start_date: str = None, end_date: str = None,
+                  diagnostics: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """
+    Load Google Search Console data from CSV. Expects columns: url, clicks, impressions, ctr, position.
 
-# Helper: Normalize URL for deduplication
+    gsc_path may be a plain, compressed or Excel file, a glob pattern, or a directory of shards.
+    JSON Lines dumps (.jsonl/.ndjson) are aggregated to one row per page while reading.
+    Set cache_dir to reuse parsed tables across runs, and incremental to parse
+    only rows appended since the previous run. start_date/end_date (inclusive,
+    YYYY-MM-DD) aggregate a multi-date export to one row per URL over that window.
+    Pass a diagnostics dict (see sitemap_ingest.new_diagnostics) to collect
+    counts and samples of skipped or unparseable rows.
+    """
+    return table_to_records(read_gsc_table(gsc_path, chunk_size, workers, cache_dir, incremental,
+                                           start_date, end_date, diagnostics))
 
-def normalize_url(url: str) -> str:
-    """Normalize URL for deduplication (lowercase, strip trailing slash, remove fragments/query)."""
-    try:
-        parsed = urlparse(url)
-        clean = parsed._replace(query='', fragment='').geturl()
-        if clean.endswith('/') and clean != parsed.scheme + '://' + parsed.netloc + '/':
-            clean = clean[:-1]
-        return clean.lower()
-    except Exception:
-        return url.lower().rstrip('/')
+def load_page_explorer_data(pe_path, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1,
+                            cache_dir: str = None, indexable_only: bool = False,
+                            diagnostics: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """
+    Load Page Explorer data from CSV. Expects columns: url, importance, depth, internal_links, health.
+
+    pe_path may be a plain, compressed or Excel file, a glob pattern, or a directory of shards.
+    The wide tab-separated Page Explorer export is also accepted; its status and
+    indexable flags are kept, and indexable_only drops non-indexable or non-200 rows.
+    Set cache_dir to reuse parsed tables across runs. diagnostics is filled as
+    for load_gsc_data.
+    """
+    return table_to_records(read_page_explorer_table(pe_path, chunk_size, workers, cache_dir,
+                                                     indexable_only, diagnostics))
 
 # 2. Data Merging & Deduplication
 
-def merge_and_deduplicate(gsc_data, pe_data) -> List[Dict[str, Any]]:
-    """Merge GSC and Page Explorer data, deduplicate by normalized URL, and combine metrics."""
-    merged = defaultdict(dict)
-    # Index GSC data
-    for entry in gsc_data:
-        norm = normalize_url(entry['url'])
-        merged[norm].update(entry)
-    # Index Page Explorer data
-    for entry in pe_data:
-        norm = normalize_url(entry['url'])
-        merged[norm].update(entry)
-    # Add normalized URL as canonical key
-    result = []
-    for norm_url, data in merged.items():
-        data['url'] = norm_url
-        result.append(data)
-    return result
+def merge_and_deduplicate(gsc_data, pe_data, stats: Dict[str, int] = None) -> List[Dict[str, Any]]:
+    """
+    Merge GSC and Page Explorer data, deduplicate by normalized URL, and combine metrics.
+
+    GSC rows that share a normalized URL (e.g. one row per day) are aggregated:
+    clicks and impressions summed, CTR recomputed, position impression-weighted.
+    The records are joined as tables (see sitemap_join.merge_tables); stats
+    receives the gsc_only / pe_only / both overlap counts.
+    """
+    gsc_table = records_to_table(gsc_data)
+    pe_table = records_to_table(pe_data)
+    urls = UrlDictionary()
+    merged = merge_tables(gsc_table, pe_table, urls, stats=stats)
+    return joined_records(merged, urls, list(gsc_table), list(pe_table))
 
 # 3. Priority Calculation
 
-def calculate_priority(url_entry: Dict[str, Any]) -> float:
+def calculate_priority(url_entry: Dict[str, Any], model: ScoringModelSource = None) -> float:
     """
     Calculate composite priority using GSC, Page Explorer, and business logic factors.
     
-    Priority Formula:
+    Priority Formula (the default scoring model, scoring_model.json):
     - GSC Performance (40%): clicks, impressions, CTR, position
     - Page Explorer Metrics (40%): importance, depth, internal links, health
     - Business Logic (20%): homepage boost, TLD priority, content type
-    """
-    priority = 0.0
-    
-    # GSC Performance Score (40% weight)
-    gsc_score = 0.0
-    if 'clicks' in url_entry and 'impressions' in url_entry:
-        # Normalize clicks (0-1 scale)
-        clicks = url_entry.get('clicks', 0)
-        impressions = url_entry.get('impressions', 0)
-        ctr = url_entry.get('ctr', 0)
-        position = url_entry.get('position', 0)
-        
-        # Click rate score (higher is better)
-        if impressions > 0:
-            click_rate = clicks / impressions
-            gsc_score += click_rate * 0.3
-        
-        # CTR score (higher is better)
-        gsc_score += min(ctr, 1.0) * 0.3
-        
-        # Position score (lower position is better)
-        if position > 0:
-            position_score = max(0, 1 - (position / 100))  # Normalize to 0-1
-            gsc_score += position_score * 0.4
-    
-    # Page Explorer Score (40% weight)
-    pe_score = 0.0
-    if 'importance' in url_entry:
-        importance = url_entry.get('importance', 0)
-        depth = url_entry.get('depth', 0)
-        internal_links = url_entry.get('internal_links', 0)
-        health = url_entry.get('health', 0)
-        
-        # Importance score (0-1)
-        pe_score += min(importance / 100, 1.0) * 0.4
-        
-        # Depth score (shallow pages are better)
-        if depth > 0:
-            depth_score = max(0, 1 - (depth / 10))  # Normalize to 0-1
-            pe_score += depth_score * 0.2
-        
-        # Internal links score (more links = better)
-        if internal_links > 0:
-            links_score = min(internal_links / 100, 1.0)  # Cap at 100 links
-            pe_score += links_score * 0.2
-        
-        # Health score (0-1)
-        pe_score += min(health / 100, 1.0) * 0.2
-    
-    # Business Logic Score (20% weight)
-    business_score = 0.0
-    url = url_entry.get('url', '').lower()
-    
-    # Homepage boost
-    if url.endswith('/') or url.endswith('/index.html') or url.endswith('/index.php'):
-        business_score += 0.5
-    
-    # TLD pages boost
-    if '/tld/' in url or '/domains/' in url:
-        business_score += 0.3
-    
-    # Blog content boost
-    if '/blog/' in url:
-        business_score += 0.2
-    
-    # Support content boost
-    if '/support/' in url:
-        business_score += 0.1
     
-    # Tools boost
-    if any(tool in url for tool in ['/whois', '/ssl-check', '/dns-check']):
-        business_score += 0.2
-    
-    # Cap business score at 1.0
-    business_score = min(business_score, 1.0)
-    
-    # Calculate final weighted priority
-    priority = (gsc_score * 0.4) + (pe_score * 0.4) + (business_score * 0.2)
-    
-    # Ensure priority is between 0.1 and 1.0
-    return max(0.1, min(1.0, priority))
+    Pass model (a dict, a model file or a ScoringModel) to score with other weights.
+    """
+    return compile_model(model).score(url_entry)
+
+def url_text(merged: Dict[str, np.ndarray], urls: Union[UrlStore, UrlText]) -> UrlText:
+    """UrlText over the URLs of a merge_tables result, in row order, built from the store's bytes."""
+    return urls if isinstance(urls, UrlText) else UrlText(urls.column(merged['url_id']))
+
+def score_table(merged: Dict[str, np.ndarray], urls: Union[UrlStore, UrlText],
+                model: ScoringModelSource = None, components: Dict[str, np.ndarray] = None) -> np.ndarray:
+    """
+    Priority of every row of a merge_tables result, as float64 (see
+    sitemap_score); components receives the float32 component scores.
+    """
+    return calculate_priority_batch(merged, url_text(merged, urls), model, components)
+
+def write_score_breakdown(breakdown_dir: str, merged: Dict[str, np.ndarray], urls: UrlStore,
+                          priority: np.ndarray, components: Dict[str, np.ndarray]):
+    """
+    Persist each row's priority and component scores in URL order (see
+    sitemap_cache.write_table), replacing an earlier breakdown. urls must
+    be the sorted store main() ends up with, so that url_id is URL order.
+    """
+    order = np.argsort(merged['url_id'], kind='stable')
+    table = {'url': urls.column(merged['url_id'][order]), 'priority': priority[order]}
+    table.update((name, values[order]) for name, values in components.items())
+    if os.path.isdir(breakdown_dir):
+        shutil.rmtree(breakdown_dir)
+    write_table(breakdown_dir, table)
+
+def read_score_breakdown(breakdown_dir: str, start: str = None, stop: str = None) -> List[Dict[str, Any]]:
+    """
+    Priority and component scores of the URLs in [start, stop) (None:
+    unbounded) from a write_score_breakdown directory, in URL order. All
+    columns are memory-mapped: the range is found by binary search over the
+    URLs, and only the range is read.
+    """
+    table = read_table(breakdown_dir)
+    urls = table.pop('url')
+    priority = table.pop('priority')
+    lo = bisect_left(urls, start) if start is not None else 0
+    hi = bisect_left(urls, stop) if stop is not None else len(urls)
+    hi = max(lo, hi)
+    return breakdown_records(urls[lo:hi].tolist(), np.asarray(priority[lo:hi]),
+                             {name: np.asarray(values[lo:hi]) for name, values in table.items()})
 
 # 4. Clustering/Structuring
 
+# A URL goes to the first cluster whose rules match its path, else to misc
+# (cluster_rules.json, shared with the API and the restructure scripts)
+CLUSTER_RULES = compile_rules()
+CLUSTER_NAMES = CLUSTER_RULES.names
+
 def assign_cluster(url: str, metadata: Dict[str, Any]) -> str:
     """
     Assign a URL to a cluster based on patterns and business logic.
@@ -204,48 +226,66 @@ def assign_cluster(url: str, metadata: Dict[str, Any]) -> str:
     - seo: SEO/service pages
     - misc: Everything else
     """
-    url_lower = url.lower()
-    
-    # Blog content
-    if '/blog/' in url_lower:
-        return 'blog'
-    
-    # Support content
-    if '/support/' in url_lower or '/help/' in url_lower:
-        return 'support'
-    
-    # TLD pages
-    if '/tld/' in url_lower or re.match(r'/domains/[^/]+/?$', url_lower):
-        return 'tlds'
-    
-    # Tools
-    if any(tool in url_lower for tool in ['/whois', '/ssl-check', '/dns-check', '/tool']):
-        return 'tools'
-    
-    # SEO/Service pages
-    if any(pattern in url_lower for pattern in ['/domain-', '/broker', '/marketplace', '/service']):
-        return 'seo'
-    
-    # Default to misc
-    return 'misc'
+    return CLUSTER_RULES.assign(url)
+
+def cluster_codes(text: UrlText) -> np.ndarray:
+    """assign_cluster for a column of URLs, as int8 indexes into CLUSTER_NAMES."""
+    return CLUSTER_RULES.codes(text)
 
 def cluster_urls(urls: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
     """Group URLs into clusters for separate sitemaps."""
-    clusters = defaultdict(list)
-    
-    for url_entry in urls:
-        url = url_entry.get('url', '')
-        cluster = assign_cluster(url, url_entry)
-        clusters[cluster].append(url_entry)
+    codes = cluster_codes(UrlText([url_entry.get('url', '') for url_entry in urls])).tolist()
+    names = [CLUSTER_NAMES[code] for code in codes]
+    clusters = {name: [] for name in names}
     
-    # Sort each cluster by priority (highest first)
-    for cluster_name, cluster_urls in clusters.items():
-        clusters[cluster_name] = sorted(cluster_urls, key=lambda x: x.get('priority', 0), reverse=True)
+    # One bucket sort by written priority (highest first, ties in input order) orders every cluster
+    priority = np.array([url_entry.get('priority', 0) for url_entry in urls], dtype=np.float64)
+    for i in bucket_order(priority, PRIORITY_DECIMALS).tolist():
+        clusters[names[i]].append(urls[i])
     
-    return dict(clusters)
+    return clusters
+
+def cluster_table(merged: Dict[str, np.ndarray], priority: np.ndarray,
+                  urls: Union[UrlStore, UrlText]) -> Dict[str, np.ndarray]:
+    """
+    Columnar cluster_urls: row indices of each cluster, highest written
+    priority first (ties keep merge order), with clusters in order of first
+    appearance.
+    """
+    return cluster_rows(cluster_codes(url_text(merged, urls)), priority)
+
+def cluster_rows(codes: np.ndarray, priority: np.ndarray) -> Dict[str, np.ndarray]:
+    """cluster_table for precomputed cluster_codes, from one bucket sort (see sitemap_select)."""
+    present, first_rows = np.unique(codes, return_index=True)
+    rows = bucket_order(priority, PRIORITY_DECIMALS, codes)
+    bounds = group_bounds(codes[rows])
+    return {CLUSTER_NAMES[code]: rows[bounds[code]:bounds[code + 1]]
+            for code in present[np.argsort(first_rows)].tolist()}
+
+def cluster_records(merged: Dict[str, np.ndarray], priority: np.ndarray, rows: np.ndarray,
+                    urls: UrlStore) -> List[Dict[str, Any]]:
+    """Resolve the given rows to the url/priority entries written to a sitemap."""
+    return [{'url': url, 'priority': value}
+            for url, value in zip(urls.lookup(merged['url_id'][rows].tolist()), priority[rows].tolist())]
 
 # 5. XML Sitemap Output
 
+# Priorities are written with this many decimals, and URLs ordered by the written value
+PRIORITY_DECIMALS = 2
+
+def cluster_changefreq(cluster_name: str) -> str:
+    """Sitemap changefreq for a cluster."""
+    if cluster_name == 'blog':
+        return 'weekly'
+    elif cluster_name == 'support':
+        return 'weekly'
+    elif cluster_name == 'tools':
+        return 'monthly'
+    elif cluster_name == 'tlds':
+        return 'monthly'
+    else:
+        return 'monthly'
+
 def write_xml_sitemap(cluster_name: str, urls: List[Dict[str, Any]], output_dir: str):
     """Write a protocol-compliant XML sitemap for a cluster."""
     if not urls:
@@ -273,21 +313,12 @@ def write_xml_sitemap(cluster_name: str, urls: List[Dict[str, Any]], output_dir:
         
         # Change frequency (based on content type)
         changefreq_elem = ET.SubElement(url_elem, 'changefreq')
-        if cluster_name == 'blog':
-            changefreq_elem.text = 'weekly'
-        elif cluster_name == 'support':
-            changefreq_elem.text = 'weekly'
-        elif cluster_name == 'tools':
-            changefreq_elem.text = 'monthly'
-        elif cluster_name == 'tlds':
-            changefreq_elem.text = 'monthly'
-        else:
-            changefreq_elem.text = 'monthly'
+        changefreq_elem.text = cluster_changefreq(cluster_name)
         
         # Priority
         priority_elem = ET.SubElement(url_elem, 'priority')
         priority = url_entry.get('priority', 0.5)
-        priority_elem.text = f"{priority:.2f}"
+        priority_elem.text = f"{priority:.{PRIORITY_DECIMALS}f}"
     
     # Pretty print XML
     rough_string = ET.tostring(urlset, 'unicode')
@@ -301,6 +332,41 @@ def write_xml_sitemap(cluster_name: str, urls: List[Dict[str, Any]], output_dir:
     
     print(f"Created {cluster_name}-sitemap.xml with {len(urls)} URLs")
 
+def _xml_text(text: str) -> str:
+    """Text content escaped exactly as minidom's pretty printer writes it."""
+    node = minidom.Text()
+    node.data = text
+    writer = io.StringIO()
+    node.writexml(writer)
+    return writer.getvalue()
+
+def stream_xml_sitemap(cluster_name: str, entries: Iterable[Tuple[str, float]], output_dir: str) -> int:
+    """
+    write_xml_sitemap for a stream of (url, priority) pairs. The file is written
+    entry by entry, byte for byte as write_xml_sitemap would write it, without
+    building the XML tree. Returns the number of URLs written.
+    """
+    entries = iter(entries)
+    first = next(entries, None)
+    if first is None:
+        print(f"No URLs for cluster: {cluster_name}")
+        return 0
+    os.makedirs(output_dir, exist_ok=True)
+    lastmod = datetime.now().strftime('%Y-%m-%d')
+    changefreq = cluster_changefreq(cluster_name)
+    count = 0
+    output_file = os.path.join(output_dir, f"{cluster_name}-sitemap.xml")
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" ?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for url, priority in chain([first], entries):
+            loc = f"<loc>{_xml_text(url)}</loc>" if url else "<loc/>"
+            f.write(f"  <url>\n    {loc}\n    <lastmod>{lastmod}</lastmod>\n"
+                    f"    <changefreq>{changefreq}</changefreq>\n    <priority>{priority:.{PRIORITY_DECIMALS}f}</priority>\n  </url>\n")
+            count += 1
+        f.write('</urlset>\n')
+    print(f"Created {cluster_name}-sitemap.xml with {count} URLs")
+    return count
+
 def write_sitemap_index(sitemap_files: List[str], output_dir: str):
     """Write a sitemap index referencing all cluster sitemaps."""
     # Create output directory if it doesn't exist
@@ -335,49 +401,207 @@ def write_sitemap_index(sitemap_files: List[str], output_dir: str):
 
 # Main Orchestration
 
-def main(gsc_path: str, pe_path: str, output_dir: str):
-    """Orchestrate the full pipeline from data loading to sitemap output."""
+def main(gsc_path: str, pe_path: str, output_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+         workers: int = 1, cache_dir: str = None, incremental: bool = False,
+         indexable_only: bool = False, start_date: str = None, end_date: str = None,
+         memory_budget: int = None, spill_dir: str = None, scoring_model: ScoringModelSource = None,
+         feature_store: str = None, breakdown_dir: str = None):
+    """
+    Orchestrate the full pipeline from data loading to sitemap output.
+
+    scoring_model is a scoring model file or dict (see sitemap_score); the
+    default model when None. With feature_store (a directory) set, each
+    URL's inputs and results are kept there and only URLs whose inputs
+    changed since the last run are scored and clustered again (see
+    sitemap_features). With breakdown_dir set, each URL's component scores
+    are written there next to its priority (see read_score_breakdown). With
+    memory_budget (bytes) set, runs main_external instead.
+    """
+    if memory_budget is not None:
+        return main_external(gsc_path, pe_path, output_dir, memory_budget, spill_dir, chunk_size,
+                             indexable_only, start_date, end_date, scoring_model)
     print("Starting Sitemap Priority System...")
     
     # 1. Load data
     print("Loading GSC data...")
-    gsc_data = load_gsc_data(gsc_path)
-    print(f"Loaded {len(gsc_data)} GSC URLs")
+    gsc_diagnostics = new_diagnostics()
+    # Each table's URLs are interned as soon as it is loaded, so its URL column is not held any longer
+    urls = UrlDictionary()
+    gsc_table = read_gsc_table(gsc_path, chunk_size, workers, cache_dir, incremental,
+                               start_date, end_date, gsc_diagnostics)
+    print(f"Loaded {table_len(gsc_table)} GSC URLs ({format_diagnostics(gsc_diagnostics)})")
+    gsc_table = intern_table(gsc_table, urls)
     
     print("Loading Page Explorer data...")
-    pe_data = load_page_explorer_data(pe_path)
-    print(f"Loaded {len(pe_data)} Page Explorer URLs")
+    pe_diagnostics = new_diagnostics()
+    pe_table = read_page_explorer_table(pe_path, chunk_size, workers, cache_dir, indexable_only, pe_diagnostics)
+    print(f"Loaded {table_len(pe_table)} Page Explorer URLs ({format_diagnostics(pe_diagnostics)})")
+    pe_table = intern_table(pe_table, urls)
     
-    # 2. Merge/deduplicate
+    # 2. Merge/deduplicate (later steps work on ids)
     print("Merging and deduplicating data...")
-    merged = merge_and_deduplicate(gsc_data, pe_data)
-    print(f"Merged into {len(merged)} unique URLs")
-    
-    # 3. Calculate priority
+    overlap = {}
+    merged = merge_tables(gsc_table, pe_table, urls, stats=overlap)
+    # The rows' URL bytes, copied from the arena for matching; no str per URL is built
+    column = urls.column(merged['url_id'])
+    urls, rank = urls.front_coded()
+    merged['url_id'] = rank[merged['url_id']]
+    print(f"Merged into {table_len(merged)} unique URLs ({format_join_stats(overlap)})")
+    
+    # 3. Calculate priority (the URLs are lowercased once for the model's patterns and the cluster rules)
     print("Calculating priorities...")
-    for entry in merged:
-        entry['priority'] = calculate_priority(entry)
+    model = compile_model(scoring_model)
+    components = {} if breakdown_dir is not None else None
+    if feature_store is None:
+        text = UrlText(column)
+        priority = score_table(merged, text, model, components)
+        codes = cluster_codes(text)
+    else:
+        priority, codes = rescore_table(merged, column, model, feature_store, components)
+    if breakdown_dir is not None:
+        write_score_breakdown(breakdown_dir, merged, urls, priority, components)
+        print(f"  Score breakdown ({', '.join(components)}) written to {breakdown_dir}")
     
     # 4. Cluster
     print("Clustering URLs...")
-    clusters = cluster_urls(merged)
+    clusters = cluster_rows(codes, priority)
     
     # Print cluster statistics
-    for cluster_name, urls_in_cluster in clusters.items():
-        avg_priority = sum(u.get('priority', 0) for u in urls_in_cluster) / len(urls_in_cluster)
-        print(f"  {cluster_name}: {len(urls_in_cluster)} URLs, avg priority: {avg_priority:.3f}")
+    for cluster_name, rows in clusters.items():
+        avg_priority = sum(priority[rows].tolist()) / len(rows)
+        print(f"  {cluster_name}: {len(rows)} URLs, avg priority: {avg_priority:.3f}")
     
-    # 5. Output XML sitemaps
+    # 5. Output XML sitemaps (URL strings are resolved here)
     print("Generating XML sitemaps...")
     sitemap_files = []
-    for cluster, urls in clusters.items():
-        write_xml_sitemap(cluster, urls, output_dir)
+    for cluster, rows in clusters.items():
+        write_xml_sitemap(cluster, cluster_records(merged, priority, rows, urls), output_dir)
         sitemap_files.append(f"{cluster}-sitemap.xml")
     
     write_sitemap_index(sitemap_files, output_dir)
     
     print(f"Complete! Generated {len(sitemap_files)} sitemaps in {output_dir}")
 
+def rescore_table(merged: Dict[str, np.ndarray], url_column: UrlColumn, model: ScoringModelSource,
+                  store_dir: str, components: Dict[str, np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    score_table and cluster_codes for the rows whose inputs changed since the
+    last run with the same store_dir; the other rows keep their stored
+    results, component scores included. url_column holds the URL of each
+    row. Models with normalized terms are fitted on the whole table first,
+    so a shift in the fitted statistics re-scores every row.
+    """
+    model = compile_model(model)
+    if model.needs_fit:
+        model = model.fit(merged)
+
+    def compute(rows):
+        text = UrlText(url_column[rows])
+        scores = {}
+        priority = score_table(filter_table(merged, rows), text, model, scores)
+        outputs = {'priority': priority, 'cluster': cluster_codes(text)}
+        outputs.update((f"score_{name}", values) for name, values in scores.items())
+        return outputs
+
+    stats = {}
+    key = feature_key(model.digest, CLUSTER_RULES.digest)
+    outputs = rescore_changed(merged, url_column, compute, key, store_dir, stats)
+    print(f"  {format_rescore_stats(stats)}")
+    if components is not None:
+        components.update((name, outputs[f"score_{name}"]) for name in model.names)
+    return outputs['priority'], outputs['cluster']
+
+def _guarded_chunks(chunks: Iterable[Dict[str, np.ndarray]], label: str) -> Iterable[Dict[str, np.ndarray]]:
+    """Pass chunks through; a loading error ends the stream, as read_gsc_table returns an empty table."""
+    try:
+        yield from chunks
+    except Exception as e:
+        print(f"Error loading {label} data: {e}")
+
+def _window_chunks(chunks: Iterable[Dict[str, np.ndarray]], start_date: str = None,
+                   end_date: str = None) -> Iterable[Dict[str, np.ndarray]]:
+    for chunk in chunks:
+        if 'date' not in chunk:
+            raise ValueError("A date window needs a 'date' column in the GSC input")
+        yield filter_table(chunk, date_mask(chunk['date'], start_date, end_date))
+
+def main_external(gsc_path: str, pe_path: str, output_dir: str, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                  spill_dir: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE, indexable_only: bool = False,
+                  start_date: str = None, end_date: str = None, scoring_model: ScoringModelSource = None):
+    """
+    main() within a memory budget, for inputs whose merged URL set does not fit in RAM.
+
+    The inputs are streamed into external_merge; merged chunks are scored and
+    clustered as they arrive, and the (cluster, priority) ordering is done by
+    a second SpillSorter. Each sorter gets half of memory_budget. The
+    sitemaps are the same as main() writes. Parsed-table caching,
+    incremental loading and the feature store are not used in this mode,
+    and a scoring model with normalized terms must already be fitted, as
+    chunks are scored before the whole table has been seen.
+    """
+    print(f"Starting Sitemap Priority System (memory budget {memory_budget >> 20} MB)...")
+    model = compile_model(scoring_model)
+    if model.needs_fit:
+        raise ValueError("Normalized scoring terms need the whole table; pass a fitted model (ScoringModel.fit)")
+    windowed = start_date is not None or end_date is not None
+    gsc_diagnostics = new_diagnostics()
+    pe_diagnostics = new_diagnostics()
+    gsc_chunks = iter_input_chunks(gsc_path, GSC_COLUMNS + (('date',) if windowed else ()), chunk_size,
+                                   diagnostics=gsc_diagnostics)
+    if windowed:
+        gsc_chunks = _window_chunks(gsc_chunks, start_date, end_date)
+    pe_chunks = iter_input_chunks(pe_path, PE_COLUMNS, chunk_size, diagnostics=pe_diagnostics)
+    if indexable_only:
+        pe_chunks = (filter_table(chunk, indexable_mask(chunk)) for chunk in pe_chunks)
+    # Windowed and JSON Lines GSC exports are aggregated per page while loading
+    aggregate_single = windowed or any(is_jsonl(path) for path in expand_inputs(gsc_path))
+
+    # 1-4. Load, merge, score and cluster chunk by chunk
+    print("Loading, merging and scoring data...")
+    overlap = {}
+    cluster_seq = {}
+    half = max(memory_budget // 2, 1)
+    with SpillSorter(half, spill_dir=spill_dir) as ordered:
+        for chunk in external_merge(_guarded_chunks(gsc_chunks, 'GSC'), _guarded_chunks(pe_chunks, 'Page Explorer'),
+                                    GSC_COLUMNS, PE_COLUMNS, half, aggregate_single=aggregate_single,
+                                    chunk_size=chunk_size, spill_dir=spill_dir, stats=overlap):
+            text = UrlText(chunk['url'])
+            priority = score_table(chunk, text, model)
+            written = quantize(priority, PRIORITY_DECIMALS).tolist()
+            clusters = cluster_codes(text).tolist()
+            for url, seq, value, key, code in zip(text.urls, chunk['first_seq'].tolist(), priority.tolist(),
+                                                  written, clusters):
+                cluster = CLUSTER_NAMES[code]
+                if seq < cluster_seq.get(cluster, seq + 1):
+                    cluster_seq[cluster] = seq
+                ordered.add((cluster, -key, seq, url, value))
+        print(f"Loaded GSC data ({format_diagnostics(gsc_diagnostics)})")
+        print(f"Loaded Page Explorer data ({format_diagnostics(pe_diagnostics)})")
+        print(f"Merged into {sum(overlap.get(name, 0) for name in ('both', 'gsc_only', 'pe_only'))} unique URLs "
+              f"({format_join_stats(overlap) if overlap else 'no rows'}; {overlap.get('runs', 0)} sorted runs spilled)")
+
+        # 5. Output XML sitemaps, one cluster at a time in priority order
+        print("Generating XML sitemaps...")
+        totals = {}
+        for cluster, rows in groupby(ordered, key=itemgetter(0)):
+            total = [0.0]
+            def entries(rows=rows, total=total):
+                for row in rows:
+                    total[0] += row[4]
+                    yield row[3], row[4]
+            count = stream_xml_sitemap(cluster, entries(), output_dir)
+            totals[cluster] = (count, total[0])
+
+    sitemap_files = []
+    for cluster in sorted(cluster_seq, key=cluster_seq.get):
+        count, total = totals[cluster]
+        print(f"  {cluster}: {count} URLs, avg priority: {total / count:.3f}")
+        sitemap_files.append(f"{cluster}-sitemap.xml")
+
+    write_sitemap_index(sitemap_files, output_dir)
+
+    print(f"Complete! Generated {len(sitemap_files)} sitemaps in {output_dir}")
+
 if __name__ == "__main__":
     # Example usage (paths to be set by user)
     main(
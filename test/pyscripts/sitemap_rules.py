@@ -0,0 +1,209 @@
+"""
+Sitemap Rules
+-------------
+URL classification (sitemap clusters, URL categories) driven by a
+declarative rule set.
+
+A rule set (cluster_rules.json next to this file by default; JSON, or YAML
+with PyYAML installed) lists named rules in order and a default name. A
+URL gets the name of the first rule it matches, else the default. A rule
+matches on
+  - paths: path patterns, found at the start of any segment of the
+    lowercased URL's path (sitemap_urls.url_path: no host, query or
+    fragment). '/blog/' is a segment 'blog' followed by more of the path,
+    '/tool*' a segment starting with 'tool', '/broker' exactly the segment
+    'broker'; a pattern can span segments ('/domains/com/')
+  - regex: regular expressions searched in the lowercased path, for what
+    path patterns cannot say (anchors, wildcard segments). An entry is a
+    pattern, or {"pattern": ..., "requires": <path pattern>} to try the
+    expression only on paths that match the path pattern.
+
+The path patterns of a rule set are compiled into one trie over the bytes
+of their segments (a sitemap_urls.PatternMatcher), walked from the start
+of each segment of a path. A walk reads at most the longest pattern, so a
+lookup is O(path length). A UrlText column is matched at once, walking from
+every segment start in its buffer with NumPy, and gives int8 codes
+(indexes into names); regular expressions then run only on the rows that
+no earlier rule took and that match their requires pattern.
+
+compile_rules caches compiled rule sets like sitemap_score.compile_model.
+"""
+
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+
+from sitemap_urls import PatternMatcher, UrlText, url_path
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cluster_rules.json')
+RULES_CACHE_SIZE = 32
+RULE_SET_KEYS = {'rules', 'default'}
+RULE_KEYS = {'name', 'paths', 'regex'}
+REGEX_KEYS = {'pattern', 'requires'}
+# Codes are int8, and the default takes the code after the last rule
+MAX_RULES = np.iinfo(np.int8).max
+
+_COMPILED = {}
+
+def load_rules(path: str = DEFAULT_RULES_PATH) -> Dict[str, Any]:
+    """Read a rule set from a .json, .yaml or .yml file."""
+    with open(path, encoding='utf-8') as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML rule sets requires the PyYAML package")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def rules_digest(rules: Dict[str, Any]) -> str:
+    """Hash of a rule set's content, independent of key order."""
+    canonical = json.dumps(rules, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+def path_needles(pattern: str) -> Tuple[List[str], List[str]]:
+    """
+    The PatternMatcher contains and suffix patterns, matched from a segment
+    start, that a path pattern stands for.
+    """
+    body = pattern[1:] if pattern.startswith('/') else ''
+    if (not body or not body.isascii() or body != body.lower() or '//' in body or
+            any(char in body for char in '?#\n\t\r ') or '*' in body[:-1] or body == '*' or body.endswith('/*')):
+        raise ValueError(f"Path patterns are lowercase ASCII segments after a '/', "
+                         f"optionally ending in '/' or '*': {pattern!r}")
+    if body.endswith('*'):
+        return [body[:-1]], []
+    if body.endswith('/'):
+        return [body], []
+    return [body + '/'], [body]
+
+def _regex_entry(entry: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    return dict(entry) if isinstance(entry, dict) else {'pattern': entry}
+
+def _check_keys(kind: str, spec: Dict[str, Any], allowed: set):
+    unknown = set(spec) - allowed
+    if unknown:
+        raise ValueError(f"Unknown {kind} keys in rule set: {', '.join(sorted(unknown))}")
+
+def check_rules(rules: Dict[str, Any]):
+    """Raise ValueError if rules is not a well-formed rule set."""
+    _check_keys('rule set', rules, RULE_SET_KEYS)
+    if 'default' not in rules or not rules.get('rules'):
+        raise ValueError("A rule set needs rules and a default")
+    if len(rules['rules']) > MAX_RULES:
+        raise ValueError(f"A rule set has at most {MAX_RULES} rules")
+    names = [rule.get('name') for rule in rules['rules']] + [rules['default']]
+    if None in names or len(set(names)) != len(names):
+        raise ValueError("Every rule needs a name, distinct from the other rules' and the default")
+    for rule in rules['rules']:
+        _check_keys('rule', rule, RULE_KEYS)
+        if not rule.get('paths') and not rule.get('regex'):
+            raise ValueError(f"Rule {rule['name']!r} needs paths or regex patterns")
+        for pattern in rule.get('paths', ()):
+            path_needles(pattern)
+        for entry in rule.get('regex', ()):
+            entry = _regex_entry(entry)
+            _check_keys('regex', entry, REGEX_KEYS)
+            try:
+                re.compile(entry.get('pattern'))
+            except (re.error, TypeError) as e:
+                raise ValueError(f"Bad regex in rule {rule['name']!r}: {e}")
+            if 'requires' in entry:
+                path_needles(entry['requires'])
+
+class UrlRules:
+    """A checked rule set, ready to classify URLs or columns of them."""
+
+    def __init__(self, rules: Dict[str, Any]):
+        check_rules(rules)
+        self.rules = json.loads(json.dumps(rules))
+        self.digest = rules_digest(rules)
+        self.names = [rule['name'] for rule in self.rules['rules']] + [self.rules['default']]
+        self.default = len(self.names) - 1
+
+        needles = {}
+        for rule in self.rules['rules']:
+            for pattern in rule.get('paths', ()):
+                needles[pattern] = path_needles(pattern)
+            for entry in map(_regex_entry, rule.get('regex', ())):
+                if 'requires' in entry:
+                    needles[entry['requires']] = path_needles(entry['requires'])
+        self.matcher = PatternMatcher([p for contains, _ in needles.values() for p in contains],
+                                      [p for _, suffixes in needles.values() for p in suffixes])
+
+        def mask(patterns):
+            found = 0
+            for pattern in patterns:
+                found |= self.matcher.mask(*needles[pattern])
+            return found
+
+        self._masks = [mask(rule.get('paths', ())) for rule in self.rules['rules']]
+        # (compiled expression, mask of its requires pattern or None) per rule
+        self._regexes = [[(re.compile(entry['pattern']), mask([entry['requires']]) if 'requires' in entry else None)
+                          for entry in map(_regex_entry, rule.get('regex', ()))]
+                         for rule in self.rules['rules']]
+
+    def code(self, url: str) -> int:
+        """Index into names of the first rule url matches, or of the default."""
+        url = url.lower()
+        found = self.matcher.match_segments(url)
+        path = None
+        for index, (mask, regexes) in enumerate(zip(self._masks, self._regexes)):
+            if found & mask:
+                return index
+            for regex, requires in regexes:
+                if requires is None or found & requires:
+                    path = url_path(url) if path is None else path
+                    if regex.search(path):
+                        return index
+        return self.default
+
+    def assign(self, url: str) -> str:
+        """Name of the first rule url matches, or the default."""
+        return self.names[self.code(url)]
+
+    def codes(self, text: UrlText) -> np.ndarray:
+        """code for a column of URLs, as int8."""
+        hits = text.match_segments(self.matcher)
+        codes = self.matcher.first(hits, self._masks)
+        for index, regexes in enumerate(self._regexes):
+            for regex, requires in regexes:
+                candidates = codes > index
+                if requires is not None:
+                    candidates &= self.matcher.rows(hits, requires)
+                for row in np.flatnonzero(candidates).tolist():
+                    if regex.search(url_path(text.urls[row].lower())):
+                        codes[row] = index
+        return codes
+
+# A rule set dict, a rule file, or compiled rules
+RulesSource = Union[str, Dict[str, Any], UrlRules]
+
+@lru_cache(maxsize=RULES_CACHE_SIZE)
+def _compile_file(path: str, mtime_ns: int) -> UrlRules:
+    """compile_rules for a rules file as of its modification time."""
+    return compile_rules(load_rules(path))
+
+def compile_rules(rules: RulesSource = None) -> UrlRules:
+    """
+    UrlRules for a rule set dict or file (the default cluster rules if
+    None), reusing the compiled rules when the same content was compiled
+    before.
+    """
+    if isinstance(rules, UrlRules):
+        return rules
+    if rules is None or isinstance(rules, str):
+        path = rules or DEFAULT_RULES_PATH
+        return _compile_file(os.path.abspath(path), os.stat(path).st_mtime_ns)
+    digest = rules_digest(rules)
+    compiled = _COMPILED.get(digest)
+    if compiled is None:
+        if len(_COMPILED) >= RULES_CACHE_SIZE:
+            del _COMPILED[next(iter(_COMPILED))]
+        compiled = _COMPILED[digest] = UrlRules(rules)
+    return compiled
@@ -0,0 +1,63 @@
+"""
+Sitemap Selection
+-----------------
+Ordering of rows by priority, overall and per cluster, for writing
+sitemaps.
+
+Sitemaps show priorities to a fixed number of decimals (2 in the CLI, 4
+in the API), so there are few distinct keys to order by. bucket_order
+orders rows by the priority as written, quantize(priority, decimals),
+with a stable LSD radix sort: one pass per 16 bits of key, each a NumPy
+radix argsort of uint16 digits, so O(n) for any column. The written
+priorities come out in the same (descending) sequence as with a sort of
+the exact values; rows that write the same priority stay in row order.
+group_bounds then splits a grouped order into its groups.
+
+Priorities must not be NaN (scored priorities never are).
+"""
+
+from decimal import ROUND_HALF_EVEN, Decimal
+
+import numpy as np
+
+def group_bounds(sorted_codes: np.ndarray) -> np.ndarray:
+    """Start of each code's rows in a code-sorted order (plus the end), indexed by code."""
+    counts = np.bincount(sorted_codes) if len(sorted_codes) else np.zeros(0, dtype=np.intp)
+    return np.concatenate([[0], np.cumsum(counts)])
+
+def quantize(priority: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    Priorities as written with f"{p:.{decimals}f}", times 10**decimals, as
+    int64. Values whose scaled product lies too close to a rounding tie to
+    trust the floating-point product are rounded exactly with Decimal, as
+    the format does.
+    """
+    scaled = np.asarray(priority, dtype=np.float64) * 10.0 ** decimals
+    keys = np.rint(scaled)
+    near_tie = np.flatnonzero(np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <= 1e-9 * np.maximum(np.abs(scaled), 1))
+    for row in near_tie.tolist():
+        keys[row] = int(Decimal(float(priority[row])).scaleb(decimals).quantize(1, ROUND_HALF_EVEN))
+    return keys.astype(np.int64)
+
+def _radix_order(keys: np.ndarray) -> np.ndarray:
+    """Stable argsort of non-negative int64 keys, LSD over 16-bit digits."""
+    order = np.argsort((keys & 0xFFFF).astype(np.uint16), kind='stable')
+    shift = 16
+    while (keys >> shift).any():
+        digits = ((keys[order] >> shift) & 0xFFFF).astype(np.uint16)
+        order = order[np.argsort(digits, kind='stable')]
+        shift += 16
+    return order
+
+def bucket_order(priority: np.ndarray, decimals: int, codes: np.ndarray = None) -> np.ndarray:
+    """
+    Rows by descending written priority (quantize), ties in row order; with
+    codes (non-negative integers), grouped by code first, ascending.
+    """
+    keys = quantize(priority, decimals)
+    if not len(keys):
+        return np.empty(0, dtype=np.intp)
+    keys = keys.max() - keys
+    if codes is not None:
+        keys += codes.astype(np.int64) * (int(keys.max()) + 1)
+    return _radix_order(keys)
@@ -0,0 +1,1170 @@
+"""
+Sitemap URLs
+------------
+URL normalization for deduplication, shared by the CLI and the API.
+
+normalize_url_reference is the original definition: parse with urlparse,
+drop query and fragment, strip one trailing slash (except after a bare host)
+and lowercase. normalize_url returns byte-identical results, but takes a
+string-slicing fast path for the common plain shape
+
+    http(s)://host/path
+
+(lowercase scheme, ASCII, no query, fragment, params, brackets, whitespace
+or control characters), and memoizes results in a bounded LRU cache. Any
+other input goes through urlparse. normalize_urls normalizes a whole column
+at once: the column is joined into one byte buffer, the plain-shape test,
+lowercasing and slash stripping are done with NumPy over that buffer, and
+only the rows that are not plain go through normalize_url. UrlText applies
+the same buffer approach to substring and suffix tests over a column.
+
+UrlColumn holds a column of URLs as one UTF-8 byte buffer and an int64
+offset table, which can be memory-mapped from disk (see sitemap_cache), so
+a column is carried without a str object per URL; normalize_urls takes the
+buffer as it is.
+
+PatternMatcher compiles a set of literal patterns (from the scoring model,
+the cluster rules, ...) so that one pass over a URL, or over a UrlText
+column, reports every pattern it contains. match_segments only reports
+patterns that start a segment of the URL's path (see url_path), which is
+how path rules (sitemap_rules) are matched.
+
+UrlDictionary interns URLs: each distinct string is stored once, UTF-8
+encoded, in one contiguous byte arena, and is identified by a dense int32 id.
+The pipeline carries ids; matching works on UrlColumn copies of the arena
+bytes (UrlDictionary.column), and strings are resolved only when writing
+output.
+
+FrontCodedUrls is the read-only form used once the URL set is complete: URLs
+sorted bytewise and front-coded in blocks. The first URL of each block is
+stored in full, every other one as the length of the prefix it shares with
+its predecessor plus the remaining bytes. Since almost every URL starts with
+https://www.namesilo.com/ and shares a long path with its neighbour, this
+takes a fraction of the arena's space. Any URL is decoded from the start of
+its block, and found by binary search over a sample of block heads, then
+over the block heads, then a scan of one block. UrlDictionary.front_coded
+builds it from the arena bytes: a radix sort over 8-byte chunks
+(UrlColumn.argsort) orders the URLs and finds the prefix each shares with
+its predecessor, and the coding is done with NumPy.
+"""
+
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import repeat
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+import numpy as np
+
+NORMALIZE_CACHE_SIZE = 1 << 18
+MAX_URL_ID = np.iinfo(np.int32).max
+FRONT_CODING_BLOCK = 16
+# Rows gathered per step by UrlColumn.take, and bytes looked up per step by
+# _map_bytes, to bound their index arrays
+TAKE_BLOCK_ROWS = 1 << 16
+MAP_BLOCK_BYTES = 1 << 20
+# Buffer bytes (or candidate starts) PatternMatcher classifies per step, to bound its arrays
+SCAN_BLOCK_BYTES = 1 << 22
+# Every HEAD_SAMPLE-th block head is also kept as a bytes object for bisect
+HEAD_SAMPLE = 16
+# Group 1 is the host; the rest, if any, starts with '/'
+_PLAIN_URL = re.compile(r'https?://([^/?#;\[\]\x00-\x20\x7f]+)[^?#;\[\]\x00-\x20\x7f]*')
+# Bytes that rule out the plain shape (the newline separator is checked apart)
+_NOT_PLAIN = np.zeros(256, dtype=bool)
+_NOT_PLAIN[:0x21] = True
+_NOT_PLAIN[0x7f:] = True
+_NOT_PLAIN[list(b'?#;[]')] = True
+_NOT_PLAIN[ord('\n')] = False
+# A byte table with at most this many bytes set is applied by comparing
+# against each, which beats a table lookup per byte
+FEW_BYTES = 4
+
+def normalize_url_reference(url: str) -> str:
+    """Normalize URL for deduplication (lowercase, strip trailing slash, remove fragments/query)."""
+    try:
+        parsed = urlparse(url)
+        clean = parsed._replace(query='', fragment='').geturl()
+        if clean.endswith('/') and clean != parsed.scheme + '://' + parsed.netloc + '/':
+            clean = clean[:-1]
+        return clean.lower()
+    except Exception:
+        return url.lower().rstrip('/')
+
+def _normalize_url(url: str) -> str:
+    if url.isascii():
+        match = _PLAIN_URL.fullmatch(url)
+        if match is not None:
+            if url.endswith('/') and len(url) != match.end(1) + 1:
+                url = url[:-1]
+            return url.lower()
+    return normalize_url_reference(url)
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_url(url: str) -> str:
+    """Normalize URL for deduplication; same result as normalize_url_reference, cached."""
+    return _normalize_url(url)
+
+def _map_bytes(table: np.ndarray, data: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    table[data] for a uint8 buffer. NumPy indexes with an intp copy of the
+    index array, 8 bytes per byte of data, so the buffer is mapped in blocks.
+    """
+    out = np.empty(len(data), dtype=table.dtype) if out is None else out
+    for lo in range(0, len(data), MAP_BLOCK_BYTES):
+        hi = min(lo + MAP_BLOCK_BYTES, len(data))
+        out[lo:hi] = table[data[lo:hi]]
+    return out
+
+def _byte_mask(table: np.ndarray, data: np.ndarray) -> np.ndarray:
+    """table[data] for a bool byte table."""
+    values = np.flatnonzero(table)
+    if len(values) > FEW_BYTES:
+        return _map_bytes(table, data)
+    mask = np.zeros(len(data), dtype=bool)
+    for value in values:
+        mask |= data == value
+    return mask
+
+def _lower_ascii(data: np.ndarray) -> np.ndarray:
+    """data with A-Z lowercased: data itself if it has none, else a copy made in blocks."""
+    out = None
+    for lo in range(0, len(data), MAP_BLOCK_BYTES):
+        block = data[lo:lo + MAP_BLOCK_BYTES]
+        # Bytes wrap below 'A', so only A-Z land under 26; setting bit 5 lowercases them
+        upper = (block - np.uint8(ord('A'))) < 26
+        if out is None and not upper.any():
+            continue
+        out = data.copy() if out is None else out
+        np.bitwise_or(block, upper.view(np.uint8) << 5, out=out[lo:lo + len(block)])
+    return data if out is None else out
+
+def _prefix_word(prefix: bytes, pad: int = 0) -> int:
+    """The first 8 bytes of prefix, padded with pad bytes, as a big-endian number."""
+    return int.from_bytes(prefix[:8].ljust(8, bytes([pad])), 'big')
+
+def _words(data: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Bytes [p, p + 8) of data for each of positions, zero past its end, as big-endian uint64."""
+    last = len(data) - 8
+    if last < 0:
+        windows = np.zeros((len(positions), 8), dtype=np.uint8)
+    else:
+        windows = np.lib.stride_tricks.sliding_window_view(data, 8)[np.minimum(positions, last)]
+    for i in np.flatnonzero(positions > last).tolist():
+        tail = data[positions[i]:positions[i] + 8]
+        windows[i] = 0
+        windows[i, :len(tail)] = tail
+    return windows.view('>u8').ravel().astype(np.uint64)
+
+def _holds(data: np.ndarray, positions: np.ndarray, needle: bytes, start: int = 0) -> np.ndarray:
+    """Whether data holds needle[start:] at each of positions + start, where it must fit."""
+    found = np.ones(len(positions), dtype=bool)
+    for at in range(start, len(needle), 8):
+        chunk = needle[at:at + 8]
+        mask = np.uint64(_prefix_word(b'\xff' * len(chunk)))
+        found &= (_words(data, positions + at) & mask) == np.uint64(_prefix_word(chunk))
+    return found
+
+def _starts_with(data: np.ndarray, starts: np.ndarray, lengths: np.ndarray, prefix: bytes) -> np.ndarray:
+    """Which of the byte ranges [start, start + length) begin with prefix and continue past it."""
+    match = lengths > len(prefix)
+    for i, byte in enumerate(prefix):
+        match &= data[np.minimum(starts + i, len(data) - 1)] == byte
+    return match
+
+def normalize_urls(urls: Iterable[str]) -> np.ndarray:
+    """
+    Normalize a column of URLs into an object array, with the same result as
+    mapping normalize_url over it.
+    """
+    if isinstance(urls, UrlColumn):
+        data = urls.lines()
+        data = data[:-1] if data is not None else None
+    else:
+        urls = urls.tolist() if isinstance(urls, np.ndarray) else list(urls)
+        blob = '\n'.join(urls)
+        try:
+            data = np.frombuffer(blob.encode('utf-8'), dtype=np.uint8)
+        except UnicodeEncodeError:
+            data = None
+        if blob.count('\n') != len(urls) - 1:
+            data = None
+    if data is None or not len(urls):
+        return np.fromiter(map(normalize_url, urls), dtype=object, count=len(urls))
+
+    breaks = np.flatnonzero(data == ord('\n'))
+    starts = np.concatenate([[0], breaks + 1])
+    ends = np.concatenate([breaks, [len(data)]])
+    lengths = ends - starts
+    https = _starts_with(data, starts, lengths, b'https://')
+    http = _starts_with(data, starts, lengths, b'http://')
+    host = starts + np.where(https, 8, 7)
+    plain = (https | http) & (data[np.minimum(host, len(data) - 1)] != ord('/'))
+    plain[np.searchsorted(starts, np.flatnonzero(_map_bytes(_NOT_PLAIN, data)), 'right') - 1] = False
+
+    # Strip a trailing slash unless it is the one right after the host
+    slashes = np.flatnonzero(data == ord('/'))
+    first_slash = slashes[np.minimum(np.searchsorted(slashes, host), max(len(slashes) - 1, 0))] if len(slashes) else host
+    last = np.maximum(ends - 1, 0)
+    strip = plain & (lengths > 0) & (data[last] == ord('/')) & (first_slash < last)
+    keep = np.ones(len(data), dtype=bool)
+    keep[last[strip]] = False
+    # bytes.lower() only touches A-Z, which never occur inside a multi-byte UTF-8 sequence
+    result = data[keep].tobytes().lower().decode('utf-8').split('\n')
+    for i in np.flatnonzero(~plain).tolist():
+        result[i] = normalize_url(urls[i])
+    return np.array(result, dtype=object)
+
+class UrlColumn:
+    """
+    A column of URLs as one UTF-8 byte buffer and an int64 offset table: row
+    i is data[offsets[i]:offsets[i + 1]]. Both may be memory-mapped. Rows
+    are decoded only when indexed, iterated or listed; indexing with a
+    slice, a boolean mask or an array of rows gives another UrlColumn. Its
+    dtype is object, so tables treat it as a text column.
+    """
+
+    dtype = np.dtype(object)
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, urls: Iterable[str]) -> 'UrlColumn':
+        """Encode a column of str."""
+        urls = urls.tolist() if isinstance(urls, np.ndarray) else list(urls)
+        blob = '\n'.join(urls).encode('utf-8')
+        data = np.frombuffer(blob, dtype=np.uint8)
+        breaks = np.flatnonzero(data == ord('\n'))
+        if len(breaks) == max(len(urls) - 1, 0):
+            # Row i starts after i newlines, which are dropped from the buffer
+            offsets = np.concatenate([[0], breaks - np.arange(len(breaks)), [len(data) - len(breaks)]])
+            return cls(np.delete(data, breaks), offsets[:len(urls) + 1].astype(np.int64))
+        encoded = [url.encode('utf-8') for url in urls]
+        offsets = np.zeros(len(urls) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(urls)), out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def concat(cls, columns: Sequence['UrlColumn']) -> 'UrlColumn':
+        """Rows of several columns, in order."""
+        data = np.concatenate([column.data[column.offsets[0]:column.offsets[-1]] for column in columns])
+        lengths = np.concatenate([np.diff(column.offsets) for column in columns])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(data, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the rows plus the offset table."""
+        return int(self.offsets[-1] - self.offsets[0]) + self.offsets.itemsize * len(self.offsets)
+
+    def __getitem__(self, index) -> Union[str, 'UrlColumn']:
+        if isinstance(index, (int, np.integer)):
+            n = len(self)
+            if index < 0:
+                index += n
+            if not 0 <= index < n:
+                raise IndexError("UrlColumn index out of range")
+            return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return UrlColumn(self.data, self.offsets[start:max(start, stop) + 1])
+            index = np.arange(start, stop, step)
+        index = np.asarray(index)
+        return self.take(np.flatnonzero(index) if index.dtype == bool else index)
+
+    def take(self, rows: np.ndarray) -> 'UrlColumn':
+        """The given rows, copied into a new buffer."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        data = np.empty(offsets[-1], dtype=np.uint8)
+        # Byte b of the output comes from b + (row start - output row start); blocks bound the index arrays
+        for lo in range(0, len(rows), TAKE_BLOCK_ROWS):
+            hi = min(lo + TAKE_BLOCK_ROWS, len(rows))
+            shift = np.repeat(starts[lo:hi] - offsets[lo:hi], lengths[lo:hi])
+            data[offsets[lo]:offsets[hi]] = self.data[shift + np.arange(offsets[lo], offsets[hi])]
+        return UrlColumn(data, offsets)
+
+    def tolist(self) -> List[str]:
+        """The rows as str."""
+        base = int(self.offsets[0])
+        blob = self.data[base:self.offsets[-1]].tobytes()
+        bounds = (np.asarray(self.offsets) - base).tolist()
+        text = blob.decode('utf-8')
+        # ASCII rows slice the decoded text directly
+        source = text if len(text) == len(blob) else blob
+        rows = list(map(source.__getitem__, map(slice, bounds[:-1], bounds[1:])))
+        return rows if source is text else [row.decode('utf-8') for row in rows]
+
+    def __iter__(self) -> Iterator[str]:
+        for lo in range(0, len(self), TAKE_BLOCK_ROWS):
+            yield from self[lo:lo + TAKE_BLOCK_ROWS].tolist()
+
+    def equals(self, other: 'UrlColumn') -> bool:
+        """Whether other holds the same URLs in the same rows."""
+        if len(self) != len(other):
+            return False
+        return (np.array_equal(np.diff(self.offsets), np.diff(other.offsets)) and
+                np.array_equal(self.data[self.offsets[0]:self.offsets[-1]],
+                               other.data[other.offsets[0]:other.offsets[-1]]))
+
+    def _windows(self, rows: np.ndarray, byte: int, masked: bool = True) -> np.ndarray:
+        """
+        Bytes [byte, byte + 8) of each of rows (all rows if None) as an (n, 8)
+        uint8 array, zero past the row's end (unspecified there unless masked).
+        """
+        if rows is not None and 4 * len(rows) > len(self):
+            # Reading every row in buffer order and then picking rows beats gathering at random offsets
+            return self._windows(None, byte, masked).view('<u8')[rows].view(np.uint8)
+        offsets = np.asarray(self.offsets)
+        if rows is None:
+            starts = offsets[:-1] + byte
+            remaining = np.diff(offsets) - byte
+        else:
+            starts = offsets[rows] + byte
+            remaining = offsets[rows + 1] - starts
+        if len(self.data) < 8:
+            out = np.zeros((len(starts), 8), dtype=np.uint8)
+            last = -1
+        else:
+            # Every 8-byte window of the buffer, as a view; one index per row gathers its window
+            last = len(self.data) - 8
+            out = np.lib.stride_tricks.sliding_window_view(self.data, 8)[np.minimum(starts, last)]
+        # Windows that would run past the buffer are gathered bytewise
+        for row in np.flatnonzero((starts > last) & (remaining > 0)).tolist():
+            size = min(int(remaining[row]), 8)
+            out[row, :size] = self.data[starts[row]:starts[row] + size]
+        if masked:
+            out *= np.arange(8) < remaining[:, None]
+        return out
+
+    def _sort(self) -> Tuple[np.ndarray, np.ndarray]:
+        """argsort, and shared_prefixes of its order, which the sort finds on the way."""
+        n = len(self)
+        order = np.arange(n)
+        shared = np.zeros(n, dtype=np.int64)
+        lengths = np.diff(self.offsets)
+        # Order positions still tied, and the position where each one's tied group starts
+        active, group = order.copy(), np.zeros(n, dtype=np.int64)
+        byte = 0
+        while len(active):
+            rows = order[active]
+            chunks = self._windows(rows, byte).view('>u8').ravel().astype(np.uint64)
+            # A row ending within the chunk sorts before longer rows with the same bytes
+            rest = np.minimum(lengths[rows] - byte, 9)
+            perm = np.lexsort((rest, chunks, group))
+            order[active] = rows[perm]
+            group, chunks, rest = group[perm], chunks[perm], rest[perm]
+            same_group = group[1:] == group[:-1]
+            same = same_group & (chunks[1:] == chunks[:-1]) & (rest[1:] == rest[:-1])
+            # Neighbours parting here share the bytes before the first their chunks differ in,
+            # and no more than the shorter one has left
+            split = np.flatnonzero(same_group & ~same) + 1
+            diff = chunks[split] ^ chunks[split - 1]
+            lead = sum(((diff >> np.uint64(64 - 8 * k)) == 0).astype(np.int64) for k in range(1, 8))
+            shared[active[split]] = byte + np.minimum(np.where(diff != 0, lead, 8),
+                                                      np.minimum(rest[split], rest[split - 1]))
+            # Equal rows that end here stay tied for good
+            equal = np.flatnonzero(same & (rest[1:] <= 8)) + 1
+            shared[active[equal]] = byte + rest[equal]
+            new = np.ones(len(perm), dtype=bool)
+            new[1:] = ~same
+            tied = ~new
+            tied[:-1] |= same
+            starts = active[np.maximum.accumulate(np.where(new, np.arange(len(new)), 0))]
+            keep = tied & (rest > 8)
+            active, group = active[keep], starts[keep]
+            byte += 8
+        return order, shared
+
+    def argsort(self) -> np.ndarray:
+        """
+        Rows in bytewise order of their URLs (UTF-8 order, which is also str
+        order), ties in row order. An MSD radix sort over 8-byte chunks: each
+        pass sorts only the rows still tied with a neighbour by their next
+        chunk, so passes stop at the longest prefix tied rows share.
+        """
+        return self._sort()[0]
+
+    def shared_prefixes(self, rows: np.ndarray) -> np.ndarray:
+        """Bytes each of rows shares with the start of the row before it in rows (0 for the first)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = np.diff(self.offsets)
+        shared = np.zeros(len(rows), dtype=np.int64)
+        limit = np.minimum(lengths[rows[1:]], lengths[rows[:-1]])
+        pairs = np.arange(1, len(rows))
+        byte = 0
+        while len(pairs):
+            # Bytes past a row's end may differ or not; shared is capped at the shorter length either way
+            diff = (self._windows(rows[pairs], byte, False).view('<u8') ^
+                    self._windows(rows[pairs - 1], byte, False).view('<u8')).ravel()
+            found = diff != 0
+            # The first differing byte is the lowest set byte of the little-endian XOR
+            lowest = diff & (~diff + np.uint64(1))
+            first = np.log2(np.where(found, lowest, 1).astype(np.float64)).astype(np.int64) // 8
+            shared[pairs] = np.minimum(byte + np.where(found, first, 8), limit[pairs - 1])
+            byte += 8
+            pairs = pairs[~found & (limit[pairs - 1] > byte)]
+        return shared
+
+    def lines(self) -> np.ndarray:
+        """
+        The rows, each followed by a newline, as one uint8 buffer; None if a
+        row contains a newline.
+        """
+        data = self.data[self.offsets[0]:self.offsets[-1]]
+        if (data == ord('\n')).any():
+            return None
+        n = len(self)
+        # Row i's newline goes after its bytes and the i newlines before it
+        breaks = np.asarray(self.offsets[1:]) - self.offsets[0] + np.arange(n)
+        out = np.full(len(data) + n, ord('\n'), dtype=np.uint8)
+        keep = np.ones(len(out), dtype=bool)
+        keep[breaks] = False
+        out[keep] = data
+        return out
+
+def url_column(urls: Union['UrlColumn', Iterable[str]]) -> UrlColumn:
+    """urls as a UrlColumn (itself if it is one)."""
+    return urls if isinstance(urls, UrlColumn) else UrlColumn.from_strings(urls)
+
+def url_path(url: str) -> str:
+    """
+    The part of a URL that path rules see: everything before the first '?'
+    or '#', from the first '/' after the host if there is a scheme ('://',
+    so '' for a bare host), else all of it.
+    """
+    for mark in '?#':
+        cut = url.find(mark)
+        if cut >= 0:
+            url = url[:cut]
+    scheme = url.find('://')
+    if scheme < 0:
+        return url
+    start = url.find('/', scheme + 3)
+    return url[start:] if start >= 0 else ''
+
+def segment_starts(path: str) -> List[int]:
+    """Offset of each segment of a path: after every '/', and 0 if the path does not start with one."""
+    starts = [0] if path and path[0] != '/' else []
+    return starts + [i + 1 for i, char in enumerate(path) if char == '/']
+
+class PatternMatcher:
+    """
+    Literal patterns compiled for finding every one of them in one pass.
+
+    Each pattern is a substring (contains) or a suffix the text must end with
+    (suffixes), and gets an id: its bit in the masks that match() and mask()
+    return. Patterns are matched as given, so callers lowercase both sides
+    when they want case-insensitive matching.
+
+    A column is matched by UrlText.match over its byte buffer at once. Read
+    as a big-endian number, the 8 bytes at a position start with a substring
+    pattern exactly when they lie in an interval (the pattern padded with
+    0x00 up to 0xff), and the patterns' intervals cut the numbers into runs
+    that each start the same patterns. One binary search of the runs per
+    candidate start (a byte some pattern starts with) finds the patterns
+    starting there, and only those are checked past 8 bytes and against the
+    end of the row. Suffixes are compared at the end of each row. A single
+    string is matched by one scan of a regular expression with every
+    pattern, longest first, in a lookahead: at each position it reports the
+    longest pattern starting there, which implies the patterns that are
+    prefixes of it. Stepping an automaton byte by byte in Python takes about
+    twice as long as that scan, and a capture group per pattern (to tell
+    them apart) ten times as long, so the scan captures the matched text and
+    looks it up.
+    """
+
+    def __init__(self, contains: Iterable[str] = (), suffixes: Iterable[str] = ()):
+        # (pattern, is_suffix) in id order
+        self.keys = tuple(dict.fromkeys([(p, False) for p in contains] + [(p, True) for p in suffixes]))
+        self._ids = {key: i for i, key in enumerate(self.keys)}
+        for pattern, _ in self.keys:
+            if not pattern or not pattern.isascii() or '\n' in pattern:
+                raise ValueError(f"Patterns must be non-empty ASCII without newlines: {pattern!r}")
+
+        # Runs of the 8-byte words (see above); words in [edges[r - 1], edges[r]) start the
+        # substring patterns self._runs[r]
+        self._needles = [pattern.encode('ascii') for pattern, _ in self.keys]
+        contains = [i for i, (_, suffix) in enumerate(self.keys) if not suffix]
+        self._suffix_ids = [i for i, (_, suffix) in enumerate(self.keys) if suffix]
+        self._first = np.zeros(256, dtype=bool)
+        self._first[[self._needles[i][0] for i in contains]] = True
+        lows = [_prefix_word(self._needles[i]) for i in contains]
+        highs = [_prefix_word(self._needles[i], 0xff) for i in contains]
+        self._edges = np.array(sorted(set(lows) | {high + 1 for high in highs}), dtype=np.uint64)
+        self._runs = [[i for i, low, high in zip(contains, lows, highs) if low <= start <= high]
+                      for start in [-1] + self._edges.tolist()]
+        self._in_run = np.array([bool(ids) for ids in self._runs])
+
+        # Longest first; text that is only a suffix is matched only at the end
+        texts = sorted({pattern for pattern, _ in self.keys}, key=len, reverse=True)
+        alternatives = '|'.join(re.escape(text) + ('' if (text, False) in self._ids else r'\Z') for text in texts)
+        self._regex = re.compile(f'(?=({alternatives}))') if self.keys else None
+        self._implied = {text: self._prefixes_of(text) for text in texts}
+        self._suffix_bits = {text: 1 << pattern_id for (text, suffix), pattern_id in self._ids.items() if suffix}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def union(cls, *matchers: 'PatternMatcher') -> 'PatternMatcher':
+        """Matcher for the patterns of all the given matchers."""
+        keys = [key for matcher in matchers for key in matcher.keys]
+        return cls([p for p, suffix in keys if not suffix], [p for p, suffix in keys if suffix])
+
+    def _prefixes_of(self, text: str) -> int:
+        """Mask of the substring patterns found wherever text is."""
+        found = 0
+        for end in range(1, len(text) + 1):
+            pattern_id = self._ids.get((text[:end], False))
+            if pattern_id is not None:
+                found |= 1 << pattern_id
+        return found
+
+    def mask(self, contains: Iterable[str] = (), suffixes: Iterable[str] = ()) -> int:
+        """Mask of the given patterns, which must be among this matcher's."""
+        found = 0
+        for key in [(p, False) for p in contains] + [(p, True) for p in suffixes]:
+            if key not in self._ids:
+                raise ValueError(f"Pattern {key[0]!r} is not in this matcher")
+            found |= 1 << self._ids[key]
+        return found
+
+    def masks(self, rules: Dict[str, Sequence[str]]) -> Dict[str, int]:
+        """Mask of each named group of substring patterns."""
+        return {name: self.mask(contains=patterns) for name, patterns in rules.items()}
+
+    def match(self, text: str) -> int:
+        """Mask of the patterns found in text."""
+        found = 0
+        if self._regex is not None:
+            for matched in self._regex.findall(text):
+                found |= self._implied[matched]
+                # A suffix pattern at the end is always reported there, as no longer pattern fits
+                if matched in self._suffix_bits and text.endswith(matched):
+                    found |= self._suffix_bits[matched]
+        return found
+
+    def match_segments(self, url: str) -> int:
+        """Mask of the patterns found at the start of a segment of url_path(url)."""
+        found = 0
+        if self._regex is None:
+            return found
+        path = url_path(url)
+        for start in segment_starts(path):
+            matched = self._regex.match(path, start)
+            if matched:
+                text = matched.group(1)
+                found |= self._implied[text]
+                if text in self._suffix_bits and start + len(text) == len(path):
+                    found |= self._suffix_bits[text]
+        return found
+
+    def rows(self, hits: np.ndarray, mask: int) -> np.ndarray:
+        """Rows of a UrlText.match result that match any pattern in mask."""
+        ids = [i for i in range(len(self.keys)) if mask >> i & 1]
+        return hits[ids].any(axis=0) if ids else np.zeros(hits.shape[1], dtype=bool)
+
+    def first(self, hits: np.ndarray, masks: Sequence[int]) -> np.ndarray:
+        """
+        Index of the first mask each row of a UrlText.match result matches,
+        len(masks) for rows that match none, as int8.
+        """
+        codes = np.full(hits.shape[1], len(masks), dtype=np.int8)
+        for index in reversed(range(len(masks))):
+            codes[self.rows(hits, masks[index])] = index
+        return codes
+
+    def _find(self, data: np.ndarray, lo: np.ndarray, hi: np.ndarray,
+              positions: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Start, row and pattern id of the matches in a buffer holding row r at
+        [lo[r], hi[r]), rows in buffer order: of each substring pattern that
+        starts at one of positions (anywhere if None) and fits in its row, and
+        of each suffix at the end of a row.
+        """
+        found_at, found_rows, found_ids = [], [], []
+        if len(self._edges):
+            if positions is None:
+                blocks = (np.flatnonzero(_byte_mask(self._first, data[at:at + SCAN_BLOCK_BYTES])) + at
+                          for at in range(0, len(data), SCAN_BLOCK_BYTES))
+            else:
+                positions = positions[self._first[data[positions]]]
+                blocks = (positions[at:at + SCAN_BLOCK_BYTES] for at in range(0, len(positions), SCAN_BLOCK_BYTES))
+            starts, runs = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+            for block in blocks:
+                run = np.searchsorted(self._edges, _words(data, block), 'right')
+                keep = self._in_run[run]
+                starts.append(block[keep])
+                runs.append(run[keep])
+            starts, runs = np.concatenate(starts), np.concatenate(runs)
+            rows = np.searchsorted(lo, starts, 'right') - 1
+            room = hi[rows] - starts
+            for run in np.unique(runs).tolist():
+                here = runs == run
+                for pattern_id in self._runs[run]:
+                    needle = self._needles[pattern_id]
+                    at = np.flatnonzero(here & (room >= len(needle)))
+                    at = at[_holds(data, starts[at], needle, 8)]
+                    found_at.append(starts[at])
+                    found_rows.append(rows[at])
+                    found_ids.append(np.full(len(at), pattern_id))
+        if self._suffix_ids and len(data):
+            lengths = hi - lo
+            last = data[np.maximum(hi - 1, 0)]
+            for pattern_id in self._suffix_ids:
+                needle = self._needles[pattern_id]
+                rows = np.flatnonzero((last == needle[-1]) & (lengths >= len(needle)))
+                rows = rows[_holds(data, hi[rows] - len(needle), needle)]
+                found_at.append(hi[rows] - len(needle))
+                found_rows.append(rows)
+                found_ids.append(np.full(len(rows), pattern_id))
+        if not found_at:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(found_at), np.concatenate(found_rows), np.concatenate(found_ids)
+
+class UrlText:
+    """
+    A column of URLs as one lowercased byte buffer, for matching patterns
+    over the whole column (see PatternMatcher).
+
+    The buffer is the UrlColumn's (a column of str is encoded into one),
+    with A-Z lowercased; it is used as it is, without a copy, when it has
+    no A-Z. Rows with non-ASCII bytes, where str.lower() may do more, are
+    matched one by one, as are all rows if the URLs cannot be encoded.
+    Results are cached per pattern set.
+    """
+
+    def __init__(self, urls: Union[UrlColumn, Iterable[str]]):
+        self._data = None
+        self._hits = {}
+        self._segment_hits = {}
+        if isinstance(urls, UrlColumn):
+            self.urls = column = urls
+        else:
+            self.urls = urls.tolist() if isinstance(urls, np.ndarray) else list(urls)
+            try:
+                column = UrlColumn.from_strings(self.urls)
+            except UnicodeEncodeError:
+                self._slow = np.arange(len(self.urls))
+                return
+        offsets = np.asarray(column.offsets)
+        data = column.data[offsets[0]:offsets[-1]]
+        self._starts = offsets[:-1] - offsets[0]
+        self._ends = offsets[1:] - offsets[0]
+        self._slow = np.unique(self._rows(np.flatnonzero(data >= 0x80)))
+        self._data = _lower_ascii(data)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def _rows(self, positions: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self._starts, positions, 'right') - 1
+
+    def match(self, matcher: PatternMatcher) -> np.ndarray:
+        """
+        Which rows' lowercased URLs match each of matcher's patterns: a
+        read-only bool array with one row per pattern id. Cached per pattern
+        set; once a matcher has been matched, any matcher whose patterns are
+        all among its patterns reuses that pass.
+        """
+        hits = self._hits.get(matcher.keys)
+        if hits is not None:
+            return hits
+        for keys, cached in self._hits.items():
+            source = {key: i for i, key in enumerate(keys)}
+            if all(key in source for key in matcher.keys):
+                hits = cached[[source[key] for key in matcher.keys]]
+                break
+        else:
+            hits = np.zeros((len(matcher), len(self.urls)), dtype=bool)
+            if self._data is not None and len(matcher):
+                _, rows, pattern_ids = matcher._find(self._data, self._starts, self._ends)
+                hits[pattern_ids, rows] = True
+            for row in self._slow.tolist():
+                found = matcher.match(self.urls[row].lower())
+                hits[:, row] = [found >> i & 1 for i in range(len(matcher))]
+        hits.flags.writeable = False
+        self._hits[matcher.keys] = hits
+        return hits
+
+    def _paths(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Start and end of each row's url_path in the buffer, and the offset of
+        every segment of it.
+        """
+        data, starts, ends = self._data, self._starts, self._ends
+        slashes = np.flatnonzero(data == ord('/'))
+        # Row r's slashes are slashes[first[r]:first[r + 1]]; those of its path, slashes[lo[r]:hi[r]]
+        first = np.append(np.searchsorted(slashes, starts), len(slashes))
+        # The path ends at the row's first '?' or '#', if any, else at its end
+        hi = first[1:].copy()
+        cuts = ends.copy()
+        marks = np.flatnonzero((data == ord('?')) | (data == ord('#')))
+        mark_rows = self._rows(marks)
+        marks, mark_rows = marks[np.diff(mark_rows, prepend=-1) != 0], np.unique(mark_rows)
+        hi[mark_rows] = np.searchsorted(slashes, marks)
+        cuts[mark_rows] = marks
+        # and starts at the first '/' after the host: the row's third slash when its first
+        # two are the '//' of '://' (before the cut)
+        lead = slashes[np.minimum(first[:-1], len(slashes) - 1)] if len(slashes) else starts
+        web = (first[:-1] < first[1:]) & (lead > starts) & (lead + 1 < cuts)
+        web[web] = (data[lead[web] - 1] == ord(':')) & (data[lead[web] + 1] == ord('/'))
+        lo = np.minimum(first[:-1] + 2, hi)
+        # Other rows: after the first '://' before the cut, else from the row start
+        other = np.flatnonzero(~web)
+        plain = np.zeros(0, dtype=np.int64)
+        if len(other):
+            schemes = np.flatnonzero(data[:-2] == ord(':'))
+            schemes = schemes[(data[schemes + 1] == ord('/')) & (data[schemes + 2] == ord('/'))]
+            scheme = schemes[np.minimum(np.searchsorted(schemes, starts[other]), len(schemes) - 1)] \
+                if len(schemes) else cuts[other]
+            has_scheme = (scheme >= starts[other]) & (scheme + 3 <= cuts[other])
+            lo[other] = np.where(has_scheme, np.minimum(np.searchsorted(slashes, scheme + 3), hi[other]),
+                                 first[other])
+            plain = other[~has_scheme]
+        paths = np.where(lo < hi, slashes[np.minimum(lo, len(slashes) - 1)] if len(slashes) else cuts, cuts)
+        paths[plain] = starts[plain]
+        # A segment starts after each '/' in the path (unless that ends the buffer), and at
+        # the path's start if it does not start with one; the slashes in [lo, hi) of each row
+        # are marked with a difference array
+        inside = np.cumsum(np.bincount(lo, minlength=len(slashes) + 1) -
+                           np.bincount(hi, minlength=len(slashes) + 1))[:-1] > 0
+        segments = slashes[inside] + 1
+        bare = paths[paths < cuts]
+        bare = bare[data[bare] != ord('/')]
+        return paths, cuts, np.concatenate([bare, segments[segments < len(data)]])
+
+    def match_segments(self, matcher: PatternMatcher) -> np.ndarray:
+        """
+        match, counting a pattern only where it starts a segment of the
+        row's url_path (PatternMatcher.match_segments for each row). Cached
+        per pattern set.
+        """
+        hits = self._segment_hits.get(matcher.keys)
+        if hits is not None:
+            return hits
+        hits = np.zeros((len(matcher), len(self.urls)), dtype=bool)
+        if self._data is not None and len(matcher):
+            lo, hi, segments = self._paths()
+            positions, rows, pattern_ids = matcher._find(self._data, lo, hi, segments)
+            # Suffixes count only where they start a segment, as substrings found here do
+            after_slash = self._data[np.maximum(positions - 1, 0)] == ord('/')
+            at_start = positions == lo[rows]
+            keep = np.where(at_start, self._data[positions] != ord('/'), after_slash)
+            hits[pattern_ids[keep], rows[keep]] = True
+        for row in self._slow.tolist():
+            found = matcher.match_segments(self.urls[row].lower())
+            hits[:, row] = [found >> i & 1 for i in range(len(matcher))]
+        hits.flags.writeable = False
+        self._segment_hits[matcher.keys] = hits
+        return hits
+
+    def contains(self, patterns: Sequence[str]) -> np.ndarray:
+        """Rows whose lowercased URL contains any of the patterns."""
+        return self.match(PatternMatcher(contains=patterns)).any(axis=0)
+
+    def endswith(self, suffixes: Sequence[str]) -> np.ndarray:
+        """Rows whose lowercased URL ends with any of the suffixes."""
+        return self.match(PatternMatcher(suffixes=suffixes)).any(axis=0)
+
+class UrlDictionary:
+    """
+    Interned URL strings with dense int32 ids, in order of first interning.
+
+    Strings live in a single bytearray with an int64 offset table, so each
+    URL costs its UTF-8 length plus 8 bytes instead of a Python str object.
+    Lookups go through a dict keyed by the string's hash; the rare hash
+    collision between distinct URLs is kept in a small overflow dict.
+    """
+
+    def __init__(self, urls: Iterable[str] = ()):
+        self._arena = bytearray()
+        self._offsets = array('q', [0])
+        self._by_hash = {}
+        self._overflow = {}
+        self.intern_many(urls)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, url_id: int) -> str:
+        return self._arena[self._offsets[url_id]:self._offsets[url_id + 1]].decode('utf-8')
+
+    def _holds(self, url_id: int, data: bytes) -> bool:
+        start = self._offsets[url_id]
+        return self._offsets[url_id + 1] - start == len(data) and self._arena.startswith(data, start)
+
+    def get(self, url: str, default: int = -1) -> int:
+        """Id of url, or default if it was never interned."""
+        url_id = self._by_hash.get(hash(url))
+        if url_id is None:
+            return default
+        if self._holds(url_id, url.encode('utf-8')):
+            return url_id
+        return self._overflow.get(url, default)
+
+    def _append(self, data: bytes) -> int:
+        url_id = len(self._offsets) - 1
+        if url_id > MAX_URL_ID:
+            raise OverflowError("UrlDictionary is limited to 2**31 - 1 URLs")
+        self._arena += data
+        self._offsets.append(len(self._arena))
+        return url_id
+
+    def intern(self, url: str) -> int:
+        """Id of url, adding it to the arena if it is new."""
+        key = hash(url)
+        data = url.encode('utf-8')
+        url_id = self._by_hash.get(key)
+        if url_id is None:
+            url_id = self._by_hash[key] = self._append(data)
+            return url_id
+        if self._holds(url_id, data):
+            return url_id
+        url_id = self._overflow.get(url)
+        if url_id is None:
+            url_id = self._overflow[url] = self._append(data)
+        return url_id
+
+    def intern_many(self, urls: Iterable[str]) -> np.ndarray:
+        """
+        Intern a column of URLs, returning their ids as int32.
+
+        The column is hashed and deduplicated with NumPy; only distinct URLs
+        touch the hash index, and all new ones are appended in one go. A hash
+        shared by two distinct URLs falls back to interning one at a time.
+        """
+        urls = urls if isinstance(urls, np.ndarray) else np.array(list(urls), dtype=object)
+        n = len(urls)
+        if not n:
+            return np.empty(0, dtype=np.int32)
+        keys = np.fromiter(map(hash, urls.tolist()), dtype=np.int64, count=n)
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        distinct = urls[first]
+        if self._overflow or not (urls == distinct[inverse]).all():
+            return np.fromiter(map(self.intern, urls.tolist()), dtype=np.int32, count=n)
+        ids = np.fromiter(map(self._by_hash.get, unique_keys.tolist(), repeat(-1)), dtype=np.int64,
+                          count=len(unique_keys))
+        # Verify hash hits against the arena (bytearray slices compare equal to bytes)
+        old = np.flatnonzero(ids >= 0)
+        if len(old):
+            if self._slices(ids[old]) != list(map(str.encode, distinct[old].tolist())):
+                return np.fromiter(map(self.intern, urls.tolist()), dtype=np.int32, count=n)
+        new = np.flatnonzero(ids < 0)
+        if len(new):
+            new = new[np.argsort(first[new], kind='stable')]
+            base = len(self)
+            if base + len(new) - 1 > MAX_URL_ID:
+                raise OverflowError("UrlDictionary is limited to 2**31 - 1 URLs")
+            encoded = list(map(str.encode, distinct[new].tolist()))
+            ends = len(self._arena) + np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+            self._arena += b''.join(encoded)
+            self._offsets.extend(ends.tolist())
+            new_ids = np.arange(base, base + len(new), dtype=np.int64)
+            ids[new] = new_ids
+            self._by_hash.update(zip(unique_keys[new].tolist(), new_ids.tolist()))
+        return ids[inverse].astype(np.int32)
+
+    def _slices(self, ids: np.ndarray) -> List[bytearray]:
+        """Arena bytes of each id."""
+        offsets = np.frombuffer(self._offsets, dtype=np.int64)
+        starts, ends = offsets[ids].tolist(), offsets[ids + 1].tolist()
+        # Release the buffer view so the offset array can grow again
+        del offsets
+        return list(map(self._arena.__getitem__, map(slice, starts, ends)))
+
+    def _check_ids(self, ids: Iterable[int]) -> np.ndarray:
+        ids = np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype=np.int64)
+        if len(ids) and (ids.min() < 0 or ids.max() >= len(self)):
+            raise IndexError("UrlDictionary id out of range")
+        return ids
+
+    def lookup(self, ids: Iterable[int]) -> List[str]:
+        """Resolve ids back to strings."""
+        return list(map(bytearray.decode, self._slices(self._check_ids(ids))))
+
+    def column(self, ids: Iterable[int]) -> UrlColumn:
+        """The URLs of ids as a UrlColumn, copied from the arena without decoding."""
+        ids = self._check_ids(ids)
+        arena = UrlColumn(np.frombuffer(self._arena, dtype=np.uint8), np.frombuffer(self._offsets, dtype=np.int64))
+        column = arena.take(ids)
+        # Release the buffer views so the arena can grow again
+        del arena
+        return column
+
+    def __iter__(self) -> Iterator[str]:
+        arena = self._arena
+        offsets = self._offsets
+        for i in range(len(self)):
+            yield arena[offsets[i]:offsets[i + 1]].decode('utf-8')
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arena and offset table (excluding the hash index)."""
+        return len(self._arena) + self._offsets.itemsize * len(self._offsets)
+
+    def front_coded(self, block_size: int = FRONT_CODING_BLOCK) -> Tuple['FrontCodedUrls', np.ndarray]:
+        """
+        Sorted front-coded copy of the dictionary, plus an int32 array mapping
+        each id to the URL's position in the copy. The arena is sorted and
+        coded as bytes (UrlColumn.argsort, FrontCodedUrls.from_column).
+        """
+        arena = UrlColumn(np.frombuffer(self._arena, dtype=np.uint8), np.frombuffer(self._offsets, dtype=np.int64))
+        order, shared = arena._sort()
+        store = FrontCodedUrls.from_column(arena, order, block_size, shared)
+        # Release the buffer views so the arena can grow again
+        del arena
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        return store, rank
+
+# Front coding
+
+def _varint_sizes(values: np.ndarray) -> np.ndarray:
+    """Bytes of the LEB128 varint of each value."""
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> 7
+    while rest.any():
+        sizes += rest > 0
+        rest >>= 7
+    return sizes
+
+def _put_varints(out: np.ndarray, at: np.ndarray, values: np.ndarray, sizes: np.ndarray):
+    """Write the varint of each value at its offset in out."""
+    for k in range(int(sizes.max()) if len(sizes) else 0):
+        write = sizes > k
+        more = (sizes[write] > k + 1).astype(np.int64) << 7
+        out[at[write] + k] = (values[write] >> 7 * k) & 0x7f | more
+
+def _copy_ranges(out: np.ndarray, at: np.ndarray, data: np.ndarray, starts: np.ndarray, lengths: np.ndarray):
+    """out[at[i]:at[i] + lengths[i]] = data[starts[i]:starts[i] + lengths[i]] for every i."""
+    for lo in range(0, len(starts), TAKE_BLOCK_ROWS):
+        hi = min(lo + TAKE_BLOCK_ROWS, len(starts))
+        bounds = np.zeros(hi - lo + 1, dtype=np.int64)
+        np.cumsum(lengths[lo:hi], out=bounds[1:])
+        ramp = np.arange(bounds[-1])
+        out[np.repeat(at[lo:hi] - bounds[:-1], lengths[lo:hi]) + ramp] = \
+            data[np.repeat(starts[lo:hi] - bounds[:-1], lengths[lo:hi]) + ramp]
+
+def _read_varint(data: bytearray, pos: int) -> Tuple[int, int]:
+    byte = data[pos]
+    if byte < 128:
+        return byte, pos + 1
+    n = shift = 0
+    while byte >= 128:
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        pos += 1
+        byte = data[pos]
+    return n | byte << shift, pos + 1
+
+class _BlockHeads:
+    """Sequence view of a store's block heads, for bisect."""
+
+    def __init__(self, store: 'FrontCodedUrls'):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store._blocks)
+
+    def __getitem__(self, block: int) -> bytes:
+        data = self._store._data
+        n, pos = _read_varint(data, self._store._blocks[block])
+        return bytes(data[pos:pos + n])
+
+class FrontCodedUrls:
+    """
+    Sorted, distinct URLs, front-coded in blocks of block_size.
+
+    Positions are ranks in bytewise (UTF-8) order, which is also Python's str
+    order. A URL costs the bytes it does not share with its predecessor plus
+    a varint or two; each block adds an 8-byte offset.
+    """
+
+    def __init__(self, urls: Iterable[str] = (), block_size: int = FRONT_CODING_BLOCK):
+        self._data = bytearray()
+        self._blocks = array('q')
+        self._sample = []
+        self._count = 0
+        self.block_size = block_size
+        self._build(UrlColumn.from_strings(sorted(set(urls))))
+
+    @classmethod
+    def from_sorted(cls, urls: Iterable[str], block_size: int = FRONT_CODING_BLOCK) -> 'FrontCodedUrls':
+        """Build from URLs already in strictly increasing order (ValueError otherwise)."""
+        return cls.from_column(UrlColumn.from_strings(urls), block_size=block_size)
+
+    @classmethod
+    def from_column(cls, column: UrlColumn, order: np.ndarray = None, block_size: int = FRONT_CODING_BLOCK,
+                    shared: np.ndarray = None) -> 'FrontCodedUrls':
+        """
+        Build from the rows of column taken in order (row order when None),
+        which must be strictly increasing (ValueError otherwise). The URLs
+        are coded as bytes with NumPy, without decoding them. shared, if
+        known, is column.shared_prefixes(order).
+        """
+        store = cls(block_size=block_size)
+        store._build(column, order, shared)
+        return store
+
+    def _build(self, column: UrlColumn, order: np.ndarray = None, shared: np.ndarray = None):
+        order = np.arange(len(column)) if order is None else np.asarray(order, dtype=np.int64)
+        n = len(order)
+        starts = np.asarray(column.offsets[order], dtype=np.int64)
+        lengths = np.asarray(column.offsets[order + 1], dtype=np.int64) - starts
+        shared = column.shared_prefixes(order) if shared is None else shared.copy()
+        # Each row must extend its predecessor or differ from it by a greater byte
+        prev_lengths = lengths[:-1]
+        ends_prev = shared[1:] == prev_lengths
+        at = np.minimum(shared[1:], np.maximum(lengths[1:] - 1, 0))
+        data = column.data
+        greater = (shared[1:] < lengths[1:]) & ~ends_prev
+        if len(data):
+            greater[greater] = data[(starts[1:] + at)[greater]] > data[(starts[:-1] + at)[greater]]
+        bad = np.flatnonzero(~(greater | (ends_prev & (lengths[1:] > prev_lengths))))
+        if len(bad):
+            raise ValueError(f"URLs are not sorted and distinct at {column[int(order[bad[0] + 1])]!r}")
+
+        # Block heads: varint length, then the URL; others: varint shared, varint rest, then the rest
+        head = np.arange(n) % self.block_size == 0
+        shared[head] = 0
+        rest = lengths - shared
+        first = np.where(head, lengths, shared)
+        first_sizes = _varint_sizes(first)
+        rest_sizes = np.where(head, 0, _varint_sizes(rest))
+        positions = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(first_sizes + rest_sizes + rest, out=positions[1:])
+        out = np.zeros(positions[-1], dtype=np.uint8)
+        _put_varints(out, positions[:-1], first, first_sizes)
+        _put_varints(out, (positions[:-1] + first_sizes)[~head], rest[~head], rest_sizes[~head])
+        _copy_ranges(out, positions[:-1] + first_sizes + rest_sizes, data, starts + shared, rest)
+
+        self._data = bytearray(out.tobytes())
+        self._blocks = array('q', positions[:-1][head].tolist())
+        heads = np.flatnonzero(head)[::HEAD_SAMPLE]
+        self._sample = [data[starts[i]:starts[i] + lengths[i]].tobytes() for i in heads.tolist()]
+        self._count = n
+
+    def _decode_block(self, block: int, stop: int = None) -> List[bytes]:
+        """The URLs of a block as bytes, up to index stop within the block."""
+        data = self._data
+        stop = self.block_size if stop is None else stop
+        end = self._blocks[block + 1] if block + 1 < len(self._blocks) else len(data)
+        n, pos = _read_varint(data, self._blocks[block])
+        cur = bytes(data[pos:pos + n])
+        pos += n
+        out = [cur]
+        append = out.append
+        for _ in range(min(stop, self.block_size) - 1):
+            if pos >= end:
+                break
+            # Inline the one-byte varint case
+            shared = data[pos]
+            if shared < 128:
+                pos += 1
+            else:
+                shared, pos = _read_varint(data, pos)
+            n = data[pos]
+            if n < 128:
+                pos += 1
+            else:
+                n, pos = _read_varint(data, pos)
+            cur = cur[:shared] + data[pos:pos + n]
+            pos += n
+            append(cur)
+        return out
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> str:
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError("FrontCodedUrls index out of range")
+        block, offset = divmod(position, self.block_size)
+        return self._decode_block(block, offset + 1)[-1].decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for block in range(len(self._blocks)):
+            for data in self._decode_block(block):
+                yield data.decode('utf-8')
+
+    def __contains__(self, url: str) -> bool:
+        return self.get(url) >= 0
+
+    def get(self, url: str, default: int = -1) -> int:
+        """Position of url, or default if it is not stored."""
+        key = url.encode('utf-8')
+        lo = bisect_right(self._sample, key) - 1
+        if lo < 0:
+            return default
+        lo *= HEAD_SAMPLE
+        block = bisect_right(_BlockHeads(self), key, lo + 1, min(lo + HEAD_SAMPLE, len(self._blocks))) - 1
+        for offset, data in enumerate(self._decode_block(block)):
+            if data == key:
+                return block * self.block_size + offset
+            if data > key:
+                break
+        return default
+
+    def lookup(self, positions: Iterable[int]) -> List[str]:
+        """
+        Resolve positions to strings. Positions are visited in sorted order, so
+        each block is decoded once however the positions are arranged.
+        """
+        positions = np.asarray(positions if isinstance(positions, np.ndarray) else list(positions), dtype=np.int64)
+        out = [None] * len(positions)
+        if not len(positions):
+            return out
+        if positions.min() < 0 or positions.max() >= self._count:
+            raise IndexError("FrontCodedUrls index out of range")
+        order = np.argsort(positions, kind='stable')
+        blocks, offsets = np.divmod(positions[order], self.block_size)
+        current, decoded = -1, None
+        for i, block, offset in zip(order.tolist(), blocks.tolist(), offsets.tolist()):
+            if block != current:
+                current = block
+                decoded = [data.decode('utf-8') for data in self._decode_block(block)]
+            out[i] = decoded[offset]
+        return out
+
+    def column(self, positions: Iterable[int]) -> UrlColumn:
+        """lookup as a UrlColumn, without decoding the URLs."""
+        positions = np.asarray(positions if isinstance(positions, np.ndarray) else list(positions), dtype=np.int64)
+        if len(positions) and (positions.min() < 0 or positions.max() >= self._count):
+            raise IndexError("FrontCodedUrls index out of range")
+        order = np.argsort(positions, kind='stable')
+        blocks, offsets = np.divmod(positions[order], self.block_size)
+        out = [b''] * len(positions)
+        current, decoded = -1, None
+        for i, block, offset in zip(order.tolist(), blocks.tolist(), offsets.tolist()):
+            if block != current:
+                current = block
+                decoded = self._decode_block(block)
+            out[i] = decoded[offset]
+        lengths = np.fromiter(map(len, out), dtype=np.int64, count=len(out))
+        bounds = np.zeros(len(out) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=bounds[1:])
+        return UrlColumn(np.frombuffer(b''.join(out), dtype=np.uint8), bounds)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the coded data, block offsets and sampled heads."""
+        return (len(self._data) + self._blocks.itemsize * len(self._blocks)
+                + sum(map(sys.getsizeof, self._sample)) + 8 * len(self._sample))
+
+UrlStore = Union[UrlDictionary, FrontCodedUrls]
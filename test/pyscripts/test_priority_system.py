@@ -7,13 +7,16 @@ Demonstrates the system with sample data and shows the priority calculation logi
 import os
 import tempfile
 import csv
+from sitemap_urls import UrlText
 from sitemap_priority_system import (
     load_gsc_data,
     load_page_explorer_data,
     merge_and_deduplicate,
     calculate_priority,
     assign_cluster,
+    cluster_codes,
     cluster_urls,
+    CLUSTER_NAMES,
     write_xml_sitemap,
     write_sitemap_index,
     main as main_function
@@ -169,6 +172,20 @@ def test_clustering():
             priority = url_entry['priority']
             print(f"    {url} (priority: {priority:.3f})")
 
+def test_cluster_codes():
+    """assign_cluster and cluster_codes follow cluster_rules.json on the URL path."""
+    urls = ['https://www.namesilo.com/', 'https://www.namesilo.com/Blog/x', '/domains/com', '/Domains/net/',
+            '/domains/a/b', 'https://www.namesilo.com/domains/com', '/blog/domains/x', '/help/tools',
+            'https://www.namesilo.com/TOOLS', '/domain-x/whois', '/broker', '/services', '/support/\u0130/tld/',
+            '/\u212aTOOL', 'https://www.namesilo.com/tld/com', '', 'https://tools.namesilo.com/x',
+            'https://www.namesilo.com/x?next=/blog/y', 'https://www.namesilo.com/blog']
+    expected = ['misc', 'blog', 'tlds', 'tlds', 'misc', 'tlds', 'blog', 'support', 'tools', 'tools', 'seo', 'seo',
+                'support', 'misc', 'tlds', 'misc', 'misc', 'misc', 'misc']
+    assert [assign_cluster(url, {}) for url in urls] == expected
+    assert [CLUSTER_NAMES[code] for code in cluster_codes(UrlText(urls)).tolist()] == expected
+    assert [CLUSTER_NAMES[code] for code in cluster_codes(UrlText(urls[:12])).tolist()] == expected[:12]
+    print("Cluster rules assign the expected clusters")
+
 def test_full_pipeline():
     """Test the full pipeline with sample data."""
     print("=== Testing Full Pipeline ===")
@@ -213,6 +230,7 @@ def main_test():
     # Test individual components
     test_priority_calculation()
     test_clustering()
+    test_cluster_codes()
     
     # Test full pipeline
     test_full_pipeline()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for multi-date GSC aggregation.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from sitemap_aggregate import aggregate_gsc_chunks, aggregate_gsc_groups, aggregate_gsc_table
+from sitemap_ingest import GSC_COLUMNS, load_gsc_table
+from sitemap_priority_system import merge_and_deduplicate
+
+DAILY_CSV = (
+    "date,url,clicks,impressions,ctr,position\n"
+    "2025-01-01,https://www.namesilo.com/,10,100,0.1,2\n"
+    "2025-01-01,https://www.namesilo.com/whois,0,0,0,9\n"
+    "2025-01-02,https://www.namesilo.com/,30,300,0.1,4\n"
+    "2025-01-02,https://www.namesilo.com/whois,0,0,0,7\n"
+    "2025-01-03,https://www.namesilo.com/,60,100,0.6,1\n"
+    "2025-01-03,https://www.namesilo.com/tld/com,5,50,0.1,3\n"
+)
+
+def test_weighted_aggregation_over_window():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'gsc.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(DAILY_CSV)
+        table = load_gsc_table(path, chunk_size=2, start_date='2025-01-01', end_date='2025-01-02')
+        assert list(table['url']) == ['https://www.namesilo.com/', 'https://www.namesilo.com/whois']
+        assert table['clicks'].tolist() == [40.0, 0.0]
+        assert table['impressions'].tolist() == [400.0, 0.0]
+        assert table['ctr'].tolist() == [0.1, 0.0]
+        assert table['position'].tolist() == [3.5, 8.0]
+
+        full = load_gsc_table(path, start_date='2025-01-01')
+        assert full['clicks'].tolist() == [100.0, 0.0, 5.0]
+        assert full['position'][0] == (2 * 100 + 4 * 300 + 1 * 100) / 500
+    finally:
+        shutil.rmtree(directory)
+
+def test_jsonl_window_with_cache():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'gsc.jsonl')
+        lines = DAILY_CSV.splitlines()
+        header = lines[0].split(',')
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in lines[1:]:
+                row = dict(zip(header, line.split(',')))
+                f.write(json.dumps({'keys': [row.pop('url'), row.pop('date')], **row}) + "\n")
+        expected = load_gsc_table(path, start_date='2025-01-02', end_date='2025-01-03')
+        assert expected['clicks'].tolist() == [90.0, 0.0, 5.0]
+        cache_dir = os.path.join(directory, 'cache')
+        for options in ({'cache_dir': cache_dir}, {'cache_dir': cache_dir}, {'incremental': True, 'cache_dir': cache_dir}):
+            table = load_gsc_table(path, start_date='2025-01-02', end_date='2025-01-03', **options)
+            assert list(table['url']) == list(expected['url'])
+            for col in GSC_COLUMNS:
+                assert table[col].tolist() == expected[col].tolist()
+    finally:
+        shutil.rmtree(directory)
+
+def test_chunking_does_not_change_result():
+    rng = np.random.default_rng(7)
+    n = 5000
+    urls = np.array([f"https://www.namesilo.com/p{i}" for i in rng.integers(0, 300, n)], dtype=object)
+    table = {
+        'url': urls,
+        'clicks': rng.integers(0, 50, n).astype(float),
+        'impressions': rng.integers(0, 500, n).astype(float),
+        'ctr': np.zeros(n),
+        'position': rng.uniform(1, 60, n),
+    }
+    whole = aggregate_gsc_table(table, GSC_COLUMNS)
+    chunks = [{k: v[i:i + 777] for k, v in table.items()} for i in range(0, n, 777)]
+    pieced = aggregate_gsc_chunks(chunks, GSC_COLUMNS)
+    assert list(whole['url']) == list(pieced['url'])
+    for col in GSC_COLUMNS:
+        assert np.allclose(whole[col], pieced[col])
+    first = whole['url'][0]
+    rows = urls == first
+    impressions = table['impressions'][rows].sum()
+    assert whole['clicks'][0] == table['clicks'][rows].sum()
+    if impressions:
+        assert np.isclose(whole['position'][0], (table['position'][rows] * table['impressions'][rows]).sum() / impressions)
+
+def test_window_without_date_column_is_an_error():
+    table = {'url': np.array(['https://www.namesilo.com/'], dtype=object), 'clicks': np.ones(1)}
+    try:
+        aggregate_gsc_chunks([table], ('clicks',), start_date='2025-01-01')
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError")
+
+def test_merge_aggregates_repeated_gsc_rows():
+    gsc = [
+        {'url': 'https://www.namesilo.com/blog/a/', 'clicks': 10.0, 'impressions': 100.0, 'ctr': 0.1, 'position': 2.0},
+        {'url': 'https://www.namesilo.com/blog/a', 'clicks': 30.0, 'impressions': 300.0, 'ctr': 0.1, 'position': 4.0},
+    ]
+    pe = [{'url': 'https://www.namesilo.com/blog/a', 'importance': 50.0, 'depth': 2.0,
+           'internal_links': 10.0, 'health': 90.0}]
+    merged = merge_and_deduplicate(gsc, pe)
+    assert len(merged) == 1
+    entry = merged[0]
+    assert entry['clicks'] == 40.0 and entry['impressions'] == 400.0
+    assert entry['position'] == 3.5
+    assert entry['importance'] == 50.0
+    assert entry['url'] == 'https://www.namesilo.com/blog/a'
+
+def test_grouped_aggregation_matches_table():
+    rng = np.random.default_rng(5)
+    n = 2000
+    groups = rng.integers(0, 150, n)
+    table = {
+        'url': np.array([f"https://www.namesilo.com/p{g}" for g in groups], dtype=object),
+        'clicks': rng.integers(0, 50, n).astype(float),
+        'impressions': rng.integers(0, 3, n).astype(float),
+        'ctr': np.zeros(n),
+        'position': rng.uniform(1, 60, n),
+    }
+    whole = aggregate_gsc_table(table, GSC_COLUMNS)
+    # Number groups by first appearance, as aggregate_gsc_table orders its rows
+    _, first, inverse = np.unique(groups, return_index=True, return_inverse=True)
+    rank = np.argsort(np.argsort(first, kind='stable'))
+    grouped = aggregate_gsc_groups(rank[inverse], len(first), table, GSC_COLUMNS)
+    assert grouped['url'].tolist() == list(range(len(first)))
+    for col in GSC_COLUMNS:
+        assert np.allclose(whole[col], grouped[col])
+
+if __name__ == "__main__":
+    test_weighted_aggregation_over_window()
+    test_jsonl_window_with_cache()
+    test_chunking_does_not_change_result()
+    test_window_without_date_column_is_an_error()
+    test_merge_aggregates_repeated_gsc_rows()
+    test_grouped_aggregation_matches_table()
+    print("Aggregation tests passed!")
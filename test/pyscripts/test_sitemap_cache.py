@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Tests for the parsed-table cache.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import sitemap_cache
+from sitemap_cache import _entry_size, cache_key, evict, load_cached, load_csv_incremental, read_table, write_table
+from sitemap_ingest import GSC_COLUMNS, load_gsc_table
+from sitemap_urls import UrlColumn
+
+GSC_CSV = (
+    "url,clicks,impressions,ctr,position\n"
+    "https://www.namesilo.com/,1500,25000,0.06,2.5\n"
+    "https://www.namesilo.com/blog/é,10,200,0.05,7\n"
+)
+
+def make_workspace():
+    """Create a temp dir holding a GSC export and an empty cache dir."""
+    root = tempfile.mkdtemp()
+    path = os.path.join(root, 'gsc.csv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(GSC_CSV)
+    return root, path, os.path.join(root, 'cache')
+
+def test_warm_run_maps_cached_columns():
+    root, path, cache_dir = make_workspace()
+    try:
+        cold = load_gsc_table(path, cache_dir=cache_dir)
+        assert not isinstance(cold['clicks'], np.memmap)
+        assert len(os.listdir(cache_dir)) == 1
+        warm = load_gsc_table(path, cache_dir=cache_dir)
+        assert isinstance(warm['clicks'], np.memmap)
+        # URLs stay as mapped bytes and offsets until a row is read
+        assert isinstance(warm['url'], UrlColumn)
+        assert isinstance(warm['url'].data, np.memmap) and isinstance(warm['url'].offsets, np.memmap)
+        assert list(warm['url']) == list(cold['url'])
+        assert warm['url'][1] == cold['url'][1]
+        for col in GSC_COLUMNS:
+            assert warm[col].tolist() == cold[col].tolist()
+    finally:
+        shutil.rmtree(root)
+
+def test_warm_run_skips_parser():
+    root, path, cache_dir = make_workspace()
+    try:
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return load_gsc_table(path)
+
+        load_cached([path], GSC_COLUMNS, loader, cache_dir)
+        load_cached([path], GSC_COLUMNS, loader, cache_dir)
+        assert len(calls) == 1
+    finally:
+        shutil.rmtree(root)
+
+def test_key_tracks_content_and_version():
+    root, path, cache_dir = make_workspace()
+    try:
+        key = cache_key([path], GSC_COLUMNS, 1)
+        assert cache_key([path], GSC_COLUMNS, 2) != key
+        assert cache_key([path], GSC_COLUMNS[:2], 1) != key
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("https://www.namesilo.com/whois,1,1,1,1\n")
+        assert cache_key([path], GSC_COLUMNS, 1) != key
+        assert len(load_gsc_table(path, cache_dir=cache_dir)['url']) == 3
+    finally:
+        shutil.rmtree(root)
+
+def test_lru_eviction_respects_size_cap():
+    root, path, cache_dir = make_workspace()
+    try:
+        entries = []
+        for i in range(3):
+            table = {'url': np.array([f"https://www.namesilo.com/{i}"], dtype=object),
+                     'clicks': np.array([float(i)])}
+            load_cached([path], (f"col{i}",), lambda: table, cache_dir)
+            entries.append(cache_key([path], (f"col{i}",)))
+            os.utime(os.path.join(cache_dir, entries[-1]), (i, i))
+        # Touching entry 0 makes entry 1 the least recently used
+        os.utime(os.path.join(cache_dir, entries[0]), (10, 10))
+        sizes = {name: sum(os.path.getsize(os.path.join(cache_dir, name, f))
+                           for f in os.listdir(os.path.join(cache_dir, name))) for name in entries}
+        evict(cache_dir, sizes[entries[0]] + sizes[entries[2]])
+        assert sorted(os.listdir(cache_dir)) == sorted([entries[0], entries[2]])
+    finally:
+        shutil.rmtree(root)
+
+def test_eviction_leaves_incremental_state():
+    root, path, cache_dir = make_workspace()
+    try:
+        load_gsc_table(path, cache_dir=cache_dir, incremental=True)
+        state = os.listdir(os.path.join(cache_dir, 'incremental'))
+        os.utime(os.path.join(cache_dir, 'incremental'), (0, 0))
+        table = {'url': np.array(["https://www.namesilo.com/"], dtype=object), 'clicks': np.array([1.0])}
+        load_cached([path], ('clicks',), lambda: table, cache_dir, max_bytes=1)
+        assert sorted(os.listdir(os.path.join(cache_dir, 'incremental'))) == sorted(state)
+        assert sorted(os.listdir(cache_dir)) == sorted(['incremental', cache_key([path], ('clicks',))])
+        evict(cache_dir, 0)
+        assert os.listdir(cache_dir) == ['incremental']
+    finally:
+        shutil.rmtree(root)
+
+def test_text_columns_round_trip():
+    root = tempfile.mkdtemp()
+    try:
+        urls = ['https://www.namesilo.com/a\nb', '', 'https://www.namesilo.com/é']
+        table = {'url': np.array(urls, dtype=object), 'date': np.array(['2024-01-01', '', 'x'], dtype=object),
+                 'clicks': np.arange(3.0)}
+        write_table(os.path.join(root, 'entry'), table)
+        back = read_table(os.path.join(root, 'entry'))
+        assert list(back) == ['url', 'date', 'clicks']
+        assert back['url'].tolist() == urls and back['date'].tolist() == ['2024-01-01', '', 'x']
+        empty = {'url': np.empty(0, dtype=object), 'clicks': np.zeros(0)}
+        write_table(os.path.join(root, 'empty'), empty)
+        assert len(read_table(os.path.join(root, 'empty'))['url']) == 0
+        # Entry sizes count nested files too
+        os.makedirs(os.path.join(root, 'entry', 'nested'))
+        with open(os.path.join(root, 'entry', 'nested', 'blob'), 'wb') as f:
+            f.write(b'x' * 5000)
+        assert _entry_size(os.path.join(root, 'entry')) > 5000
+    finally:
+        shutil.rmtree(root)
+
+def test_incremental_parses_only_appended_tail():
+    root, path, cache_dir = make_workspace()
+    try:
+        stats = {}
+        first = load_csv_incremental(path, GSC_COLUMNS, cache_dir, stats=stats)
+        assert stats['mode'] == 'full' and len(first['url']) == 2
+        size = os.path.getsize(path)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("https://www.namesilo.com/whois,3,30,0.1,4\n")
+        second = load_csv_incremental(path, GSC_COLUMNS, cache_dir, stats=stats)
+        assert stats['mode'] == 'incremental'
+        assert stats['parsed_bytes'] == os.path.getsize(path) - size
+        assert list(second['url']) == list(load_gsc_table(path)['url'])
+        assert second['clicks'].tolist() == [1500.0, 10.0, 3.0]
+        load_csv_incremental(path, GSC_COLUMNS, cache_dir, stats=stats)
+        assert stats['mode'] == 'incremental' and stats['parsed_bytes'] == 0
+    finally:
+        shutil.rmtree(root)
+
+def test_incremental_appends_in_place():
+    root, path, cache_dir = make_workspace()
+    try:
+        load_csv_incremental(path, GSC_COLUMNS, cache_dir)
+        entry_dir = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        inodes = {name: os.stat(os.path.join(entry_dir, name)).st_ino for name in ('url.bin', 'clicks.npy')}
+        # Bytes past the stored row count, as an interrupted append leaves them
+        with open(os.path.join(entry_dir, 'url.bin'), 'ab') as f:
+            f.write(b'garbage')
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("https://www.namesilo.com/whois,3,30,0.1,4\n")
+        table = load_csv_incremental(path, GSC_COLUMNS, cache_dir)
+        assert {name: os.stat(os.path.join(entry_dir, name)).st_ino for name in inodes} == inodes
+        assert isinstance(table['clicks'], np.memmap) and table['clicks'].tolist() == [1500.0, 10.0, 3.0]
+        assert table['url'].equals(read_table(entry_dir)['url'])
+        assert list(table['url']) == list(load_gsc_table(path)['url'])
+    finally:
+        shutil.rmtree(root)
+
+def test_incremental_keeps_partial_row_out_of_state():
+    root, path, cache_dir = make_workspace()
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("https://www.namesilo.com/tld/com,5,50")
+        stats = {}
+        table = load_csv_incremental(path, GSC_COLUMNS, cache_dir, stats=stats)
+        assert table['clicks'].tolist() == [1500.0, 10.0, 5.0]
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("0,0.1,2\n")
+        table = load_csv_incremental(path, GSC_COLUMNS, cache_dir, stats=stats)
+        assert stats['mode'] == 'incremental'
+        assert table['impressions'].tolist() == [25000.0, 200.0, 500.0]
+    finally:
+        shutil.rmtree(root)
+
+def test_incremental_falls_back_when_prefix_changes():
+    root, path, cache_dir = make_workspace()
+    try:
+        load_csv_incremental(path, GSC_COLUMNS, cache_dir)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(GSC_CSV.replace('1500', '1600') + "https://www.namesilo.com/ssl,1,1,1,1\n")
+        stats = {}
+        table = load_csv_incremental(path, GSC_COLUMNS, cache_dir, stats=stats)
+        assert stats['mode'] == 'full'
+        assert table['clicks'].tolist() == [1600.0, 10.0, 1.0]
+        assert len([n for n in os.listdir(cache_dir) if not n.endswith('.json')]) == 1
+    finally:
+        shutil.rmtree(root)
+
+def test_incremental_detects_edit_inside_prefix():
+    root, path, cache_dir = make_workspace()
+    block_bytes = sitemap_cache.HASH_BLOCK_BYTES
+    # Small blocks, so the edited row lies blocks away from both ends of the prefix
+    sitemap_cache.HASH_BLOCK_BYTES = 4096
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(GSC_CSV.splitlines()[0] + "\n")
+            f.writelines(f"https://www.namesilo.com/p{i},1,10,0.1,3\n" for i in range(3000))
+        load_csv_incremental(path, GSC_COLUMNS, cache_dir)
+        with open(path, 'r+', encoding='utf-8') as f:
+            text = f.read()
+            f.seek(0)
+            f.write(text.replace("/p1500,1,", "/p1500,9,"))
+            f.write("https://www.namesilo.com/ssl,1,1,1,1\n")
+        stats = {}
+        table = load_csv_incremental(path, GSC_COLUMNS, cache_dir, stats=stats)
+        assert stats['mode'] == 'full'
+        assert table['clicks'][1500] == 9.0 and len(table['url']) == 3001
+        assert table['clicks'].tolist() == load_gsc_table(path)['clicks'].tolist()
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("https://www.namesilo.com/whois,3,30,0.1,4\n")
+        assert load_csv_incremental(path, GSC_COLUMNS, cache_dir, stats=stats)['clicks'][-1] == 3.0
+        assert stats['mode'] == 'incremental'
+    finally:
+        sitemap_cache.HASH_BLOCK_BYTES = block_bytes
+        shutil.rmtree(root)
+
+def test_incremental_through_loader():
+    root, path, cache_dir = make_workspace()
+    try:
+        load_gsc_table(path, cache_dir=cache_dir, incremental=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("https://www.namesilo.com/whois,3,30,0.1,4\n")
+        table = load_gsc_table(path, cache_dir=cache_dir, incremental=True)
+        assert table['position'].tolist() == [2.5, 7.0, 4.0]
+        assert os.path.isdir(os.path.join(cache_dir, 'incremental'))
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == "__main__":
+    test_warm_run_maps_cached_columns()
+    test_warm_run_skips_parser()
+    test_key_tracks_content_and_version()
+    test_lru_eviction_respects_size_cap()
+    test_eviction_leaves_incremental_state()
+    test_text_columns_round_trip()
+    test_incremental_parses_only_appended_tail()
+    test_incremental_appends_in_place()
+    test_incremental_keeps_partial_row_out_of_state()
+    test_incremental_falls_back_when_prefix_changes()
+    test_incremental_detects_edit_inside_prefix()
+    test_incremental_through_loader()
+    print("Cache tests passed!")
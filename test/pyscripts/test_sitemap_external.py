@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-budgeted external merge.
+"""
+
+import csv
+import filecmp
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from sitemap_aggregate import aggregate_gsc_groups, combine_gsc_values
+from sitemap_external import SpillSorter, external_merge
+from sitemap_ingest import GSC_COLUMNS, PE_COLUMNS
+from sitemap_join import merge_tables
+from sitemap_priority_system import main, stream_xml_sitemap, write_xml_sitemap
+from sitemap_urls import UrlDictionary
+from test_sitemap_join import random_tables
+
+def chunked(table, size):
+    n = len(table['url'])
+    for start in range(0, n, size):
+        yield {name: values[start:start + size] for name, values in table.items()}
+
+def test_spill_sorter_many_runs():
+    rng = random.Random(3)
+    rows = [(rng.randrange(500), i, 'x' * rng.randrange(20)) for i in range(5000)]
+    with SpillSorter(4096, fan_in=2) as sorter:
+        sorter.extend(rows)
+        result = list(sorter)
+        assert sorter.stats['runs'] > 10
+        assert sorter.stats['merge_passes'] > 1
+        assert sorter.stats['rows'] == len(rows)
+    assert result == sorted(rows)
+
+    with SpillSorter(key=lambda row: -row[0]) as sorter:
+        sorter.extend(rows)
+        assert list(sorter) == sorted(rows, key=lambda row: -row[0])
+        assert sorter.stats['runs'] == 0
+
+def test_spill_files_removed():
+    with tempfile.TemporaryDirectory() as spill_dir:
+        with SpillSorter(1024, spill_dir=spill_dir) as sorter:
+            sorter.extend((i % 7, i) for i in range(1000))
+            assert os.listdir(spill_dir)
+            assert len(list(sorter)) == 1000
+        assert not os.listdir(spill_dir)
+
+def test_external_merge_matches_merge_tables():
+    gsc_table, pe_table = random_tables(5)
+    for aggregate_gsc in (True, False):
+        urls = UrlDictionary()
+        expected_stats, stats = {}, {}
+        expected = merge_tables(gsc_table, pe_table, urls, aggregate_gsc=aggregate_gsc, stats=expected_stats)
+        chunks = list(external_merge(chunked(gsc_table, 300), chunked(pe_table, 300), GSC_COLUMNS, PE_COLUMNS,
+                                     memory_budget=20000, aggregate_gsc=aggregate_gsc, chunk_size=50, stats=stats))
+        assert all(len(chunk['url']) <= 50 for chunk in chunks)
+        merged = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+        assert merged['url'].tolist() == sorted(merged['url'].tolist())
+        order = np.argsort(merged['first_seq'])
+        assert merged['url'][order].tolist() == urls.lookup(expected['url_id'].tolist())
+        for name in ('has_gsc', 'has_pe') + GSC_COLUMNS + PE_COLUMNS:
+            assert merged[name][order].tolist() == expected[name].tolist(), name
+        assert {name: stats[name] for name in expected_stats} == expected_stats
+        assert stats['runs'] > 1
+
+def test_combine_gsc_values_matches_groups():
+    rng = np.random.default_rng(2)
+    groups = rng.integers(0, 30, 400)
+    table = {'clicks': rng.integers(0, 9, 400).astype(float), 'impressions': rng.integers(0, 3, 400).astype(float),
+             'ctr': rng.uniform(0, 1, 400), 'position': rng.uniform(1, 50, 400)}
+    columns = list(GSC_COLUMNS)
+    aggregated = aggregate_gsc_groups(groups, 30, table, columns)
+    for group in range(30):
+        rows = [tuple(table[col][i] for col in columns) for i in np.flatnonzero(groups == group)]
+        assert combine_gsc_values(rows, columns) == [aggregated[col][group] for col in columns]
+
+def test_stream_xml_sitemap_matches_tree_writer():
+    entries = [('https://www.namesilo.com/a?b=1&c=<2>', 0.91), ('https://www.namesilo.com/"q"', 0.5),
+               ('', 0.1), ('https://www.namesilo.com/é', 0.333)]
+    with tempfile.TemporaryDirectory() as tmp:
+        write_xml_sitemap('blog', [{'url': url, 'priority': p} for url, p in entries], os.path.join(tmp, 'tree'))
+        assert stream_xml_sitemap('blog', iter(entries), os.path.join(tmp, 'stream')) == len(entries)
+        assert filecmp.cmp(os.path.join(tmp, 'tree', 'blog-sitemap.xml'),
+                           os.path.join(tmp, 'stream', 'blog-sitemap.xml'), shallow=False)
+        assert stream_xml_sitemap('tools', [], os.path.join(tmp, 'stream')) == 0
+
+def test_main_with_memory_budget():
+    gsc_table, pe_table = random_tables(8)
+    with tempfile.TemporaryDirectory() as tmp:
+        gsc_path, pe_path = os.path.join(tmp, 'gsc.csv'), os.path.join(tmp, 'pe.csv')
+        for path, table, columns in ((gsc_path, gsc_table, GSC_COLUMNS), (pe_path, pe_table, PE_COLUMNS)):
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(('url',) + columns)
+                writer.writerows(zip(*(table[col].tolist() for col in ('url',) + columns)))
+        main(gsc_path, pe_path, os.path.join(tmp, 'memory'))
+        main(gsc_path, pe_path, os.path.join(tmp, 'external'), chunk_size=500, memory_budget=30000)
+        comparison = filecmp.dircmp(os.path.join(tmp, 'memory'), os.path.join(tmp, 'external'))
+        assert comparison.left_list == comparison.right_list
+        _, mismatch, errors = filecmp.cmpfiles(comparison.left, comparison.right, comparison.left_list, shallow=False)
+        assert not mismatch and not errors
+
+if __name__ == "__main__":
+    test_spill_sorter_many_runs()
+    test_spill_files_removed()
+    test_external_merge_matches_merge_tables()
+    test_combine_gsc_values_matches_groups()
+    test_stream_xml_sitemap_matches_tree_writer()
+    test_main_with_memory_budget()
+    print("External merge tests passed!")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-URL feature store.
+"""
+
+import csv
+import filecmp
+import os
+import tempfile
+
+import numpy as np
+
+from sitemap_features import feature_key, rescore_changed
+from sitemap_ingest import GSC_COLUMNS, PE_COLUMNS
+from sitemap_priority_system import main, read_score_breakdown
+from test_sitemap_join import random_tables
+
+def feature_table(n, seed):
+    rng = np.random.default_rng(seed)
+    urls = np.array([f"https://www.namesilo.com/p{i}" for i in rng.permutation(n)], dtype=object)
+    table = {'url_id': np.arange(n, dtype=np.int32), 'has_gsc': rng.random(n) < 0.8,
+             'clicks': rng.integers(0, 20, n).astype(float), 'ctr': rng.uniform(0, 1, n)}
+    table['ctr'][::7] = np.nan
+    return table, urls
+
+def double_clicks(table, urls, calls):
+    def compute(rows):
+        calls.append(rows)
+        return {'score': table['clicks'][rows] * 2 + np.nan_to_num(table['ctr'][rows]),
+                'flag': table['has_gsc'][rows].astype(np.int8)}
+    return compute
+
+def test_only_changed_rows_recomputed():
+    with tempfile.TemporaryDirectory() as store:
+        table, urls = feature_table(1000, 1)
+        calls, stats = [], {}
+        first = rescore_changed(table, urls, double_clicks(table, urls, calls), 'k', store, stats)
+        assert stats['mode'] == 'full' and len(calls[0]) == 1000
+
+        # Reorder, drop 50 URLs, add 30, change 20 values; NaNs left alone must not count as changes
+        rng = np.random.default_rng(2)
+        keep = rng.permutation(1000)[:950]
+        table = {name: values[keep].copy() for name, values in table.items()}
+        urls = np.concatenate([urls[keep], np.array([f"https://www.namesilo.com/new{i}" for i in range(30)],
+                                                    dtype=object)])
+        table = {name: np.concatenate([values, values[:30]]) for name, values in table.items()}
+        changed = rng.choice(950, 20, replace=False)
+        table['clicks'][changed[:10]] += 1
+        table['has_gsc'][changed[10:]] = ~table['has_gsc'][changed[10:]]
+
+        calls, stats = [], {}
+        second = rescore_changed(table, urls, double_clicks(table, urls, calls), 'k', store, stats)
+        assert stats == {'mode': 'incremental', 'rows': 980, 'rescored': 50, 'new': 30, 'changed': 20,
+                         'removed': 50}
+        assert sorted(calls[0].tolist()) == sorted(changed.tolist() + list(range(950, 980)))
+        expected = double_clicks(table, urls, [])(np.arange(980))
+        for name in expected:
+            assert second[name].dtype == expected[name].dtype
+            assert second[name].tolist() == expected[name].tolist()
+        assert second['score'][:950].tolist() != first['score'][keep].tolist()
+
+        calls, stats = [], {}
+        rescore_changed(table, urls, double_clicks(table, urls, calls), 'k', store, stats)
+        assert stats['rescored'] == 0 and len(calls[0]) == 0
+
+        # Another key (e.g. a new scoring model) invalidates the stored outputs
+        rescore_changed(table, urls, double_clicks(table, urls, calls), 'other', store, stats)
+        assert stats['mode'] == 'full' and stats['rescored'] == 980
+        assert len(os.listdir(store)) == 2
+
+def test_feature_key():
+    assert feature_key('a', {'x': [1]}) == feature_key('a', {'x': [1]})
+    assert feature_key('a', {'x': [1]}) != feature_key('b', {'x': [1]})
+
+def write_inputs(tmp, gsc_table, pe_table):
+    paths = os.path.join(tmp, 'gsc.csv'), os.path.join(tmp, 'pe.csv')
+    for path, table, columns in zip(paths, (gsc_table, pe_table), (GSC_COLUMNS, PE_COLUMNS)):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('url',) + columns)
+            writer.writerows(zip(*(table[col].tolist() for col in ('url',) + columns)))
+    return paths
+
+def same_output(left, right):
+    comparison = filecmp.dircmp(left, right)
+    _, mismatch, errors = filecmp.cmpfiles(left, right, comparison.left_list, shallow=False)
+    return comparison.left_list == comparison.right_list and not mismatch and not errors
+
+def test_main_with_feature_store():
+    gsc_table, pe_table = random_tables(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = os.path.join(tmp, 'store')
+        main(*write_inputs(tmp, gsc_table, pe_table), os.path.join(tmp, 'day1'), feature_store=store)
+        gsc_table['clicks'][::5] += 3
+        pe_table['health'][::9] = 0.0
+        paths = write_inputs(tmp, gsc_table, pe_table)
+        main(*paths, os.path.join(tmp, 'day2'), feature_store=store)
+        main(*paths, os.path.join(tmp, 'fresh'))
+        assert same_output(os.path.join(tmp, 'fresh'), os.path.join(tmp, 'day2'))
+        assert not same_output(os.path.join(tmp, 'day1'), os.path.join(tmp, 'day2'))
+
+def test_main_score_breakdown():
+    gsc_table, pe_table = random_tables(12)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_inputs(tmp, gsc_table, pe_table)
+        fresh, incremental = os.path.join(tmp, 'fresh'), os.path.join(tmp, 'incremental')
+        main(*paths, os.path.join(tmp, 'out'), breakdown_dir=fresh)
+        store = os.path.join(tmp, 'store')
+        main(*paths, os.path.join(tmp, 'out'), feature_store=store)
+        main(*paths, os.path.join(tmp, 'out'), feature_store=store, breakdown_dir=incremental)
+        records = read_score_breakdown(fresh)
+        assert records == read_score_breakdown(incremental)
+        urls = [record['url'] for record in records]
+        assert urls == sorted(urls) and len(set(urls)) == len(urls)
+        assert list(records[0]) == ['url', 'priority', 'gsc', 'pe', 'business']
+        start, stop = 'https://www.namesilo.com/p1', 'https://www.namesilo.com/p2'
+        assert read_score_breakdown(fresh, start, stop) == [r for r in records if start <= r['url'] < stop]
+        assert read_score_breakdown(fresh, stop=start) == [r for r in records if r['url'] < start]
+        assert read_score_breakdown(fresh, stop, start) == []
+
+if __name__ == "__main__":
+    test_only_changed_rows_recomputed()
+    test_feature_key()
+    test_main_with_feature_store()
+    test_main_score_breakdown()
+    print("Feature store tests passed!")
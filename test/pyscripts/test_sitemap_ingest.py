@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar ingestion engine.
+"""
+
+import bz2
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from sitemap_ingest import (
+    COLUMN_ALIASES,
+    GSC_COLUMNS,
+    PE_COLUMNS,
+    expand_inputs,
+    filter_table,
+    indexable_mask,
+    iter_csv_chunks,
+    load_csv_table,
+    load_csv_table_parallel,
+    load_gsc_table,
+    load_page_explorer_table,
+    merge_diagnostics,
+    new_diagnostics,
+    register_alias,
+    sniff_encoding,
+    split_byte_ranges,
+    supports_byte_ranges,
+    table_len,
+    table_to_records,
+)
+from sitemap_priority_system import load_gsc_data, load_page_explorer_data
+
+def write_temp_csv(text, suffix='.csv'):
+    """Write text to a temporary file and return its path."""
+    with tempfile.NamedTemporaryFile(mode='w', suffix=suffix, delete=False, encoding='utf-8', newline='') as f:
+        f.write(text)
+        return f.name
+
+GSC_CSV = (
+    "url,clicks,impressions,ctr,position\n"
+    "https://www.namesilo.com/,1500,25000,0.06,2.5\n"
+    "https://www.namesilo.com/blog/a, 10 ,200,,7\n"
+    ",5,5,5,5\n"
+    "https://www.namesilo.com/whois,n/a,100,0.01,4\n"
+    "https://www.namesilo.com/short,3\n"
+)
+
+def test_chunked_matches_single_chunk():
+    path = write_temp_csv(GSC_CSV)
+    try:
+        whole = load_csv_table(path, GSC_COLUMNS, chunk_size=1000)
+        chunks = list(iter_csv_chunks(path, GSC_COLUMNS, chunk_size=2))
+        assert [table_len(c) for c in chunks] == [2, 1, 1]
+        pieced = load_csv_table(path, GSC_COLUMNS, chunk_size=2)
+        for col in ('url',) + GSC_COLUMNS:
+            assert list(whole[col]) == list(pieced[col])
+        assert whole['clicks'].dtype == np.float64
+    finally:
+        os.unlink(path)
+
+def test_blank_and_unparseable_values_default_to_zero():
+    path = write_temp_csv(GSC_CSV)
+    try:
+        table = load_csv_table(path, GSC_COLUMNS)
+        assert list(table['url']) == [
+            'https://www.namesilo.com/',
+            'https://www.namesilo.com/blog/a',
+            'https://www.namesilo.com/whois',
+            'https://www.namesilo.com/short',
+        ]
+        assert table['clicks'].tolist() == [1500.0, 10.0, 0.0, 3.0]
+        assert table['ctr'].tolist() == [0.06, 0.0, 0.01, 0.0]
+        assert table['position'].tolist() == [2.5, 7.0, 4.0, 0.0]
+    finally:
+        os.unlink(path)
+
+def test_missing_columns_default_to_zero():
+    path = write_temp_csv("URL,importance\nhttps://www.namesilo.com/tld/com,90\n")
+    try:
+        records = load_page_explorer_data(path)
+        assert records == [{
+            'url': 'https://www.namesilo.com/tld/com',
+            'importance': 90.0,
+            'depth': 0.0,
+            'internal_links': 0.0,
+            'health': 0.0,
+        }]
+    finally:
+        os.unlink(path)
+
+def test_record_loader_shape():
+    path = write_temp_csv(GSC_CSV)
+    try:
+        records = load_gsc_data(path, chunk_size=1)
+        assert len(records) == 4
+        assert set(records[0]) == {'url'} | set(GSC_COLUMNS)
+        assert isinstance(records[0]['clicks'], float)
+        assert table_to_records(load_csv_table(path, GSC_COLUMNS)) == records
+    finally:
+        os.unlink(path)
+
+def test_missing_url_column_yields_empty_table():
+    path = write_temp_csv("address,importance\nhttps://www.namesilo.com/,90\n")
+    try:
+        table = load_csv_table(path, PE_COLUMNS)
+        assert table_len(table) == 0
+        assert set(table) == {'url'} | set(PE_COLUMNS)
+    finally:
+        os.unlink(path)
+
+def make_large_gsc_csv(rows=2000):
+    """Build a GSC export with enough rows to split into several byte ranges."""
+    lines = ["url,clicks,impressions,ctr,position"]
+    for i in range(rows):
+        lines.append(f"https://www.namesilo.com/blog/post-{i},{i % 97},{i * 3},{(i % 10) / 10},{i % 50 + 0.5}")
+        if i % 250 == 0:
+            lines.append(",1,1,1,1")
+    return "\n".join(lines) + "\n"
+
+def test_byte_ranges_are_newline_aligned():
+    path = write_temp_csv(make_large_gsc_csv())
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        header_end = data.index(b'\n') + 1
+        ranges = split_byte_ranges(path, 7, header_end)
+        assert ranges[0][0] == header_end
+        assert ranges[-1][1] == len(data)
+        for (lo, hi), (next_lo, _) in zip(ranges, ranges[1:]):
+            assert hi == next_lo
+            assert data[hi - 1:hi] == b'\n'
+    finally:
+        os.unlink(path)
+
+def test_parallel_loader_matches_serial():
+    path = write_temp_csv(make_large_gsc_csv())
+    try:
+        serial = load_csv_table(path, GSC_COLUMNS)
+        parallel = load_csv_table_parallel(path, GSC_COLUMNS, workers=3, chunk_size=100, min_range_bytes=1)
+        for col in ('url',) + GSC_COLUMNS:
+            assert list(serial[col]) == list(parallel[col])
+        assert table_len(parallel) == 2000
+    finally:
+        os.unlink(path)
+
+def test_parallel_loader_handles_quoted_line_breaks():
+    lines = ["url,title,clicks,impressions,ctr,position"]
+    for i in range(4000):
+        title = f'"Post {i}\nsecond line, with ""quotes""\n"' if i % 3 == 0 else f"Post {i}"
+        lines.append(f"https://www.namesilo.com/blog/post-{i},{title},{i % 97},{i * 3},0.1,{i % 50 + 0.5}")
+    path = write_temp_csv("\n".join(lines) + "\n")
+    try:
+        serial = load_csv_table(path, GSC_COLUMNS)
+        assert table_len(serial) == 4000
+        for workers in (2, 4, 7):
+            diagnostics = new_diagnostics()
+            parallel = load_csv_table_parallel(path, GSC_COLUMNS, workers=workers, min_range_bytes=1,
+                                               diagnostics=diagnostics)
+            assert diagnostics['rows'] == 4000
+            for col in ('url',) + GSC_COLUMNS:
+                assert list(serial[col]) == list(parallel[col])
+    finally:
+        os.unlink(path)
+
+def write_shards(directory):
+    """Write three daily GSC shards in different encodings; return expected URLs."""
+    header = "url,clicks,impressions,ctr,position\n"
+    days = [
+        ('gsc-2025-01-01.csv.gz', gzip.open),
+        ('gsc-2025-01-02.csv.bz2', bz2.open),
+        ('gsc-2025-01-03.csv', open),
+    ]
+    expected = []
+    for day, (name, opener) in enumerate(days):
+        body = header
+        for i in range(3):
+            url = f"https://www.namesilo.com/day{day}/page-{i}"
+            body += f"{url},{i},{i * 10},0.1,{day + 1}\n"
+            expected.append(url)
+        with opener(os.path.join(directory, name), 'wt', encoding='utf-8') as f:
+            f.write(body)
+    with open(os.path.join(directory, 'notes.txt'), 'w') as f:
+        f.write("not a shard")
+    return expected
+
+def test_shard_directory_and_glob():
+    directory = tempfile.mkdtemp()
+    try:
+        expected = write_shards(directory)
+        assert len(expand_inputs(directory)) == 3
+        assert expand_inputs(os.path.join(directory, '*.csv*')) == expand_inputs(directory)
+        serial = load_gsc_table(directory)
+        assert list(serial['url']) == expected
+        assert serial['position'].tolist() == [1.0] * 3 + [2.0] * 3 + [3.0] * 3
+        parallel = load_gsc_table(os.path.join(directory, 'gsc-*'), workers=3)
+        assert list(parallel['url']) == expected
+        assert parallel['impressions'].tolist() == serial['impressions'].tolist()
+    finally:
+        shutil.rmtree(directory)
+
+def test_zstd_shard():
+    try:
+        import zstandard
+    except ImportError:
+        return
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'gsc.csv.zst')
+        text = "url,clicks\nhttps://www.namesilo.com/whois,7\n"
+        with open(path, 'wb') as f:
+            f.write(zstandard.ZstdCompressor().compress(text.encode('utf-8')))
+        table = load_gsc_table(path, workers=2)
+        assert list(table['url']) == ['https://www.namesilo.com/whois']
+        assert table['clicks'].tolist() == [7.0]
+    finally:
+        shutil.rmtree(directory)
+
+PE_EXPORT_HEADER = ("\tid\turl\tdepth\thealth\tpage_type\tindexable\tschema_org_types\timportance\thttps"
+                    "\tlinked\ttype\tin_xml_sitemap\th1\tmeta_description\threflang\tstatus\ttitle"
+                    "\tincoming_internal_links\n")
+
+def pe_export_line(n, url, depth, health, indexable, importance, h1, meta, status, links):
+    return (f"{n}\t{1000 + n}\t{url}\t{depth}\t{health}\tresource_hub_page\t{indexable}\t\t{importance}"
+            f"\tTRUE\tTRUE\ttext/html\tTRUE\t{h1}\t{meta}\t\t{status}\tTitle {n}\t{links}\n")
+
+def test_page_explorer_export_projection():
+    text = PE_EXPORT_HEADER
+    text += pe_export_line(0, 'https://www.namesilo.com/', 0, 906, 'TRUE', 100, "['Home']", 'Cheap "domains"', 200, 2202)
+    text += pe_export_line(1, 'https://www.namesilo.com/old', 2, 850, 'FALSE', 5, '[]', '""Broken\n""', 308, 3)
+    text += pe_export_line(2, 'https://www.namesilo.com/ssl', '', 910, 'TRUE', 41, "['SSL']", '', 200, 402)
+    path = write_temp_csv(text, suffix='.tsv')
+    try:
+        table = load_page_explorer_table(path, chunk_size=2)
+        assert list(table['url']) == [
+            'https://www.namesilo.com/',
+            'https://www.namesilo.com/old',
+            'https://www.namesilo.com/ssl',
+        ]
+        assert table['internal_links'].tolist() == [2202.0, 3.0, 402.0]
+        assert table['depth'].tolist() == [0.0, 2.0, 0.0]
+        assert table['importance'].tolist() == [100.0, 5.0, 41.0]
+        assert table['status'].tolist() == [200, 308, 200]
+        assert table['indexable'].tolist() == [True, False, True]
+        kept = filter_table(table, indexable_mask(table))
+        assert list(kept['url']) == ['https://www.namesilo.com/', 'https://www.namesilo.com/ssl']
+        assert set(table) == {'url', 'status', 'indexable'} | set(PE_COLUMNS)
+    finally:
+        os.unlink(path)
+
+def test_real_page_explorer_export():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'old files', 'page-explorer.xml')
+    table = load_page_explorer_table(path)
+    assert table_len(table) == 848
+    assert all(url.startswith('https://www.namesilo.com') for url in table['url'])
+    assert table['internal_links'][0] == 2202.0
+    assert set(table['status'].tolist()) == {200, 301, 302, 308, 404, 500}
+
+def test_xlsx_streaming_matches_csv():
+    from openpyxl import Workbook
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'gsc.xlsx')
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Pages')
+        sheet.append(['URL', 'clicks', 'impressions', 'ctr', 'position', 'notes'])
+        sheet.append(['https://www.namesilo.com/', 1500, 25000, 0.06, 2.5, 'home'])
+        sheet.append(['https://www.namesilo.com/blog/a', '10', None, 0.05, 7, None])
+        sheet.append([None, 5, 5, 5, 5, None])
+        sheet.append(['https://www.namesilo.com/whois', 'n/a', 100, 0.01, 4])
+        workbook.save(path)
+        table = load_gsc_table(path, chunk_size=2)
+        assert list(table['url']) == [
+            'https://www.namesilo.com/',
+            'https://www.namesilo.com/blog/a',
+            'https://www.namesilo.com/whois',
+        ]
+        assert table['clicks'].tolist() == [1500.0, 10.0, 0.0]
+        assert table['impressions'].tolist() == [25000.0, 0.0, 100.0]
+        assert table['position'].dtype == np.float64
+        assert expand_inputs(directory) == [path]
+    finally:
+        shutil.rmtree(directory)
+
+def test_jsonl_dump_is_aggregated_per_page():
+    rows = [
+        {'keys': ['https://www.namesilo.com/', '2025-01-01'], 'clicks': 10, 'impressions': 100, 'ctr': 0.1, 'position': 2.0},
+        {'keys': ['2025-01-02', 'https://www.namesilo.com/'], 'clicks': 30, 'impressions': 300, 'ctr': 0.1, 'position': 4.0},
+        {'page': 'https://www.namesilo.com/whois', 'date': '2025-01-01', 'clicks': 0, 'impressions': 0, 'position': 7.0},
+        {'page': 'https://www.namesilo.com/whois', 'date': '2025-01-02', 'clicks': 0, 'impressions': 0, 'position': 9.0},
+        {'date': '2025-01-02', 'clicks': 5},
+    ]
+    lines = [json.dumps(row) for row in rows]
+    lines.insert(2, '{not json')
+    lines.insert(3, '')
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'gsc.jsonl.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        diagnostics = new_diagnostics()
+        table = load_gsc_table(path, diagnostics=diagnostics)
+        assert (diagnostics['rows'], diagnostics['malformed_lines'], diagnostics['missing_url']) == (6, 1, 1)
+        assert list(table['url']) == ['https://www.namesilo.com/', 'https://www.namesilo.com/whois']
+        assert table['clicks'].tolist() == [40.0, 0.0]
+        assert table['impressions'].tolist() == [400.0, 0.0]
+        assert table['ctr'].tolist() == [0.1, 0.0]
+        assert table['position'].tolist() == [3.5, 8.0]
+        assert expand_inputs(directory) == [path]
+    finally:
+        shutil.rmtree(directory)
+
+def test_diagnostics_count_bad_rows_without_printing():
+    path = write_temp_csv(GSC_CSV)
+    try:
+        diagnostics = new_diagnostics(sample_limit=1)
+        table = load_csv_table(path, GSC_COLUMNS, chunk_size=2, diagnostics=diagnostics)
+        assert table_len(table) == 4
+        assert diagnostics['rows'] == 5
+        assert diagnostics['missing_url'] == 1
+        assert diagnostics['bad_values'] == {'clicks': 1}
+        assert diagnostics['encoding_errors'] == 0
+        assert diagnostics['samples'] == [{'reason': 'missing_url', 'row': ['', '5', '5', '5', '5']}]
+        json.dumps(diagnostics)
+
+        parallel = new_diagnostics()
+        load_csv_table_parallel(path, GSC_COLUMNS, workers=2, min_range_bytes=1, diagnostics=parallel)
+        assert parallel['rows'] == 5 and parallel['bad_values'] == {'clicks': 1}
+        assert parallel['samples'][-1] == {'reason': 'bad_value', 'column': 'clicks',
+                                           'url': 'https://www.namesilo.com/whois', 'value': 'n/a'}
+        assert merge_diagnostics(new_diagnostics(), parallel)['missing_url'] == 1
+    finally:
+        os.unlink(path)
+
+def test_invalid_utf8_is_counted_not_fatal():
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f:
+        f.write(b"url,clicks\nhttps://www.namesilo.com/caf\xe9,3\nhttps://www.namesilo.com/,4\n")
+        path = f.name
+    try:
+        diagnostics = new_diagnostics()
+        table = load_csv_table(path, ('clicks',), diagnostics=diagnostics)
+        assert table['clicks'].tolist() == [3.0, 4.0]
+        assert table['url'][0] == 'https://www.namesilo.com/caf\ufffd'
+        assert diagnostics['encoding_errors'] == 1
+    finally:
+        os.unlink(path)
+
+def test_header_schema_inference():
+    text = ("\ufeffTop pages;Clicks;Impressions;CTR;Position\n"
+            "https://www.namesilo.com/;1500;25000;0.06;2.5\n"
+            "https://www.namesilo.com/whois;3;30;0.1\n")
+    directory = tempfile.mkdtemp()
+    try:
+        for encoding in ('utf-8', 'utf-16'):
+            path = os.path.join(directory, f"{encoding}.csv")
+            with open(path, 'w', encoding=encoding, newline='') as f:
+                f.write(text)
+            assert sniff_encoding(path) in ('utf-8-sig', 'utf-16')
+            assert not supports_byte_ranges(path)
+            table = load_csv_table(path, GSC_COLUMNS, workers=2)
+            assert list(table['url']) == ['https://www.namesilo.com/', 'https://www.namesilo.com/whois']
+            assert table['clicks'].tolist() == [1500.0, 3.0]
+            assert table['position'].tolist() == [2.5, 0.0]
+    finally:
+        shutil.rmtree(directory)
+
+def test_registered_alias_is_used():
+    path = write_temp_csv("Landing Page,Sessions\nhttps://www.namesilo.com/,7\n")
+    saved = dict(COLUMN_ALIASES)
+    try:
+        assert table_len(load_csv_table(path, ('clicks',))) == 0
+        register_alias('url', 'landing page')
+        register_alias('clicks', 'sessions')
+        table = load_csv_table(path, ('clicks',))
+        assert table['clicks'].tolist() == [7.0]
+    finally:
+        COLUMN_ALIASES.clear()
+        COLUMN_ALIASES.update(saved)
+        os.unlink(path)
+
+if __name__ == "__main__":
+    test_chunked_matches_single_chunk()
+    test_blank_and_unparseable_values_default_to_zero()
+    test_missing_columns_default_to_zero()
+    test_record_loader_shape()
+    test_missing_url_column_yields_empty_table()
+    test_byte_ranges_are_newline_aligned()
+    test_parallel_loader_matches_serial()
+    test_parallel_loader_handles_quoted_line_breaks()
+    test_shard_directory_and_glob()
+    test_zstd_shard()
+    test_page_explorer_export_projection()
+    test_real_page_explorer_export()
+    test_xlsx_streaming_matches_csv()
+    test_jsonl_dump_is_aggregated_per_page()
+    test_diagnostics_count_bad_rows_without_printing()
+    test_invalid_utf8_is_counted_not_fatal()
+    test_header_schema_inference()
+    test_registered_alias_is_used()
+    print("Ingestion tests passed!")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for the GSC / Page Explorer outer join.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+from sitemap_aggregate import combine_gsc_records
+from sitemap_ingest import GSC_COLUMNS, PE_COLUMNS, records_to_table, table_to_records
+from sitemap_join import group_rows, intern_table, joined_records, merge_tables
+from sitemap_priority_system import calculate_priority, merge_and_deduplicate, score_table
+from sitemap_urls import UrlDictionary, normalize_url
+
+def dict_merge(gsc_data, pe_data, aggregate_gsc=True):
+    """The per-row dict update merge that merge_tables replaces."""
+    merged = defaultdict(dict)
+    gsc_groups = defaultdict(list)
+    for entry in gsc_data:
+        gsc_groups[normalize_url(entry['url'])].append(entry)
+    for norm, entries in gsc_groups.items():
+        if aggregate_gsc and len(entries) > 1:
+            merged[norm].update(combine_gsc_records(entries, GSC_COLUMNS))
+        else:
+            for entry in entries:
+                merged[norm].update(entry)
+    for entry in pe_data:
+        merged[normalize_url(entry['url'])].update(entry)
+    result = []
+    for norm_url, data in merged.items():
+        data['url'] = norm_url
+        result.append(data)
+    return result
+
+def random_tables(seed):
+    rng = np.random.default_rng(seed)
+    n, m = 3000, 400
+    paths = [f"https://www.namesilo.com/{p}" for p in ('', 'blog/a', 'Blog/a/', 'tld/com', 'whois', 'x?y=1')]
+    paths += [f"https://www.namesilo.com/p{i}" for i in range(200)]
+    gsc_table = {
+        'url': np.array([paths[i] for i in rng.integers(0, len(paths), n)], dtype=object),
+        'clicks': rng.integers(0, 50, n).astype(float),
+        'impressions': rng.integers(0, 500, n).astype(float),
+        'ctr': rng.uniform(0, 1, n),
+        'position': rng.uniform(1, 60, n),
+    }
+    pe_table = {
+        'url': np.array([paths[i] for i in rng.integers(0, len(paths), m)] + ['https://www.namesilo.com/only-pe'],
+                        dtype=object),
+        'importance': rng.uniform(0, 100, m + 1),
+        'depth': rng.integers(0, 6, m + 1).astype(float),
+        'internal_links': rng.integers(0, 90, m + 1).astype(float),
+        'health': rng.uniform(0, 100, m + 1),
+    }
+    return gsc_table, pe_table
+
+def test_merge_tables_matches_dict_merge():
+    gsc_table, pe_table = random_tables(11)
+    for aggregate_gsc in (True, False):
+        expected = dict_merge(table_to_records(gsc_table), table_to_records(pe_table), aggregate_gsc)
+        urls = UrlDictionary()
+        stats = {}
+        merged = merge_tables(gsc_table, pe_table, urls, aggregate_gsc=aggregate_gsc, stats=stats)
+        assert joined_records(merged, urls, GSC_COLUMNS, PE_COLUMNS) == expected
+        assert urls.lookup(merged['url_id'].tolist()) == [entry['url'] for entry in expected]
+        assert merged['has_gsc'].tolist() == ['clicks' in entry for entry in expected]
+        assert merged['has_pe'].tolist() == ['importance' in entry for entry in expected]
+        assert stats['both'] == sum('clicks' in e and 'importance' in e for e in expected)
+        assert stats['gsc_only'] == sum('importance' not in e for e in expected)
+        assert stats['pe_only'] == sum('clicks' not in e for e in expected)
+        assert stats['pe_only'] >= 1
+        interned = UrlDictionary()
+        gsc_ids, pe_ids = intern_table(gsc_table, interned), intern_table(pe_table, interned)
+        assert 'url' not in gsc_ids and list(pe_ids)[1:] == list(pe_table)[1:]
+        again = merge_tables(gsc_ids, pe_ids, interned, aggregate_gsc=aggregate_gsc)
+        assert joined_records(again, interned, GSC_COLUMNS, PE_COLUMNS) == expected
+        if aggregate_gsc:
+            assert merge_and_deduplicate(table_to_records(gsc_table), table_to_records(pe_table)) == expected
+            assert score_table(merged, urls).tolist() == [calculate_priority(entry) for entry in expected]
+
+def test_one_sided_and_empty_inputs():
+    gsc_table, pe_table = random_tables(3)
+    empty = records_to_table([])
+    urls = UrlDictionary()
+    stats = {}
+    merged = merge_tables(gsc_table, empty, urls, stats=stats)
+    assert not merged['has_pe'].any() and stats['pe_only'] == stats['both'] == 0
+    merged = merge_tables(empty, pe_table, UrlDictionary(), stats=stats)
+    assert not merged['has_gsc'].any() and stats['gsc_only'] == stats['both'] == 0
+    assert 'clicks' not in merged and merged['importance'].dtype == np.float64
+    merged = merge_tables(empty, empty, UrlDictionary(), stats=stats)
+    assert len(merged['url_id']) == 0 and stats == {'gsc_only': 0, 'pe_only': 0, 'both': 0}
+
+def test_group_rows():
+    groups, first, last = group_rows(np.array([7, 3, 7, 9, 3, 7]))
+    assert groups.tolist() == [0, 1, 0, 2, 1, 0]
+    assert first.tolist() == [0, 1, 3]
+    assert last.tolist() == [5, 4, 3]
+
+def test_records_round_trip():
+    records = [{'url': 'https://www.namesilo.com/a', 'clicks': 1.0, 'date': '2025-01-01'},
+               {'url': 'https://www.namesilo.com/b', 'clicks': 2.0, 'indexable': True}]
+    table = records_to_table(records)
+    assert list(table) == ['url', 'clicks', 'date', 'indexable']
+    assert table['url'].dtype == object and table['clicks'].dtype == np.float64
+    assert table['date'].tolist() == ['2025-01-01', 0.0]
+    assert table_to_records(records_to_table(records[:1])) == records[:1]
+
+if __name__ == "__main__":
+    test_merge_tables_matches_dict_merge()
+    test_one_sided_and_empty_inputs()
+    test_group_rows()
+    test_records_round_trip()
+    print("Join tests passed!")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the declarative URL rule sets.
+"""
+
+import json
+import os
+import random
+import tempfile
+
+from sitemap_rules import RULES_CACHE_SIZE, _compile_file, compile_rules, load_rules, path_needles
+from sitemap_urls import UrlText
+
+RULES = {
+    'rules': [
+        {'name': 'blog', 'paths': ['/blog/']},
+        {'name': 'exact', 'paths': ['/broker', '/a/b/']},
+        {'name': 'root', 'regex': ['^/?$']},
+        {'name': 'pages', 'paths': ['/page*'], 'regex': [{'pattern': '^/domains/[^/]+/?$', 'requires': '/domains/'}]},
+    ],
+    'default': 'other',
+}
+
+def test_rules_assign():
+    rules = compile_rules(RULES)
+    assert rules.names == ['blog', 'exact', 'root', 'pages', 'other']
+    cases = {
+        'https://www.namesilo.com/Blog/x': 'blog',
+        'https://www.namesilo.com/blog': 'other',
+        'https://www.namesilo.com/x/blog/': 'blog',
+        'https://www.namesilo.com/broker': 'exact',
+        'https://www.namesilo.com/broker/x?y': 'exact',
+        'https://www.namesilo.com/brokers': 'other',
+        'https://www.namesilo.com/x/a/b/c': 'exact',
+        'https://www.namesilo.com/a/b': 'other',
+        'https://www.namesilo.com': 'root',
+        'https://www.namesilo.com/?page=1': 'root',
+        'https://www.namesilo.com/pages': 'pages',
+        'https://www.namesilo.com/domains/com/': 'pages',
+        'https://www.namesilo.com/domains/com/x': 'other',
+        'https://blog.namesilo.com/x': 'other',
+        'https://www.namesilo.com/x?next=/blog/y': 'other',
+        '/blog/x': 'blog',
+        'blog/x': 'blog',
+        '': 'root',
+    }
+    urls = list(cases)
+    assert [rules.assign(url) for url in urls] == list(cases.values())
+    codes = rules.codes(UrlText(urls))
+    assert codes.dtype.name == 'int8'
+    assert [rules.names[code] for code in codes.tolist()] == list(cases.values())
+
+def test_rules_column_matches_single():
+    rules = compile_rules()
+    rng = random.Random(3)
+    pieces = ['https://www.namesilo.com', '/', 'blog', 'help', 'domains', 'com', 'tld', 'tools', 'whois', 'domain-',
+              'service', 'x', '?', '#', 'BLOG', '\n']
+    column = [''.join(rng.choice(pieces) for _ in range(rng.randint(0, 7))) for _ in range(3000)]
+    expected = [rules.code(url) for url in column]
+    assert rules.codes(UrlText(column)).tolist() == expected
+    assert rules.codes(UrlText([url for url in column if '\n' not in url])).tolist() == \
+        [code for url, code in zip(column, expected) if '\n' not in url]
+
+def test_rule_files_and_errors():
+    assert path_needles('/blog/') == (['blog/'], [])
+    assert path_needles('/tool*') == (['tool'], [])
+    assert path_needles('/broker') == (['broker/'], ['broker'])
+    for pattern in ('blog', '/', '/Blog/', '/a//b', '/a*b', '/a/*', '/*', '/a?'):
+        try:
+            path_needles(pattern)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"expected ValueError for {pattern!r}")
+    for bad in ({'rules': []}, {'rules': [{'name': 'a', 'paths': ['/a/']}]},
+                {'rules': [{'name': 'a'}], 'default': 'b'},
+                {'rules': [{'name': 'a', 'paths': ['/a/']}], 'default': 'a'},
+                {'rules': [{'name': 'a', 'regex': ['(']}], 'default': 'b'},
+                {'rules': [{'name': 'a', 'paths': ['/a/'], 'contains': ['/a']}], 'default': 'b'},
+                {'rules': [{'name': str(i), 'paths': ['/a/']} for i in range(128)], 'default': 'b'}):
+        try:
+            compile_rules(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"expected ValueError for {bad}")
+
+    assert compile_rules() is compile_rules(load_rules())
+    assert compile_rules(RULES) is compile_rules(json.loads(json.dumps(RULES)))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rules.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(RULES, f)
+        assert compile_rules(path).digest == compile_rules(RULES).digest
+        assert compile_rules(path) is compile_rules(path)
+        # A rewritten file is compiled again; files compiled are cached up to RULES_CACHE_SIZE
+        other = {'rules': RULES['rules'][:1], 'default': RULES['default']}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(other, f)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        assert compile_rules(path).digest == compile_rules(other).digest
+        for i in range(RULES_CACHE_SIZE + 1):
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 + i))
+            compile_rules(path)
+        assert _compile_file.cache_info().currsize == RULES_CACHE_SIZE
+
+if __name__ == "__main__":
+    test_rules_assign()
+    test_rules_column_matches_single()
+    test_rule_files_and_errors()
+    print("Rule set tests passed!")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Tests for model-driven priority scoring.
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from sitemap_ingest import GSC_COLUMNS, PE_COLUMNS
+from sitemap_priority_system import calculate_priority
+from sitemap_score import (ScoringModel, breakdown_range, calculate_priority_batch, compile_model, load_model,
+                           model_digest, with_rule)
+from sitemap_urls import UrlText
+
+PATHS = ['', '/', '/blog/x', '/Blog/y/', '/tld/com', '/domains/net/', '/support/a', '/whois', '/SSL-check/',
+         '/index.html', '/x/index.php', '/dns-checker', '/tools/é', '/blog/tld/whois/']
+
+def legacy_priority(url_entry, home_suffixes=('/', '/index.html', '/index.php')):
+    """The hard-coded calculate_priority that the default scoring model replaces."""
+    gsc_score = 0.0
+    if 'clicks' in url_entry and 'impressions' in url_entry:
+        clicks = url_entry.get('clicks', 0)
+        impressions = url_entry.get('impressions', 0)
+        ctr = url_entry.get('ctr', 0)
+        position = url_entry.get('position', 0)
+        if impressions > 0:
+            gsc_score += clicks / impressions * 0.3
+        gsc_score += min(ctr, 1.0) * 0.3
+        if position > 0:
+            gsc_score += max(0, 1 - (position / 100)) * 0.4
+    pe_score = 0.0
+    if 'importance' in url_entry:
+        depth = url_entry.get('depth', 0)
+        internal_links = url_entry.get('internal_links', 0)
+        pe_score += min(url_entry.get('importance', 0) / 100, 1.0) * 0.4
+        if depth > 0:
+            pe_score += max(0, 1 - (depth / 10)) * 0.2
+        if internal_links > 0:
+            pe_score += min(internal_links / 100, 1.0) * 0.2
+        pe_score += min(url_entry.get('health', 0) / 100, 1.0) * 0.2
+    business_score = 0.0
+    url = url_entry.get('url', '').lower()
+    if url.endswith(home_suffixes):
+        business_score += 0.5
+    if '/tld/' in url or '/domains/' in url:
+        business_score += 0.3
+    if '/blog/' in url:
+        business_score += 0.2
+    if '/support/' in url:
+        business_score += 0.1
+    if any(tool in url for tool in ['/whois', '/ssl-check', '/dns-check']):
+        business_score += 0.2
+    business_score = min(business_score, 1.0)
+    priority = (gsc_score * 0.4) + (pe_score * 0.4) + (business_score * 0.2)
+    return max(0.1, min(1.0, priority))
+
+def random_table(n, seed):
+    rng = np.random.default_rng(seed)
+    urls = [f"https://www.namesilo.com{PATHS[i]}" for i in rng.integers(0, len(PATHS), n)]
+    table = {
+        'clicks': rng.integers(-2, 50, n).astype(float),
+        'impressions': rng.integers(-1, 5, n).astype(float),
+        'ctr': rng.uniform(-0.5, 2, n),
+        'position': rng.uniform(-10, 150, n),
+        'importance': rng.uniform(-10, 200, n),
+        'depth': rng.integers(-1, 14, n).astype(float),
+        'internal_links': rng.uniform(-5, 300, n),
+        'health': rng.uniform(-5, 150, n),
+        'has_gsc': rng.random(n) < 0.7,
+        'has_pe': rng.random(n) < 0.7,
+    }
+    table['ctr'][::17] = np.nan
+    table['importance'][::13] = np.nan
+    table['position'][::11] = np.nan
+    # Zero-filled where the row's input lacked the URL, as merge_tables leaves them
+    for columns, flag in ((GSC_COLUMNS, 'has_gsc'), (PE_COLUMNS, 'has_pe')):
+        for col in columns:
+            table[col][~table[flag]] = 0.0
+    return table, urls
+
+def table_records(table, urls):
+    records = []
+    for i, url in enumerate(urls):
+        entry = {'url': url}
+        if table['has_gsc'][i]:
+            entry.update((col, float(table[col][i])) for col in GSC_COLUMNS)
+        if table['has_pe'][i]:
+            entry.update((col, float(table[col][i])) for col in PE_COLUMNS)
+        records.append(entry)
+    return records
+
+def test_default_model_matches_legacy():
+    for seed in range(3):
+        table, urls = random_table(5000, seed)
+        records = table_records(table, urls)
+        expected = [legacy_priority(entry) for entry in records]
+        assert [calculate_priority(entry) for entry in records] == expected
+        batch = calculate_priority_batch(table, urls)
+        assert batch.dtype == np.float64
+        assert np.abs(batch - expected).max() <= 1e-9
+        assert batch.tolist() == expected
+
+    api_model = with_rule(load_model(), 'homepage', suffixes=['/', '/index.html'])
+    table, urls = random_table(2000, 7)
+    expected = [legacy_priority(entry, ('/', '/index.html')) for entry in table_records(table, urls)]
+    assert calculate_priority_batch(table, urls, api_model).tolist() == expected
+
+def test_missing_columns():
+    urls = ['https://www.namesilo.com/blog/a', 'https://www.namesilo.com/']
+    only_ctr = {'ctr': np.array([0.9, 0.2]), 'importance': np.array([50.0, 0.0])}
+    assert calculate_priority_batch(only_ctr, urls).tolist() == \
+        [legacy_priority({'url': url, 'ctr': ctr, 'importance': imp})
+         for url, ctr, imp in zip(urls, [0.9, 0.2], [50.0, 0.0])]
+    assert calculate_priority_batch({}, urls).tolist() == [legacy_priority({'url': url}) for url in urls]
+
+def test_other_weightings_match_scalar():
+    rng = np.random.default_rng(4)
+    table, urls = random_table(3000, 5)
+    text = UrlText(urls)
+    records = table_records(table, urls)
+    for _ in range(3):
+        model = load_model()
+        for component in model['components']:
+            component['weight'] = float(rng.uniform(0, 1))
+            for term in component.get('terms', ()):
+                term['weight'] = float(rng.uniform(0, 1))
+            for rule in component.get('rules', ()):
+                rule['boost'] = float(rng.uniform(0, 1))
+        model['components'][0]['terms'].append({'column': 'health', 'decay': 50, 'cap': 0.5, 'weight': 0.25})
+        scorer = compile_model(model)
+        assert scorer(table, text).tolist() == [scorer.score(entry) for entry in records]
+        columns = scorer.component_columns(table, text)
+        assert list(columns) == ['gsc', 'pe', 'business']
+        assert np.array_equal(np.column_stack(list(columns.values())),
+                              [scorer.component_scores(entry) for entry in records], equal_nan=True)
+
+def test_compiled_models_are_cached():
+    model = load_model()
+    reordered = json.loads(json.dumps(model, sort_keys=True))
+    assert model_digest(model) == model_digest(reordered)
+    assert compile_model(model) is compile_model(reordered)
+    assert compile_model() is compile_model()
+    changed = with_rule(model, 'blog', boost=0.4)
+    assert model_digest(changed) != model_digest(model)
+    assert compile_model(changed) is not compile_model(model)
+
+def test_model_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'model.json')
+        yaml_path = os.path.join(tmp, 'model.yaml')
+        model = with_rule(load_model(), 'support', contains=['/support/', '/help/'])
+        with open(json_path, 'w') as f:
+            json.dump(model, f)
+        with open(yaml_path, 'w') as f:
+            f.write("components:\n")
+            for component in model['components']:
+                f.write(f"  - {json.dumps(component)}\n")
+            f.write(f"min: {model['min']}\nmax: {model['max']}\n")
+        urls = ['https://www.namesilo.com/help/x', 'https://www.namesilo.com/support/y']
+        for path in (json_path, yaml_path):
+            assert compile_model(path).digest == model_digest(model)
+            assert calculate_priority_batch({}, urls, path).tolist() == [0.1, 0.1]
+            assert calculate_priority({'url': urls[0]}, path) == compile_model(path).score({'url': urls[0]})
+
+def rank_model(points=None, quantile=None):
+    model = load_model()
+    pe_terms = model['components'][1]['terms']
+    pe_terms[0] = {'column': 'importance', 'normalize': 'rank', 'weight': 0.4}
+    if points is not None:
+        pe_terms[0]['points'] = points
+    pe_terms[2] = {'column': 'internal_links', 'positive_only': True, 'normalize': 'rank', 'weight': 0.2}
+    model['components'][0]['terms'][0]['normalize'] = 'quantile'
+    model['components'][0]['terms'][0]['quantile'] = quantile or 0.9
+    return model
+
+def test_normalized_terms():
+    table, urls = random_table(4000, 9)
+    records = table_records(table, urls)
+    scorer = compile_model(rank_model())
+    assert scorer.needs_fit
+    try:
+        scorer.score(records[0])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+    fitted = scorer.fit(table)
+    assert not fitted.needs_fit and fitted is scorer.fit(table)
+    assert calculate_priority_batch(table, urls, scorer).tolist() == [fitted.score(entry) for entry in records]
+
+    # With a point per counted row the edges are the sorted column: exact mean ranks
+    pe_rows = table['has_pe'] & ~np.isnan(table['importance'])
+    values = np.sort(table['importance'][pe_rows])
+    fitted = compile_model(rank_model(points=len(values) - 1)).fit(table)
+    importance_term = fitted.model['components'][1]['terms'][0]
+    assert importance_term['fitted'] == values.tolist()
+    ranks = fitted._term_column(importance_term, table.__getitem__)
+    for row in np.flatnonzero(pe_rows)[:200].tolist():
+        value = table['importance'][row]
+        expected = (np.sum(values < value) + np.sum(values <= value) - 1) / (2 * (len(values) - 1))
+        assert fitted._term(importance_term, records[row]) == ranks[row] == expected * 0.4
+
+    ratio = np.divide(table['clicks'], table['impressions'], out=np.zeros(4000), where=table['impressions'] > 0)
+    counted = np.sort(ratio[table['has_gsc'] & (table['impressions'] > 0)])
+    ratio_term = fitted.model['components'][0]['terms'][0]
+    assert ratio_term['fitted'] == counted[int(round(0.9 * (len(counted) - 1)))]
+
+    # Ranks spread priorities that fixed scales leave at the floor
+    rng = np.random.default_rng(1)
+    skewed = {'importance': rng.pareto(3, 20000) * 10, 'internal_links': rng.pareto(2, 20000) * 5,
+              'health': np.full(20000, 80.0), 'depth': np.full(20000, 3.0)}
+    skewed_urls = ['https://www.namesilo.com/x'] * 20000
+    fixed = calculate_priority_batch(skewed, skewed_urls)
+    ranked = calculate_priority_batch(skewed, skewed_urls, rank_model())
+    assert ranked.std() > 3 * fixed.std()
+
+def test_component_breakdown():
+    table, urls = random_table(3000, 6)
+    components = {}
+    priority = calculate_priority_batch(table, urls, None, components)
+    assert priority.tolist() == calculate_priority_batch(table, urls).tolist()
+    columns = compile_model().component_columns(table, urls)
+    assert list(components) == list(columns)
+    for name, values in components.items():
+        assert values.dtype == np.float32
+        assert np.array_equal(values, columns[name].astype(np.float32), equal_nan=True)
+
+    start, stop = 'https://www.namesilo.com/blog', 'https://www.namesilo.com/tld/'
+    records = breakdown_range(urls, priority, components, start, stop)
+    rows = sorted((i for i, url in enumerate(urls) if start <= url < stop), key=lambda i: urls[i])
+    assert [record['url'] for record in records] == [urls[i] for i in rows]
+    assert [record['priority'] for record in records] == priority[rows].tolist()
+    for record, row in zip(records, rows):
+        assert list(record) == ['url', 'priority', 'gsc', 'pe', 'business']
+        assert all(abs(record[name] - columns[name][row]) < 1e-6 for name in columns if not np.isnan(record[name]))
+    assert len(breakdown_range(urls, priority, components)) == 3000
+    assert breakdown_range(urls, priority, components, stop, start) == []
+
+def test_invalid_models():
+    bad_models = [
+        {'components': []},
+        {'components': [{'name': 'x', 'weight': 1, 'terms': [{'column': 'a'}]}]},
+        {'components': [{'name': 'x', 'weight': 1, 'terms': [{'column': 'a', 'ratio': ['a', 'b'], 'weight': 1}]}]},
+        {'components': [{'name': 'x', 'weight': 1, 'rules': [{'contains': ['/Blog/'], 'boost': 1}]}]},
+        {'components': [{'name': 'x', 'weight': 1, 'extra': 1}]},
+        {'components': [{'name': 'x', 'weight': 1}], 'clamp': [0, 1]},
+        {'components': [{'name': 'x', 'weight': 1, 'terms': [{'column': 'a', 'normalize': 'z', 'weight': 1}]}]},
+        {'components': [{'name': 'x', 'weight': 1, 'terms': [{'column': 'a', 'normalize': 'quantile', 'weight': 1}]}]},
+        {'components': [{'name': 'x', 'weight': 1, 'terms': [{'column': 'a', 'points': 5, 'weight': 1}]}]},
+    ]
+    for model in bad_models:
+        try:
+            ScoringModel(model)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"expected ValueError for {model}")
+    try:
+        with_rule(load_model(), 'nope', boost=1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+if __name__ == "__main__":
+    test_default_model_matches_legacy()
+    test_missing_columns()
+    test_other_weightings_match_scalar()
+    test_compiled_models_are_cached()
+    test_model_files()
+    test_normalized_terms()
+    test_component_breakdown()
+    test_invalid_models()
+    print("Scoring tests passed!")
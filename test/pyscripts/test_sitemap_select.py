@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for ordering rows by written priority, overall and per cluster.
+"""
+
+import numpy as np
+
+from sitemap_priority_system import cluster_urls
+from sitemap_select import bucket_order, quantize
+
+def test_quantize_matches_format():
+    rng = np.random.default_rng(7)
+    # Exact halves (0.125, 0.375, ...) and values a rounding error off them
+    priority = np.concatenate([rng.uniform(0, 1, 2000), np.arange(0, 1, 1 / 8), np.arange(0, 1, 1 / 8) + 1e-17,
+                               np.array([0.005, 0.015, 0.285, 0.565, 1.0, 0.0])])
+    for decimals in (1, 2, 3, 4):
+        expected = [int(f"{p:.{decimals}f}".replace('.', '')) for p in priority.tolist()]
+        assert quantize(priority, decimals).tolist() == expected
+
+def test_bucket_order_matches_lexsort():
+    for seed, n in ((8, 3000), (9, 70000)):
+        rng = np.random.default_rng(seed)
+        priority = rng.uniform(0, 1, n)
+        priority[::3] = np.round(priority[::3], 2)
+        codes = rng.integers(0, 6, n).astype(np.int8)
+        for decimals in (2, 4, 6):
+            keys = quantize(priority, decimals)
+            assert bucket_order(priority, decimals).tolist() == np.lexsort((np.arange(n), -keys)).tolist()
+            assert (bucket_order(priority, decimals, codes).tolist() ==
+                    np.lexsort((np.arange(n), -keys, codes)).tolist())
+    assert bucket_order(np.zeros(0), 2).tolist() == []
+
+def test_cluster_urls_single_sort():
+    paths = ['/blog/a', '/tld/b', '/x', '/support/c', '/whois']
+    rng = np.random.default_rng(6)
+    urls = [{'url': f"https://www.namesilo.com{paths[i % 5]}{i}", 'priority': float(rng.integers(0, 4)) / 4}
+            for i in range(300)]
+    urls[7].pop('priority')
+    clusters = cluster_urls(urls)
+    seen = {}
+    for entry in urls:
+        for name, members in clusters.items():
+            if any(member is entry for member in members):
+                seen.setdefault(name, []).append(entry)
+    assert list(clusters) == list(seen)
+    for name, members in seen.items():
+        assert clusters[name] == sorted(members, key=lambda x: x.get('priority', 0), reverse=True)
+
+    # Priorities that write the same keep their input order
+    urls = [{'url': f"https://www.namesilo.com/blog/{i}", 'priority': value}
+            for i, value in enumerate([0.501, 0.7, 0.499, 0.504, 0.71])]
+    assert [entry['url'][-1] for entry in cluster_urls(urls)['blog']] == ['4', '1', '0', '2', '3']
+
+if __name__ == "__main__":
+    test_quantize_matches_format()
+    test_bucket_order_matches_lexsort()
+    test_cluster_urls_single_sort()
+    print("Selection tests passed!")
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Tests for the fast URL normalizer and the URL stores.
+"""
+
+import os
+import random
+
+import numpy as np
+
+from sitemap_urls import (FrontCodedUrls, PatternMatcher, UrlColumn, UrlDictionary, UrlText, normalize_url,
+                          normalize_url_reference, normalize_urls, segment_starts, url_path)
+
+PIECES = ['https://', 'http://', 'HTTPS://', 'Http://', 'ftp://', '//', '', 'www.namesilo.com', 'NameSilo.com',
+          'www.namesilo.com:443', 'user@host', '[::1]', '[bad', '/', '//', '/Blog', '/tld/com', 'index.php',
+          '?', '?a=1', '#', '#top', ';p', '%2F', ' ', '\t', '\n', '\x00', '\x7f', 'é', 'ü/', 'xn--d1acpjx3f.xn--p1ai',
+          '..', '.', ':', '@', '\\']
+
+def random_corpus(n, seed=12):
+    rng = random.Random(seed)
+    corpus = ['', '/', 'https://www.namesilo.com', 'https://www.namesilo.com/', 'https://www.namesilo.com//',
+              'https://www.namesilo.com/Blog/Post/', 'http://a/b/', 'https:///path/', 'https://', 'https:/x/']
+    for _ in range(n):
+        corpus.append(''.join(rng.choice(PIECES) for _ in range(rng.randint(1, 8))))
+        path = '/'.join(rng.choice(['blog', 'Domain', 'tld', 'x-y_z', '', 'seo']) for _ in range(rng.randint(0, 4)))
+        corpus.append(f"https://www.namesilo.com/{path}" + rng.choice(['', '/', '?q=1', '#f']))
+    return corpus
+
+def test_fast_path_matches_reference():
+    corpus = random_corpus(50000)
+    expected = [normalize_url_reference(url) for url in corpus]
+    assert [normalize_url(url) for url in corpus] == expected
+    assert normalize_urls(corpus).tolist() == expected
+    # Without embedded newlines the column takes the vectorized path
+    single_line = [(url, norm) for url, norm in zip(corpus, expected) if '\n' not in url]
+    assert normalize_urls(np.array([url for url, _ in single_line], dtype=object)).tolist() == \
+        [norm for _, norm in single_line]
+    assert normalize_urls(UrlColumn.from_strings(corpus)).tolist() == expected
+    assert normalize_urls(UrlColumn.from_strings([url for url, _ in single_line])).tolist() == \
+        [norm for _, norm in single_line]
+    # Second pass is served from the LRU cache
+    assert [normalize_url(url) for url in corpus] == expected
+
+def test_url_column():
+    corpus = random_corpus(2000)
+    column = UrlColumn.from_strings(corpus)
+    assert len(column) == len(corpus) and column.tolist() == corpus and list(column) == corpus
+    assert column[3] == corpus[3] and column[-1] == corpus[-1]
+    rows = np.random.default_rng(1).permutation(len(corpus))[:500]
+    assert column.take(rows).tolist() == [corpus[i] for i in rows]
+    mask = np.arange(len(corpus)) % 3 == 1
+    assert column[mask].tolist() == [url for url, keep in zip(corpus, mask) if keep]
+    assert column[10:20].tolist() == corpus[10:20] and column[20:10].tolist() == []
+    assert UrlColumn.concat([column[5:], column[:5]]).tolist() == corpus[5:] + corpus[:5]
+    assert column[5:].equals(UrlColumn.from_strings(corpus[5:])) and not column.equals(column[::-1])
+    assert column.lines() is None
+    urls = UrlDictionary(corpus)
+    ids = np.array([7, 3, 3, len(urls) - 1, 0])
+    assert urls.column(ids).tolist() == urls.lookup(ids)
+    store, rank = urls.front_coded()
+    assert store.column(rank[ids]).tolist() == urls.lookup(ids)
+    plain = UrlColumn.from_strings(['a', '', 'bé'])
+    assert plain.lines().tobytes() == 'a\n\nbé\n'.encode('utf-8')
+    assert UrlColumn.from_strings([]).tolist() == [] and len(UrlColumn.from_strings([''])) == 1
+
+def test_common_shapes():
+    assert normalize_url('https://www.NameSilo.com/Blog/') == 'https://www.namesilo.com/blog'
+    assert normalize_url('https://www.namesilo.com/') == 'https://www.namesilo.com/'
+    assert normalize_url('https://www.namesilo.com/a?x=1#y') == 'https://www.namesilo.com/a'
+    assert normalize_urls([]).tolist() == []
+    assert normalize_urls(['https://www.namesilo.com/']).tolist() == ['https://www.namesilo.com/']
+    assert normalize_urls(['HTTPS://A.com/X/', 'https://a.com/Ü/', 'https://a.com/X/']).tolist() == \
+        ['https://a.com/x', 'https://a.com/ü', 'https://a.com/x']
+
+def test_url_dictionary_ids():
+    urls = UrlDictionary(['https://www.namesilo.com/b', 'https://www.namesilo.com/a'])
+    ids = urls.intern_many(['https://www.namesilo.com/a', 'https://www.namesilo.com/é', 'https://www.namesilo.com/a'])
+    assert ids.dtype == np.int32 and ids.tolist() == [1, 2, 1]
+    assert urls.intern('https://www.namesilo.com/b') == 0
+    assert len(urls) == 3
+    assert urls.lookup(ids.tolist()) == ['https://www.namesilo.com/a', 'https://www.namesilo.com/é', 'https://www.namesilo.com/a']
+    assert list(urls) == ['https://www.namesilo.com/b', 'https://www.namesilo.com/a', 'https://www.namesilo.com/é']
+    assert urls.get('https://www.namesilo.com/c') == -1
+    assert urls.nbytes == len(''.join(urls).encode('utf-8')) + 8 * 4
+    assert urls.intern_many([]).tolist() == []
+
+def test_url_dictionary_hash_collision():
+    urls = UrlDictionary(['x'])
+    # Pretend 'y' hashes like 'x'
+    urls._by_hash[hash('y')] = 0
+    assert urls.get('y') == -1
+    assert urls.intern('y') == 1
+    assert urls.intern_many(['x', 'y', 'z', 'y']).tolist() == [0, 1, 2, 1]
+    assert list(urls) == ['x', 'y', 'z']
+
+def test_url_dictionary_matches_python_dict():
+    corpus = [normalize_url(url) for url in random_corpus(5000, seed=3)]
+    urls = UrlDictionary()
+    expected = {}
+    for start in range(0, len(corpus), 1234):
+        batch = corpus[start:start + 1234]
+        ids = urls.intern_many(np.array(batch, dtype=object))
+        assert ids.tolist() == [expected.setdefault(url, len(expected)) for url in batch]
+    assert list(urls) == list(expected)
+
+def test_front_coded_store():
+    corpus = [normalize_url(url) for url in random_corpus(3000, seed=5)] + ['https://www.namesilo.com/' + 'a' * 300]
+    expected = sorted(set(corpus))
+    for block_size in (1, 3, 16):
+        store = FrontCodedUrls(corpus, block_size=block_size)
+        assert len(store) == len(expected)
+        assert list(store) == expected
+        assert [store[i] for i in range(0, len(expected), 7)] == expected[::7]
+        assert store[-1] == expected[-1]
+        assert [store.get(url) for url in expected] == list(range(len(expected)))
+        for missing in ('\x00', '\uffff', expected[5] + '\x00', expected[-1] + 'x'):
+            assert missing not in expected and store.get(missing) == -1 and missing not in store
+        positions = np.random.default_rng(block_size).integers(0, len(expected), 500)
+        assert store.lookup(positions) == [expected[i] for i in positions]
+    assert store.nbytes < len(''.join(expected).encode('utf-8'))
+    try:
+        FrontCodedUrls.from_sorted(['b', 'a'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+def test_url_column_sort():
+    rng = random.Random(9)
+    pieces = ['a', 'b', '\x00', 'é', 'ab' * 5, 'https://www.namesilo.com/']
+    for trial in range(200):
+        urls = [''.join(rng.choice(pieces) for _ in range(rng.randint(0, 6))) for _ in range(rng.randint(0, 40))]
+        column = UrlColumn.from_strings(urls)
+        order = column.argsort()
+        assert order.tolist() == sorted(range(len(urls)), key=lambda i: (urls[i], i))
+        ordered = [urls[i].encode('utf-8') for i in order]
+        expected = [len(os.path.commonprefix([a, b])) for a, b in zip(ordered, ordered[1:])]
+        assert column.shared_prefixes(order).tolist() == [0][:len(urls)] + expected
+        distinct = sorted(set(urls))
+        shuffled = rng.sample(distinct, len(distinct))
+        unsorted = UrlColumn.from_strings(shuffled)
+        store = FrontCodedUrls.from_column(unsorted, unsorted.argsort(), block_size=3)
+        assert list(store) == distinct and [store.get(url) for url in distinct] == list(range(len(distinct)))
+        if len(distinct) < len(urls):
+            try:
+                FrontCodedUrls.from_column(column, order)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("expected ValueError for repeated URLs")
+
+def test_dictionary_to_front_coded():
+    urls = UrlDictionary(['https://www.namesilo.com/z', 'https://www.namesilo.com/', 'https://www.namesilo.com/é'])
+    store, rank = urls.front_coded(block_size=2)
+    assert rank.tolist() == [1, 0, 2]
+    assert store.lookup(rank) == list(urls)
+
+def test_url_text_matches_python():
+    urls = ['https://www.namesilo.com/', 'https://www.namesilo.com/Blog/a/', '', '/', 'x/index.html',
+            'https://www.namesilo.com/blog', 'https://www.namesilo.com/TLD/tld/', 'https://www.namesilo.com/checK',
+            'https://www.namesilo.com/chec\u212a', 'https://www.namesilo.com/é/blog/', 'https://www.namesilo.com/blo']
+    patterns = [('/blog/',), ('/tld/', 'check'), ('/',), ('k',), ('/index.html', '/')]
+    for column in (urls, urls[::-1], urls + ['a\nb/blog/']):
+        for text in (UrlText(np.array(column, dtype=object)), UrlText(UrlColumn.from_strings(column))):
+            for group in patterns:
+                assert text.contains(group).tolist() == [any(p in url.lower() for p in group) for url in column], group
+                assert text.endswith(group).tolist() == [url.lower().endswith(group) for url in column], group
+    assert UrlText([]).contains(('/',)).tolist() == []
+    assert UrlText(UrlColumn.from_strings([])).contains(('/',)).tolist() == []
+
+def test_pattern_matcher_matches_python():
+    rng = random.Random(6)
+    pick = lambda alphabet, low, high: ''.join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+    for trial in range(200):
+        matcher = PatternMatcher([pick('/abx.', 1, 4) for _ in range(rng.randint(0, 8))],
+                                 [pick('/abx.', 1, 4) for _ in range(rng.randint(0, 4))])
+        column = [pick('/abxAB.\u0130\u03a3', 0, 12) for _ in range(30)] + (['ab\nx/'] if trial % 5 == 0 else [])
+        hits = UrlText(column).match(matcher)
+        assert hits.shape == (len(matcher), len(column))
+        assert np.array_equal(UrlText(UrlColumn.from_strings(column)).match(matcher), hits)
+        for row, url in enumerate(column):
+            url = url.lower()
+            expected = [url.endswith(p) if suffix else p in url for p, suffix in matcher.keys]
+            found = matcher.match(url)
+            assert [bool(found >> i & 1) for i in range(len(matcher))] == expected, (url, matcher.keys)
+            assert hits[:, row].tolist() == expected, (url, matcher.keys)
+
+    matcher = PatternMatcher(['/blog/', '/tld/', '/b'], ['/'])
+    text = UrlText(['https://x.com/blog/tld/', 'https://x.com/tld', 'https://x.com/b'])
+    masks = [matcher.mask(['/tld/']), matcher.mask(['/b'], ['/'])]
+    assert matcher.first(text.match(matcher), masks).tolist() == [0, 2, 1]
+    narrow = PatternMatcher(['/tld/'], ['/'])
+    assert text.match(narrow).tolist() == [[True, False, False], [True, False, False]]
+    assert PatternMatcher.union(narrow, matcher).mask(['/blog/'], ['/'])
+    try:
+        matcher.mask(['/x'])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+def test_segment_matches_python():
+    assert url_path('https://www.namesilo.com/a/b?x=/c#d') == '/a/b'
+    assert url_path('https://www.namesilo.com') == '' and url_path('a/b#c://d/e') == 'a/b'
+    assert segment_starts('/a/b/') == [1, 3, 5] and segment_starts('a/b') == [0, 2]
+    rng = random.Random(7)
+    pieces = ['/', 'ab', 'b', 'x', '?', '#', ':', '//', 'https://h', 'A', '\u0130', '\n']
+    for trial in range(300):
+        matcher = PatternMatcher([rng.choice(['ab/', 'ab', 'b', 'x/b', 'a']) for _ in range(rng.randint(1, 4))],
+                                 [rng.choice(['ab', 'b', 'x']) for _ in range(rng.randint(0, 2))])
+        column = [''.join(rng.choice(pieces) for _ in range(rng.randint(0, 8))) for _ in range(20)]
+        if trial % 2:
+            column = [url.replace('\n', '') for url in column]
+        hits = UrlText(column).match_segments(matcher)
+        assert np.array_equal(UrlText(UrlColumn.from_strings(column)).match_segments(matcher), hits)
+        for row, url in enumerate(column):
+            path = url_path(url.lower())
+            starts = segment_starts(path)
+            expected = [path.endswith(p) and len(path) - len(p) in starts if suffix
+                        else any(path.startswith(p, start) for start in starts) for p, suffix in matcher.keys]
+            found = matcher.match_segments(url.lower())
+            assert [bool(found >> i & 1) for i in range(len(matcher))] == expected, (url, matcher.keys)
+            assert hits[:, row].tolist() == expected, (url, matcher.keys)
+
+if __name__ == "__main__":
+    test_fast_path_matches_reference()
+    test_common_shapes()
+    test_url_column()
+    test_url_dictionary_ids()
+    test_url_dictionary_hash_collision()
+    test_url_dictionary_matches_python_dict()
+    test_front_coded_store()
+    test_url_column_sort()
+    test_dictionary_to_front_coded()
+    test_url_text_matches_python()
+    test_pattern_matcher_matches_python()
+    test_segment_matches_python()
+    print("URL normalizer tests passed!")
@@ -4,12 +4,26 @@ Simplified test script for the sitemap priority system
 """
 
 import csv
+import os
+import sys
 from collections import defaultdict
 from urllib.parse import urlparse
 from datetime import datetime
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 
+# The scoring model and cluster rules are shared with the CLI and the API (test/pyscripts)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test', 'pyscripts'))
+
+from sitemap_rules import compile_rules
+from sitemap_score import compile_model, load_model, with_rule
+
+# As in the API, /index.php gets no homepage boost
+SCORING_MODEL = compile_model(with_rule(load_model(), 'homepage', suffixes=['/', '/index.html']))
+
+# The first cluster whose rules match the URL's path, else misc (cluster_rules.json)
+CLUSTER_RULES = compile_rules()
+
 def normalize_url(url: str) -> str:
     """Normalize URL for deduplication."""
     try:
@@ -21,20 +35,33 @@ def normalize_url(url: str) -> str:
     except Exception:
         return url.lower().rstrip('/')
 
-def load_csv_data(file_path: str, expected_columns: list) -> list:
-    """Load data from CSV file."""
+SAMPLE_LIMIT = 20
+URL_ALIASES = ('url', 'page', 'link')
+
+def load_csv_data(file_path: str, expected_columns: list, diagnostics: dict = None) -> list:
+    """Load data from CSV file. Skipped and unparseable rows are counted in diagnostics, not printed."""
     data = []
+    if diagnostics is None:
+        diagnostics = {}
+    diagnostics.update(rows=0, missing_url=0, bad_values={}, encoding_errors=0, samples=[])
     try:
         print(f"Loading CSV from: {file_path}")
-        with open(file_path, newline='', encoding='utf-8') as csvfile:
+        with open(file_path, newline='', encoding='utf-8-sig', errors='replace') as csvfile:
             reader = csv.DictReader(csvfile)
             print(f"CSV headers: {reader.fieldnames}")
+            # Resolve the URL column once from the header, case-insensitively
+            by_key = {name.strip().lower(): name for name in reversed(reader.fieldnames or [])}
+            url_column = next((by_key[alias] for alias in URL_ALIASES if alias in by_key), None)
             
-            for row_num, row in enumerate(reader):
-                # Try different possible URL column names
-                url = row.get('url') or row.get('URL') or row.get('page') or row.get('Page') or row.get('link') or row.get('Link')
+            for row in reader:
+                diagnostics['rows'] += 1
+                if any('\ufffd' in value for value in row.values() if isinstance(value, str)):
+                    diagnostics['encoding_errors'] += 1
+                url = row.get(url_column) if url_column else None
                 if not url:
-                    print(f"Row {row_num + 1}: No URL found in columns {list(row.keys())}")
+                    diagnostics['missing_url'] += 1
+                    if len(diagnostics['samples']) < SAMPLE_LIMIT:
+                        diagnostics['samples'].append({'reason': 'missing_url', 'row': row})
                     continue
                 
                 entry = {'url': url.strip()}
@@ -44,12 +71,17 @@ def load_csv_data(file_path: str, expected_columns: list) -> list:
                             entry[col] = float(row[col])
                         except (ValueError, TypeError):
                             entry[col] = 0.0
+                            if row[col] and row[col].strip():
+                                diagnostics['bad_values'][col] = diagnostics['bad_values'].get(col, 0) + 1
+                                if len(diagnostics['samples']) < SAMPLE_LIMIT:
+                                    diagnostics['samples'].append({'reason': 'bad_value', 'column': col,
+                                                                   'url': entry['url'], 'value': row[col]})
                     else:
                         entry[col] = 0.0
                 data.append(entry)
-                
-                if row_num < 3:  # Print first 3 rows for debugging
-                    print(f"Row {row_num + 1}: {entry}")
+        
+        print(f"Read {diagnostics['rows']} rows: {diagnostics['missing_url']} without a URL, "
+              f"unparseable values {diagnostics['bad_values']}, {diagnostics['encoding_errors']} with encoding errors")
                     
     except Exception as e:
         print(f"Error loading CSV data: {e}")
@@ -58,87 +90,12 @@ def load_csv_data(file_path: str, expected_columns: list) -> list:
     return data
 
 def calculate_priority(url_entry: dict) -> float:
-    """Calculate priority score for a URL."""
-    priority = 0.0
-    
-    # GSC Performance Score (40% weight)
-    gsc_score = 0.0
-    clicks = url_entry.get('clicks', 0)
-    impressions = url_entry.get('impressions', 0)
-    ctr = url_entry.get('ctr', 0)
-    position = url_entry.get('position', 0)
-    
-    if impressions > 0:
-        click_rate = clicks / impressions
-        gsc_score += click_rate * 0.3
-    
-    gsc_score += min(ctr, 1.0) * 0.3
-    
-    if position > 0:
-        position_score = max(0, 1 - (position / 100))
-        gsc_score += position_score * 0.4
-    
-    # Page Explorer Score (40% weight)
-    pe_score = 0.0
-    importance = url_entry.get('importance', 0)
-    depth = url_entry.get('depth', 0)
-    internal_links = url_entry.get('internal_links', 0)
-    health = url_entry.get('health', 0)
-    
-    pe_score += min(importance / 100, 1.0) * 0.4
-    
-    if depth > 0:
-        depth_score = max(0, 1 - (depth / 10))
-        pe_score += depth_score * 0.2
-    
-    if internal_links > 0:
-        links_score = min(internal_links / 100, 1.0)
-        pe_score += links_score * 0.2
-    
-    pe_score += min(health / 100, 1.0) * 0.2
-    
-    # Business Logic Score (20% weight)
-    business_score = 0.0
-    url = url_entry.get('url', '').lower()
-    
-    if url.endswith('/') or url.endswith('/index.html'):
-        business_score += 0.5
-    
-    if '/tld/' in url or '/domains/' in url:
-        business_score += 0.3
-    
-    if '/blog/' in url:
-        business_score += 0.2
-    
-    if '/support/' in url:
-        business_score += 0.1
-    
-    if any(tool in url for tool in ['/whois', '/ssl-check', '/dns-check']):
-        business_score += 0.2
-    
-    business_score = min(business_score, 1.0)
-    
-    # Calculate final weighted priority
-    priority = (gsc_score * 0.4) + (pe_score * 0.4) + (business_score * 0.2)
-    
-    return max(0.1, min(1.0, priority))
+    """Calculate priority score for a URL (see SCORING_MODEL)."""
+    return SCORING_MODEL.score(url_entry)
 
 def assign_cluster(url: str) -> str:
-    """Assign a URL to a cluster."""
-    url_lower = url.lower()
-    
-    if '/blog/' in url_lower:
-        return 'blog'
-    elif '/support/' in url_lower or '/help/' in url_lower:
-        return 'support'
-    elif '/tld/' in url_lower or '/domains/' in url_lower:
-        return 'tlds'
-    elif any(tool in url_lower for tool in ['/whois', '/ssl-check', '/dns-check']):
-        return 'tools'
-    elif any(pattern in url_lower for pattern in ['/domain-', '/broker', '/marketplace']):
-        return 'seo'
-    else:
-        return 'misc'
+    """Assign a URL to a cluster (see CLUSTER_RULES)."""
+    return CLUSTER_RULES.assign(url)
 
 def test_system():
     """Test the sitemap system with sample data"""